@@ -4,6 +4,7 @@ from datetime import datetime
 from bson import ObjectId
 import re
 from app.api.v1.models.base import PyObjectId, BaseModelWithConfig
+from app.tasks.task_manager.filters import PathFilter
 
 class FolderBase(BaseModelWithConfig):
     """
@@ -18,6 +19,11 @@ class FolderBase(BaseModelWithConfig):
     remotePath: str = Field(..., min_length=1, max_length=100, description="目标路径")
     maxDepth: int = Field(default=10, description="最大深度")
     origin: str = Field(..., min_length=1, max_length=100, description="网盘")
+    watch: bool = Field(default=True, description="是否实时监听本地文件夹变化")
+    hashCheck: bool = Field(default=False, description="是否按哈希比较目标端文件, 仅内容不同时上传")
+    includes: List[str] = Field(default_factory=list, description="包含规则(glob), 设置后只同步匹配的文件")
+    excludes: List[str] = Field(default_factory=list, description="排除规则(glob), 匹配的文件和目录不同步")
+    priority: int = Field(default=0, description="上传优先级, 数值越大越先上传")
     uploadNum: int = Field(default=0, description="上传数量")
     status: int = Field(default=0, description="文件夹状态，0为未检测，1为检测中，2为监听中")
     created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
@@ -33,6 +39,11 @@ class FolderBase(BaseModelWithConfig):
         # 可以添加更多验证规则，例如不允许特殊字符等
         return value
 
+    @validator('includes', 'excludes')
+    def rules_must_compile(cls, value):
+        PathFilter(excludes=value)
+        return value
+
 class FolderCreate(FolderBase):
     """用于创建文件夹的请求体"""
     pass
@@ -46,6 +57,16 @@ class FolderUpdate(BaseModelWithConfig):
     remotePath: str = Field(..., min_length=1, max_length=100, description="目标路径")
     maxDepth: int = Field(default=10, description="最大深度")
     origin: str = Field(..., min_length=1, max_length=100, description="网盘")
+    watch: bool = Field(default=True, description="是否实时监听本地文件夹变化")
+    hashCheck: bool = Field(default=False, description="是否按哈希比较目标端文件, 仅内容不同时上传")
+    includes: List[str] = Field(default_factory=list, description="包含规则(glob), 设置后只同步匹配的文件")
+    excludes: List[str] = Field(default_factory=list, description="排除规则(glob), 匹配的文件和目录不同步")
+    priority: int = Field(default=0, description="上传优先级, 数值越大越先上传")
+
+    @validator('includes', 'excludes')
+    def rules_must_compile(cls, value):
+        PathFilter(excludes=value)
+        return value
 
 
 class Folder(FolderBase):
@@ -17,6 +17,9 @@ class OriginBase(BaseModelWithConfig):
     count: int = Field(default=-1, description="文件数量")
     bytes: int = Field(default=-1, description="文件大小")
     sizeless: int = Field(default=-1, description="文件大小")
+    maxTransfers: int = Field(default=0, ge=0, description="最大并发传输数, 0 为不限制")
+    maxTps: float = Field(default=0, ge=0, description="每秒最大请求数(rclone --tpslimit), 0 为不限制")
+    bwLimit: int = Field(default=0, ge=0, description="带宽上限(字节/秒), 在该网盘的传输间平分, 0 为不限制")
     created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
     updated_at: Optional[datetime] = Field(None, description="最后更新时间")
 
@@ -27,5 +30,11 @@ class OriginCreate(OriginBase):
 class OriginUpdate(OriginBase):
     pass
 
+class OriginLimits(BaseModelWithConfig):
+    """网盘的并发、请求频率和带宽限制"""
+    maxTransfers: int = Field(default=0, ge=0, description="最大并发传输数, 0 为不限制")
+    maxTps: float = Field(default=0, ge=0, description="每秒最大请求数(rclone --tpslimit), 0 为不限制")
+    bwLimit: int = Field(default=0, ge=0, description="带宽上限(字节/秒), 在该网盘的传输间平分, 0 为不限制")
+
 class Origin(OriginBase):
     pass
\ No newline at end of file
@@ -25,6 +25,16 @@ class TaskBase(BaseModelWithConfig):
     finishedAt: Optional[datetime] = Field(None, description="完成时间")
     duration: Optional[str] = Field(None, description="用时")
     fileSize: Optional[str] = Field(None, description="文件大小")
+    fileBytes: Optional[int] = Field(None, description="文件大小(字节)")
+    bytesDone: Optional[int] = Field(None, description="已传输字节数")
+    bytesTotal: Optional[int] = Field(None, description="需传输的总字节数")
+    speedBps: Optional[float] = Field(None, description="传输速度(字节/秒)")
+    etaSeconds: Optional[int] = Field(None, description="预计剩余时间(秒)")
+    transferMode: Optional[str] = Field(default='upload', description="传输方式, upload: 本地上传, server-side: 网盘间服务端复制, stream: 经本机中转复制")
+    attempts: Optional[int] = Field(None, description="已失败次数")
+    nextRetryAt: Optional[datetime] = Field(None, description="下次自动重试时间")
+    failureKind: Optional[str] = Field(None, description="最近一次失败的类型, transient: 临时错误, permanent: 永久错误")
+    lastError: Optional[str] = Field(None, description="最近一次失败的原因")
 
 class TaskCreate(TaskBase):
     pass
@@ -20,6 +20,11 @@ folder_fields = api.model('Folder', {
     'remotePath': fields.String(required=True, description='目标路径', min_length=1, max_length=100),
     'status': fields.Integer(required=True, description="文件夹状态，0为未检测，1为检测中，2为监听中"),
     'maxDepth': fields.Integer(required=True, description='最大深度'),
+    'watch': fields.Boolean(description='是否实时监听本地文件夹变化', default=True),
+    'hashCheck': fields.Boolean(description='是否按哈希比较目标端文件, 仅内容不同时上传', default=False),
+    'includes': fields.List(fields.String, description='包含规则(glob), 设置后只同步匹配的文件, 例如 *.jpg'),
+    'excludes': fields.List(fields.String, description='排除规则(glob), 匹配的文件和目录不同步, 例如 node_modules、/cache/'),
+    'priority': fields.Integer(description='上传优先级, 数值越大越先上传', default=0),
     'uploadNum': fields.Integer(required=True, description='上传数量'),
     'created_at': fields.DateTime(dt_format='iso8601', description='创建时间'),
     'updated_at': fields.DateTime(dt_format='iso8601', description='最后更新时间'),
@@ -34,6 +39,11 @@ folder_create_fields = api.model('FolderCreate', {
     'syncType': fields.String(required=True, description='同步类型', min_length=1, max_length=100),
     'remotePath': fields.String(description='目标路径 ', min_length=1, max_length=100),
     'maxDepth': fields.Integer(required=True, description='最大深度'),
+    'watch': fields.Boolean(description='是否实时监听本地文件夹变化', default=True),
+    'hashCheck': fields.Boolean(description='是否按哈希比较目标端文件, 仅内容不同时上传', default=False),
+    'includes': fields.List(fields.String, description='包含规则(glob), 设置后只同步匹配的文件, 例如 *.jpg'),
+    'excludes': fields.List(fields.String, description='排除规则(glob), 匹配的文件和目录不同步, 例如 node_modules、/cache/'),
+    'priority': fields.Integer(description='上传优先级, 数值越大越先上传', default=0),
 })
 
 folder_update_fields = api.model('FolderUpdate', {
@@ -44,6 +54,11 @@ folder_update_fields = api.model('FolderUpdate', {
     'syncType': fields.String(required=True, description='同步类型', min_length=1, max_length=100),
     'remotePath': fields.String(description='目标路径 ', min_length=1, max_length=100),
     'maxDepth': fields.Integer(required=True, description='最大深度'),
+    'watch': fields.Boolean(description='是否实时监听本地文件夹变化', default=True),
+    'hashCheck': fields.Boolean(description='是否按哈希比较目标端文件, 仅内容不同时上传', default=False),
+    'includes': fields.List(fields.String, description='包含规则(glob), 设置后只同步匹配的文件, 例如 *.jpg'),
+    'excludes': fields.List(fields.String, description='排除规则(glob), 匹配的文件和目录不同步, 例如 node_modules、/cache/'),
+    'priority': fields.Integer(description='上传优先级, 数值越大越先上传', default=0),
 })
 
 # --- 请求参数解析器 --- 
@@ -8,4 +8,20 @@ info_service = InfoService()
 class RcloneResource(Resource):
     @api.response(200, '获取成功')
     def get(self):
-        return info_service.get_info()
\ No newline at end of file
+        return info_service.get_info()
+
+
+@api.route('/workers')
+class WorkerPoolResource(Resource):
+    @api.response(200, '获取成功')
+    def get(self):
+        """上传并发数及自动伸缩记录"""
+        return info_service.get_worker_pool()
+
+
+@api.route('/db-pool')
+class DbPoolResource(Resource):
+    @api.response(200, '获取成功')
+    def get(self):
+        """数据库连接池使用情况"""
+        return info_service.get_db_pool()
@@ -1,7 +1,7 @@
 from flask_restx import Namespace, Resource, fields, reqparse
 from flask import request, abort
 from app.api.v1.services.origin_service import OriginService
-from app.api.v1.models.origin import OriginCreate, OriginUpdate
+from app.api.v1.models.origin import OriginCreate, OriginUpdate, OriginLimits
 from pydantic import ValidationError
 
 api = Namespace('origins', description='云盘操作')
@@ -15,10 +15,19 @@ origin_fields = api.model('Origin', {
     'count': fields.Integer(description='文件数量'),
     'bytes': fields.Integer(description='文件大小'),
     'sizeless': fields.Integer(description='文件大小'),
+    'maxTransfers': fields.Integer(description='最大并发传输数, 0 为不限制', default=0),
+    'maxTps': fields.Float(description='每秒最大请求数(rclone --tpslimit), 按 maxTransfers(未设置时为 UPLOAD_WORKERS_MAX)平分给各传输, 0 为不限制', default=0),
+    'bwLimit': fields.Integer(description='带宽上限(字节/秒), 在该网盘的传输间平分, 0 为不限制', default=0),
     'created_at': fields.DateTime(dt_format='iso8601', description='创建时间'),
     'updated_at': fields.DateTime(dt_format='iso8601', description='最后更新时间')
 })
 
+origin_limits_fields = api.model('OriginLimits', {
+    'maxTransfers': fields.Integer(description='最大并发传输数, 0 为不限制', default=0),
+    'maxTps': fields.Float(description='每秒最大请求数(rclone --tpslimit), 按 maxTransfers(未设置时为 UPLOAD_WORKERS_MAX)平分给各传输, 0 为不限制', default=0),
+    'bwLimit': fields.Integer(description='带宽上限(字节/秒), 在该网盘的传输间平分, 0 为不限制', default=0),
+})
+
 # --- 请求参数解析器 ---
 list_origins_parser = reqparse.RequestParser()
 list_origins_parser.add_argument('page', type=int, required=False, default=1, help='页码setDefault(1)')
@@ -76,4 +85,22 @@ class OriginsRefresh(Resource):
     @api.marshal_list_with(origin_fields)
     def get(self):
         """刷新云盘列表"""
-        return origin_service.refresh_origins(), 200
\ No newline at end of file
+        return origin_service.refresh_origins(), 200
+
+
+@api.route('/<string:origin_id>/limits')
+class OriginLimitsResource(Resource):
+    @api.doc('设置网盘限制')
+    @api.expect(origin_limits_fields, validate=True)
+    @api.marshal_with(origin_fields)
+    def put(self, origin_id):
+        """设置网盘的最大并发传输数、每秒请求数和带宽上限, 上传进程在下次刷新设置后生效"""
+        try:
+            limits = OriginLimits(**(request.json or {}))
+        except ValidationError as e:
+            abort(400, f"请求数据校验失败: {e}")
+        origin = origin_service.update_limits(origin_id, limits)
+        if not origin:
+            abort(404, "云盘未找到")
+        origin['id'] = origin.pop('_id')
+        return origin
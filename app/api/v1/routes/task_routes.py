@@ -28,7 +28,26 @@ task_model = api.model('Task', {
     'startedAt': fields.DateTime(dt_format='iso8601', description='开始时间'),
     'finishedAt': fields.DateTime(dt_format='iso8601', description='完成时间'),
     'duration': fields.String(description='任务时长'),
-    'fileSize': fields.String(description='文件大小')
+    'fileSize': fields.String(description='文件大小'),
+    'fileBytes': fields.Integer(description='文件大小(字节)'),
+    'bytesDone': fields.Integer(description='已传输字节数'),
+    'bytesTotal': fields.Integer(description='需传输的总字节数'),
+    'speedBps': fields.Float(description='传输速度(字节/秒)'),
+    'etaSeconds': fields.Integer(description='预计剩余时间(秒)'),
+    'transferMode': fields.String(description='传输方式'),
+    'attempts': fields.Integer(description='已失败次数'),
+    'nextRetryAt': fields.DateTime(dt_format='iso8601', description='下次自动重试时间'),
+    'failureKind': fields.String(description='最近一次失败的类型'),
+    'lastError': fields.String(description='最近一次失败的原因'),
+})
+
+# 列表不返回日志, 日志通过 /tasks/<task_id>/logs 读取
+task_list_item_model = api.model('TaskListItem', {key: value for key, value in task_model.items() if key != 'logs'})
+
+task_logs_model = api.model('TaskLogs', {
+    'total': fields.Integer(description='保留的日志总行数'),
+    'offset': fields.Integer(description='返回的第一行在全部日志中的位置'),
+    'lines': fields.List(fields.String, description='日志行'),
 })
 
 task_create_model = api.model('TaskCreate', {
@@ -56,9 +75,15 @@ list_tasks_parser = reqparse.RequestParser()
 list_tasks_parser.add_argument('page', type=int, required=False, default=1, help='页码，默认为1')
 list_tasks_parser.add_argument('per_page', type=int, required=False, default=10, help='每页数量，默认为10，最大100')
 list_tasks_parser.add_argument('query', type=str, required=False, default='{}', help='筛选条件')
+list_tasks_parser.add_argument('sort', type=str, required=False, default='-created_at', help='排序字段, 逗号分隔, - 表示倒序, 例如 -speedBps,etaSeconds')
+
+task_logs_parser = reqparse.RequestParser()
+task_logs_parser.add_argument('tail', type=int, required=False, help='只返回最后 tail 行')
+task_logs_parser.add_argument('offset', type=int, required=False, default=0, help='起始行, 未指定 tail 时生效')
+task_logs_parser.add_argument('limit', type=int, required=False, default=200, help='返回行数, 最大1000')
 
 pagination_model = api.model('PaginatedItemResponse', {
-    'items': fields.List(fields.Nested(task_model)),
+    'items': fields.List(fields.Nested(task_list_item_model)),
     'page': fields.Integer(description='当前页码'),
     'per_page': fields.Integer(description='每页数量'),
     'total_items': fields.Integer(description='总物品数'),
@@ -90,7 +115,8 @@ class TaskList(Resource):
             per_page = 10
         elif per_page > 100:
             per_page = 100
-        items = task_service.query_page(query=query, sort='-created_at', page=page, per_page=per_page)
+        sort = args.get('sort') or '-created_at'
+        items = task_service.query_page(query=query, sort=sort, page=page, per_page=per_page)
         total_items = task_service.count_items(query=query)
         total_pages = (total_items + per_page - 1) // per_page
         return {
@@ -182,4 +208,23 @@ class TaskResource(Resource):
             abort(400, str(e))
         except Exception as e:
             # log.error(f"Error deleting folder {folder_id}: {e}")
-            abort(500, "删除文件夹时发生内部错误")
\ No newline at end of file
+            abort(500, "删除文件夹时发生内部错误")
+
+
+@api.route('/<string:task_id>/logs')
+class TaskLogs(Resource):
+    @api.doc('获取任务日志')
+    @api.expect(task_logs_parser)
+    @api.marshal_with(task_logs_model)
+    def get(self, task_id):
+        """按行读取任务日志, 支持 tail 或 offset/limit 范围"""
+        args = task_logs_parser.parse_args()
+        tail = args.get('tail')
+        offset = max(args.get('offset') or 0, 0)
+        limit = min(max(args.get('limit') or 200, 1), 1000)
+        if tail is not None:
+            tail = min(max(tail, 1), 1000)
+        logs = task_service.get_logs(task_id, tail=tail, offset=offset, limit=limit)
+        if logs is None:
+            abort(404, "任务未找到")
+        return logs
@@ -9,7 +9,7 @@ class BaseServices:
     def collection(self):
         return get_db()[self.collection_name]
 
-    def query_page(self, query=None, sort: str = '-created_at', page: int = 1, per_page: int = 10):
+    def query_page(self, query=None, sort: str = '-created_at', page: int = 1, per_page: int = 10, projection=None):
         """
         分页查询
         """
@@ -24,7 +24,7 @@ class BaseServices:
                 sort_list.append((field[1:], -1))
             else:
                 sort_list.append((field, 1))
-        items_cursor = self.collection.find(query).sort(sort_list).skip(skip).limit(per_page)
+        items_cursor = self.collection.find(query, projection).sort(sort_list).skip(skip).limit(per_page)
         items_list = []
         for item in items_cursor:
             item['_id'] = str(item['_id'])
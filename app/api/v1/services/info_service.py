@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 
-from app.utils.db import get_db
+from app.utils.db import get_db, pool_metrics
 
 class InfoService:
     @property
@@ -17,6 +17,10 @@ class InfoService:
     def log_collection(self):
         return get_db()['log']
 
+    @property
+    def pool_collection(self):
+        return get_db()['worker_pool']
+
     def get_week_analysis(self):
         # 获取当前时间并规范化到当日零点
         today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -127,4 +131,24 @@ class InfoService:
             'logs': logs_list,
             'final_result': self.get_week_analysis(),
         }
-        return result
\ No newline at end of file
+        return result
+
+    def get_db_pool(self):
+        """
+        数据库连接池使用情况: api 为处理本次请求的 API 进程, nodes 为各节点后台任务进程最近一次采样
+        """
+        return {
+            'api': pool_metrics.snapshot(),
+            'nodes': [
+                {'node': item['_id'], 'updatedAt': item.get('updatedAt'), **item['mongoPool']}
+                for item in self.pool_collection.find({'mongoPool': {'$exists': True}}, {'mongoPool': 1, 'updatedAt': 1}).sort([('_id', 1)])
+            ],
+        }
+
+    def get_worker_pool(self):
+        """各节点上传并发数、采样结果和最近的调整记录"""
+        result = []
+        for item in self.pool_collection.find({}).sort([('_id', 1)]):
+            item['node'] = item.pop('_id')
+            result.append(item)
+        return result
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from datetime import datetime
 
+from bson import ObjectId
+
 from app.api.v1.models.origin import Origin
 from app.api.v1.services.base_services import BaseServices
 from app.tasks.task_manager.rclone_operator import get_rclone_origin_list
@@ -25,4 +27,17 @@ class OriginService(BaseServices):
                 },
                 upsert=True
             )
-        return self.get_all_items()
\ No newline at end of file
+        return self.get_all_items()
+
+    def update_limits(self, origin_id, limits):
+        """更新网盘限制, refresh_origins 只更新 rclone 返回的字段, 不会覆盖这些设置"""
+        try:
+            result = self.collection.update_one(
+                {'_id': ObjectId(origin_id)},
+                {'$set': {**limits.model_dump(), 'updated_at': datetime.now()}}
+            )
+        except Exception:
+            return None
+        if not result.matched_count:
+            return None
+        return self.get_item_by_id(origin_id)
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+from bson import ObjectId
+
 from app.api.v1.models.task import Task
 from app.api.v1.services.base_services import BaseServices
+from app.tasks.task_manager.dispatch import notify_new_tasks
+from app.tasks.task_manager.log_sink import LOG_COLLECTION, read_task_logs
+from app.utils.db import get_db
 
 
 class TaskService(BaseServices):
@@ -13,3 +18,53 @@ class TaskService(BaseServices):
         if not task_data:
             return None
         return Task(**task_data)
+
+    def create_item(self, item_data, other_data=None):
+        """
+        新任务写入后通知同一进程内的分发器
+        分发器运行在 gunicorn 主进程中, 需要 MongoDB 副本集的 change stream 才能立即得知; 单机部署时由兜底轮询分发
+        """
+        created_item = super().create_item(item_data, other_data)
+        if created_item and created_item.get('status') == 0:
+            notify_new_tasks()
+        return created_item
+
+    def update_item(self, item_id, item_data, other_data=None):
+        if getattr(item_data, 'status', None) == 0 and 'status' in item_data.model_fields_set:
+            # 手动重新排队的任务立即执行, 并重新计算自动重试次数
+            other_data = {**(other_data or {}), 'attempts': 0, 'nextRetryAt': None}
+        updated_item = super().update_item(item_id, item_data, other_data)
+        if updated_item and updated_item.get('status') == 0:
+            notify_new_tasks()
+        return updated_item
+
+    def query_page(self, query=None, sort: str = '-created_at', page: int = 1, per_page: int = 10, projection=None):
+        """任务列表不返回日志, 日志通过 get_logs 单独读取"""
+        return super().query_page(query, sort, page, per_page, projection or {'logs': 0})
+
+    def get_logs(self, task_id, tail=None, offset=0, limit=None):
+        """
+        读取任务日志: 旧任务文档中的 logs 字段在前, task_logs 中保留的日志在后
+        :return: {'total', 'offset', 'lines'}, 任务不存在时返回 None
+        """
+        try:
+            obj_id = ObjectId(task_id)
+        except Exception:
+            return None
+        task = self.collection.find_one({'_id': obj_id}, {'logs': 1})
+        if task is None:
+            return None
+        legacy = [line for line in (task.get('logs') or '').splitlines() if line.strip()]
+        total, lines = read_task_logs(get_db()[LOG_COLLECTION], obj_id)
+        lines = legacy + lines
+        total += len(legacy)
+        if tail:
+            offset = max(total - tail, 0)
+        end = None if limit is None or tail else offset + limit
+        return {'total': total, 'offset': offset, 'lines': lines[offset:end]}
+
+    def delete_item(self, item_id):
+        result = super().delete_item(item_id)
+        if result:
+            get_db()[LOG_COLLECTION].delete_many({'taskId': ObjectId(item_id)})
+        return result
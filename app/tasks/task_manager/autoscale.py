@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from app.utils.env import get_env_int
+
+POOL_COLLECTION = 'worker_pool'
+# 上传并发数的上下限, 相等时不自动伸缩
+_min_workers = get_env_int('UPLOAD_WORKERS_MIN', 2)
+_max_workers = max(get_env_int('UPLOAD_WORKERS_MAX', 8), _min_workers)
+# 每隔多少秒采样一次并决定是否调整并发数
+_scale_interval = get_env_int('AUTOSCALE_INTERVAL', 30)
+# 增加并发后总吞吐至少提升多少(百分比)才继续增加, 否则视为已饱和并撤回
+_min_gain_percent = get_env_int('AUTOSCALE_MIN_GAIN_PERCENT', 10)
+# 采样周期内失败任务占比超过该值(百分比)时减少并发
+_max_error_percent = get_env_int('AUTOSCALE_MAX_ERROR_PERCENT', 20)
+# 饱和或出错减少并发后, 等待多少个采样周期再尝试增加
+_cooldown = get_env_int('AUTOSCALE_COOLDOWN', 3)
+# 保留的最近调整记录数
+_max_decisions = 20
+
+
+class WorkerAutoscaler:
+    """
+    根据采样结果调整上传并发数(爬山法)
+
+    有排队任务且所有并发都在传输时增加一个并发, 下一个周期比较总吞吐:
+    提升不足 min_gain_percent 说明带宽或网盘限速已饱和, 撤回这个并发并冷却 cooldown 个周期。
+    失败率过高或队列为空且有空闲并发时逐个减少并发, 始终保持在 [min_workers, max_workers] 之间。
+    """
+
+    def __init__(self, min_workers=None, max_workers=None, min_gain_percent=None, max_error_percent=None, cooldown=None):
+        self.interval = _scale_interval
+        self.min_workers = _min_workers if min_workers is None else min_workers
+        self.max_workers = max(_max_workers if max_workers is None else max_workers, self.min_workers)
+        self.min_gain = (_min_gain_percent if min_gain_percent is None else min_gain_percent) / 100
+        self.max_error_rate = (_max_error_percent if max_error_percent is None else max_error_percent) / 100
+        self.cooldown = _cooldown if cooldown is None else cooldown
+        # 上一次增加并发前的总吞吐, 未处于试探中时为 None
+        self.baseline = None
+        self.hold = 0
+
+    def decide(self, sample):
+        """
+        :param sample: {'workers', 'busy', 'queueDepth', 'bytesPerSec', 'finished', 'failed'}
+        :return: (目标并发数, 原因), 不调整时原因为 None
+        """
+        workers = sample['workers']
+        if workers < self.min_workers:
+            return self.min_workers, '低于最小线程数'
+        if workers > self.max_workers:
+            return self.max_workers, '超过最大线程数'
+
+        probing, self.baseline = self.baseline, None
+        finished = sample.get('finished') or 0
+        if finished and (sample.get('failed') or 0) / finished > self.max_error_rate:
+            self.hold = self.cooldown
+            if workers > self.min_workers:
+                return workers - 1, '失败率过高'
+            return workers, None
+        if not sample['queueDepth'] and sample['busy'] < workers:
+            if workers > self.min_workers:
+                return workers - 1, '队列为空'
+            return workers, None
+        if probing is not None and sample['bytesPerSec'] < probing * (1 + self.min_gain):
+            self.hold = self.cooldown
+            return workers - 1, '吞吐不再提升'
+        if self.hold:
+            self.hold -= 1
+            return workers, None
+        if sample['queueDepth'] and sample['busy'] >= workers and workers < self.max_workers:
+            self.baseline = sample['bytesPerSec']
+            return workers + 1, '有排队任务且线程全部忙碌'
+        return workers, None
+
+
+def get_max_workers():
+    """本节点同时执行的传输数上限"""
+    return _max_workers
+
+
+def save_pool_state(collection, node, sample, target, reason):
+    """记录上传并发的当前状态和最近的调整, 供接口查询"""
+    now = datetime.now()
+    update = {'$set': {
+        **sample,
+        'target': target,
+        'perWorkerBps': int(sample['bytesPerSec'] / sample['busy']) if sample['busy'] else 0,
+        'minWorkers': _min_workers,
+        'maxWorkers': _max_workers,
+        'updatedAt': now,
+    }}
+    if reason:
+        update['$push'] = {'decisions': {
+            '$each': [{'at': now, 'from': sample['workers'], 'to': target, 'reason': reason, 'bytesPerSec': sample['bytesPerSec']}],
+            '$slice': -_max_decisions,
+        }}
+    collection.update_one({'_id': node}, update, upsert=True)
@@ -0,0 +1,76 @@
+import posixpath
+
+from app.utils.env import get_env_int
+
+# 每个批量任务最多包含的文件数, 小于等于 1 时不合并
+_batch_max_files = get_env_int('BATCH_MAX_FILES', 200)
+# 每个批量任务最多包含的字节数, 超过该大小的文件单独上传以保留逐个文件的进度
+_batch_max_bytes = get_env_int('BATCH_MAX_BYTES', 1 << 30)
+# 批量任务中 rclone 的并发传输数
+_batch_transfers = get_env_int('BATCH_TRANSFERS', 4)
+
+
+def split_batch_root(local_path, remote_path):
+    """
+    去掉源目录和目标目录末尾相同的部分, 得到 (源根目录, 目标根目录, 文件相对路径)
+    源根目录和目标根目录相同的任务可以合并为一次 rclone copy --files-from
+
+    例如 /data/photos/2024/a.jpg -> backup/photos/2024 得到 ('/data', 'backup', 'photos/2024/a.jpg')
+    """
+    prefix = ''
+    if not local_path.startswith('/') and ':' in local_path:
+        # 远程来源, 例如 aliyun:photos/2024/a.jpg
+        prefix, local_path = local_path.split(':', 1)
+        prefix += ':'
+    src_dir, name = posixpath.split(local_path)
+    src_parts = src_dir.split('/') if src_dir else []
+    remote_path = remote_path.strip('/')
+    dst_parts = remote_path.split('/') if remote_path else []
+    rel_parts = [name]
+    # 绝对路径保留开头的空字符串, 使根目录为 /
+    keep = 1 if local_path.startswith('/') else 0
+    while len(src_parts) > keep and dst_parts and src_parts[-1] == dst_parts[-1]:
+        rel_parts.insert(0, src_parts.pop())
+        dst_parts.pop()
+    src_root = prefix + ('/'.join(src_parts) or ('/' if keep else ''))
+    return src_root, '/'.join(dst_parts), '/'.join(rel_parts)
+
+
+def group_tasks(tasks, max_files=None, max_bytes=None):
+    """
+    把待上传任务按 (网盘, 传输方式, 源根目录, 目标根目录) 分组
+    产出单个任务 ID(字符串), 或批量任务 {'task_ids', 'files', 'origin', 'src_root', 'dst_root', 'transferMode'}
+    """
+    max_files = _batch_max_files if max_files is None else max_files
+    max_bytes = _batch_max_bytes if max_bytes is None else max_bytes
+    groups = {}
+
+    def flush(key):
+        group = groups.pop(key)
+        if len(group['task_ids']) == 1:
+            return group['task_ids'][0]
+        return group
+
+    for task in tasks:
+        task_id = str(task['_id'])
+        size = task.get('fileBytes') or 0
+        if max_files <= 1 or size > max_bytes:
+            yield task_id
+            continue
+        src_root, dst_root, rel_path = split_batch_root(task['localPath'], task['remotePath'])
+        key = (task['origin'], task.get('transferMode'), src_root, dst_root)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                'task_ids': [], 'files': [], 'bytes': 0,
+                'origin': task['origin'], 'transferMode': task.get('transferMode'),
+                'src_root': src_root, 'dst_root': dst_root, 'transfers': _batch_transfers,
+            }
+        elif len(group['task_ids']) >= max_files or group['bytes'] + size > max_bytes:
+            yield flush(key)
+            groups[key] = group = {**group, 'task_ids': [], 'files': [], 'bytes': 0}
+        group['task_ids'].append(task_id)
+        group['files'].append(rel_path)
+        group['bytes'] += size
+    for key in list(groups):
+        yield flush(key)
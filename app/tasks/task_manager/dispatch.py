@@ -0,0 +1,133 @@
+import threading
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.utils.env import get_env_int
+
+# 兜底轮询待上传任务的间隔(秒), 正常情况下新任务通过通知立即分发
+_dispatch_poll_seconds = get_env_int('DISPATCH_POLL_SECONDS', 60)
+# 收到通知后等待多少毫秒再分发, 合并扫描时连续写入产生的通知
+_dispatch_debounce_ms = get_env_int('DISPATCH_DEBOUNCE_MS', 200)
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def subscribe(listener):
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def unsubscribe(listener):
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def notify_new_tasks(delay=0):
+    """
+    有任务被置为待上传(status 0)时调用, 同一进程内的分发器立即被唤醒
+    :param delay: 等待重试的任务在 delay 秒后到期, 届时再唤醒
+    """
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        listener(delay)
+
+
+class DispatchTrigger:
+    """
+    在事件循环中触发分发, 可从任意线程调用 wake
+
+    收到通知后等待 debounce 再分发一次, 期间的通知合并为一次
+    """
+
+    def __init__(self, loop, dispatch):
+        self.loop = loop
+        self.dispatch = dispatch
+        self.poll_seconds = _dispatch_poll_seconds
+        self.debounce = _dispatch_debounce_ms / 1000
+        self.scheduled = False
+        # 延迟唤醒按秒合并: 到期的秒 -> 定时器
+        self.delayed = {}
+
+    def wake(self, delay=0):
+        if delay > 0:
+            self.loop.call_soon_threadsafe(self._schedule_later, delay)
+        else:
+            self.loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule_later(self, delay):
+        """同一秒内到期的多个延迟唤醒只保留一个定时器, 不为每个任务单独计时"""
+        due = int(self.loop.time() + delay) + 1
+        if due not in self.delayed:
+            self.delayed[due] = self.loop.call_at(due, self._fire_delayed, due)
+
+    def _fire_delayed(self, due):
+        self.delayed.pop(due, None)
+        self._schedule()
+
+    def _schedule(self):
+        if not self.scheduled:
+            self.scheduled = True
+            self.loop.call_later(self.debounce, self._fire)
+
+    def _fire(self):
+        self.scheduled = False
+        self.dispatch()
+
+
+# 待上传任务的插入和更新, 用于 change stream 过滤
+PENDING_TASK_PIPELINE = [{'$match': {'$or': [
+    {'operationType': {'$in': ['insert', 'replace']}, 'fullDocument.status': 0},
+    {'operationType': 'update', 'updateDescription.updatedFields.status': 0},
+]}}]
+
+
+class TaskChangeWatcher:
+    """
+    通过 MongoDB change stream 监听其他进程(例如 API)写入的待上传任务
+
+    只有副本集或分片集群支持 change stream(docker-compose.yml 中以单节点副本集运行),
+    单机部署时自动停用, API 写入的任务由兜底轮询分发, 最多延迟 DISPATCH_POLL_SECONDS
+    """
+
+    def __init__(self, collection, on_change, retry_seconds=5):
+        self.collection = collection
+        self.on_change = on_change
+        self.retry_seconds = retry_seconds
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True, name='task-change-watcher')
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        resume_token = None
+        while not self.stopped.is_set():
+            try:
+                with self.collection.watch(PENDING_TASK_PIPELINE, resume_after=resume_token, max_await_time_ms=1000) as stream:
+                    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 已开启任务 change stream 监听")
+                    # 补上开启监听之前写入的任务
+                    self.on_change()
+                    while not self.stopped.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if change is not None:
+                            self.on_change()
+                        resume_token = stream.resume_token
+            except OperationFailure as e:
+                if resume_token is not None and e.code == 286:
+                    # 恢复点已过期, 从当前位置重新监听并补一次分发
+                    resume_token = None
+                    self.on_change()
+                    continue
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 数据库不支持 change stream, 改为每 {_dispatch_poll_seconds}s 轮询: {str(e)}")
+                return
+            except PyMongoError as e:
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 任务 change stream 中断, {self.retry_seconds}s 后重试: {str(e)}")
+                self.stopped.wait(self.retry_seconds)
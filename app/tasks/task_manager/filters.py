@@ -0,0 +1,172 @@
+import re
+from functools import lru_cache
+
+
+def translate_glob(pattern):
+    """
+    把 glob 转换为正则表达式(与 rclone 过滤规则一致)
+
+    - ``*`` / ``?`` 不跨目录, ``**`` 可跨目录, ``**/`` 可匹配零层或多层目录
+    - 支持 ``[...]`` 字符集(``[!...]`` 取反)和 ``{a,b}`` 多选
+    """
+    parts = []
+    braces = 0
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            parts.append('[^/]*')
+        elif c == '?':
+            parts.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                raise ValueError(f'规则 {pattern} 中的 [ 未闭合')
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            parts.append('[' + body.replace('\\', '\\\\') + ']')
+            i = end + 1
+            continue
+        elif c == '{':
+            braces += 1
+            parts.append('(?:')
+        elif c == '}' and braces:
+            braces -= 1
+            parts.append(')')
+        elif c == ',' and braces:
+            parts.append('|')
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    if braces:
+        raise ValueError(f'规则 {pattern} 中的 {{ 未闭合')
+    return ''.join(parts)
+
+
+def parse_rule(pattern):
+    """
+    解析单条规则, 返回 (相对根目录匹配的正则, 是否只匹配目录)
+
+    - 不含 ``/`` 的规则匹配任意层级的文件名/目录名, 例如 ``*.tmp``、``node_modules``
+    - 含 ``/`` 的规则从文件夹根目录开始匹配, 开头的 ``/`` 可省略, 例如 ``/cache/*.bin``
+    - 以 ``/`` 或 ``/**`` 结尾的规则只匹配目录, 整个目录会被跳过
+    """
+    pattern = pattern.strip()
+    dir_only = False
+    if pattern.endswith('/**'):
+        pattern, dir_only = pattern[:-3], True
+    elif pattern.endswith('/'):
+        pattern, dir_only = pattern[:-1], True
+    if not pattern:
+        raise ValueError('规则不能为空')
+    if '/' in pattern:
+        regex = translate_glob(pattern.lstrip('/'))
+    else:
+        regex = '(?:.*/)?' + translate_glob(pattern)
+    return regex, dir_only
+
+
+def compile_rules(regexes):
+    return re.compile('|'.join(f'(?:{regex})' for regex in regexes)) if regexes else None
+
+
+class PathFilter:
+    """
+    文件夹的包含/排除规则, 编译为两个正则后对相对路径做一次匹配
+
+    - 排除规则优先; 匹配排除规则的目录在遍历时直接剪枝, 其下文件也一并排除
+    - 设置了包含规则时, 文件必须匹配至少一条包含规则; 包含规则不影响目录遍历
+    - 本地文件始终跳过隐藏文件(以 ``.`` 开头)和 ``~`` 结尾的备份文件
+    """
+
+    def __init__(self, includes=(), excludes=()):
+        self.includes = tuple(rule for rule in includes if rule and rule.strip())
+        self.excludes = tuple(rule for rule in excludes if rule and rule.strip())
+        try:
+            excluded = [parse_rule(rule) for rule in self.excludes]
+            self.dir_regex = compile_rules([regex for regex, _ in excluded])
+            # 被排除目录下的所有文件同样被排除
+            self.exclude_regex = compile_rules(
+                [regex for regex, dir_only in excluded if not dir_only] + [f'{regex}/.*' for regex, _ in excluded]
+            )
+            self.include_regex = compile_rules([
+                f'{regex}/.*' if dir_only else regex
+                for regex, dir_only in map(parse_rule, self.includes)
+            ])
+        except re.error as e:
+            raise ValueError(f'过滤规则无效: {str(e)}')
+
+    @classmethod
+    def from_folder(cls, folder):
+        return get_path_filter(tuple(folder.get('includes') or ()), tuple(folder.get('excludes') or ()))
+
+    @property
+    def signature(self):
+        """规则变化时签名随之变化, 用于使扫描清单失效; 没有规则时为 None"""
+        if not self.includes and not self.excludes:
+            return None
+        return [list(self.includes), list(self.excludes)]
+
+    @staticmethod
+    def is_visible_file(name):
+        """是否为非隐藏文件"""
+        return not name.startswith('.') and not name.endswith('~')
+
+    def match_dir(self, rel_dir):
+        """目录是否需要遍历"""
+        return not (self.dir_regex and self.dir_regex.fullmatch(rel_dir.replace('\\', '/')))
+
+    def match_file(self, rel_path, hidden=False):
+        """
+        文件是否需要同步
+        :param hidden: 是否保留隐藏文件, 远程文件夹不做隐藏文件过滤
+        """
+        rel_path = rel_path.replace('\\', '/')
+        if not hidden and not self.is_visible_file(rel_path.rsplit('/', 1)[-1]):
+            return False
+        if self.exclude_regex and self.exclude_regex.fullmatch(rel_path):
+            return False
+        return not self.include_regex or bool(self.include_regex.fullmatch(rel_path))
+
+    def rclone_flags(self):
+        """
+        转换为 rclone --filter 参数, 远程文件夹在服务端过滤并跳过被排除的目录
+        > rclone lsjson aliyun:photos --filter "- node_modules/**" --filter "+ *.jpg" --filter "- **"
+        """
+        flags = []
+        for rule in self.excludes:
+            for rclone_rule in self.to_rclone_rules(rule.strip(), include=False):
+                flags += ['--filter', f'- {rclone_rule}']
+        for rule in self.includes:
+            for rclone_rule in self.to_rclone_rules(rule.strip(), include=True):
+                flags += ['--filter', f'+ {rclone_rule}']
+        if self.includes:
+            flags += ['--filter', '- **']
+        return flags
+
+    @staticmethod
+    def to_rclone_rules(rule, include):
+        dir_only = rule.endswith('/') or rule.endswith('/**')
+        rule = rule[:-3] if rule.endswith('/**') else rule.rstrip('/')
+        # rclone 中含 / 的规则匹配路径末尾, 需要加上 / 前缀才从根目录开始匹配
+        if '/' in rule and not rule.startswith('/'):
+            rule = '/' + rule
+        if dir_only:
+            return [f'{rule}/**']
+        # 不限定为目录的排除规则同时排除同名目录
+        return [rule] if include else [rule, f'{rule}/**']
+
+
+@lru_cache(maxsize=256)
+def get_path_filter(includes, excludes):
+    """相同规则只编译一次"""
+    return PathFilter(includes, excludes)
@@ -0,0 +1,144 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from pymongo import UpdateOne
+
+from app.utils.env import get_env_int
+
+# 计算本地文件哈希的进程数
+_hash_workers = get_env_int('HASH_WORKERS', os.cpu_count() or 2)
+# 本地支持计算的哈希类型(rclone 中的名称), 按优先级排列
+SUPPORTED_HASHES = ['md5', 'sha1', 'quickxor']
+READ_SIZE = 1 << 20
+
+
+class QuickXorHash:
+    """
+    OneDrive 使用的 QuickXorHash
+
+    每个字节按其在文件中的位置 k 循环左移 (k * 11) % 160 位后异或进 160 位状态,
+    最后把文件长度(小端 8 字节)异或到结果的末 8 个字节。
+    位置模 160 相同的字节移位相同, 先把数据按 160 字节一行折叠异或, 再做 160 次移位。
+    """
+    WIDTH = 160
+    SHIFT = 11
+    MASK = (1 << WIDTH) - 1
+    ROW_BYTES = WIDTH  # 每行 160 字节, 对应 160 种不同的移位
+
+    def __init__(self):
+        self.state = 0
+        self.length = 0
+
+    def update(self, data):
+        if not data:
+            return
+        row = self.ROW_BYTES
+        start = self.length % row
+        padding = (row - (start + len(data)) % row) % row
+        buffer = bytes(start) + bytes(data) + bytes(padding)
+        rows = len(buffer) // row
+        row_bits = row * 8
+        value = int.from_bytes(buffer, 'little')
+        folded = 0
+        while rows > 1:
+            if rows % 2:
+                rows -= 1
+                folded ^= value >> (rows * row_bits)
+                value &= (1 << (rows * row_bits)) - 1
+            rows //= 2
+            value = (value >> (rows * row_bits)) ^ (value & ((1 << (rows * row_bits)) - 1))
+        folded ^= value
+        columns = folded.to_bytes(row, 'little')
+        for index, byte in enumerate(columns):
+            if byte:
+                shift = (index * self.SHIFT) % self.WIDTH
+                self.state ^= ((byte << shift) | (byte >> (self.WIDTH - shift))) & self.MASK
+        self.length += len(data)
+
+    def digest(self):
+        result = bytearray(self.state.to_bytes(self.WIDTH // 8, 'little'))
+        for index, byte in enumerate(self.length.to_bytes(8, 'little')):
+            result[self.WIDTH // 8 - 8 + index] ^= byte
+        return bytes(result)
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+
+def new_hash(hash_type):
+    if hash_type == 'quickxor':
+        return QuickXorHash()
+    return hashlib.new(hash_type)
+
+
+def hash_file(path, hash_type):
+    """计算文件哈希, 返回与 rclone 一致的小写十六进制字符串"""
+    file_hash = new_hash(hash_type)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _hash_file_safe(args):
+    path, hash_type = args
+    try:
+        return path, hash_file(path, hash_type)
+    except OSError:
+        return path, None
+
+
+def select_hash_type(*supported):
+    """选择本地可计算且各端都支持的哈希类型, 没有时返回 None"""
+    for hash_type in SUPPORTED_HASHES:
+        if all(hash_type in hashes for hashes in supported):
+            return hash_type
+    return None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """进程池在首次使用时创建; 使用 spawn 避免在多线程进程中 fork"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_hash_workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def hash_files(paths, hash_type):
+    """在进程池中批量计算哈希, 返回 {路径: 哈希}, 读取失败的文件不在结果中"""
+    if not paths:
+        return {}
+    results = get_pool().map(_hash_file_safe, [(path, hash_type) for path in paths], chunksize=8)
+    return {path: value for path, value in results if value}
+
+
+class HashCache:
+    """本地文件哈希缓存, 以 (inode, size, mtime_ns, 哈希类型) 为键, 文件未变化时不会重复计算"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def key(inode, size, mtime_ns, hash_type):
+        return f'{inode}:{size}:{mtime_ns}:{hash_type}'
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        return {item['_id']: item['hash'] for item in self.collection.find({'_id': {'$in': list(keys)}})}
+
+    def set_many(self, values):
+        if not values:
+            return
+        self.collection.bulk_write(
+            [UpdateOne({'_id': key}, {'$set': {'hash': value}}, upsert=True) for key, value in values.items()],
+            ordered=False
+        )
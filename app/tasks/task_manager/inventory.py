@@ -0,0 +1,150 @@
+import threading
+import time
+
+from app.tasks.task_manager.rclone_operator import list_origin_tree
+
+
+def normalize_remote_path(path):
+    """统一远程路径格式: 去掉首尾的 / 并使用 / 分隔"""
+    return (path or '').replace('\\', '/').strip('/')
+
+
+def is_sub_path(path, root):
+    """判断 path 是否位于 root 之下(包含相等)"""
+    return not root or path == root or path.startswith(root + '/')
+
+
+class DestinationInventory:
+    """
+    目标端文件清单
+
+    通过一次 `rclone lsjson -R` 列出 origin:root 下的全部文件,
+    以相对 root 的路径为键建立内存索引, 替代逐个文件执行 `rclone lsf`
+    """
+
+    def __init__(self, origin, root, entries=None, available=True, hash_type=None):
+        self.origin = origin
+        self.root = normalize_remote_path(root)
+        self.available = available
+        self.hash_type = hash_type
+        self.index = {}
+        for entry in entries or []:
+            # 只保留比较需要的字段, 降低大目录的内存占用
+            item = {'Size': entry.get('Size'), 'ModTime': entry.get('ModTime')}
+            if hash_type:
+                item['Hash'] = (entry.get('Hashes') or {}).get(hash_type)
+            self.index[entry['Path']] = item
+
+    @classmethod
+    def load(cls, origin, root, hash_type=None):
+        """列举目标目录, 失败时返回不可用的清单以便调用方回退到逐个检查"""
+        root = normalize_remote_path(root)
+        try:
+            inventory = cls(origin, root, list_origin_tree(f'{origin}:{root}', hash_type), hash_type=hash_type)
+        except Exception as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 获取目标清单失败 {origin}:{root}: {str(e)}")
+            return cls(origin, root, available=False)
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 目标清单 {origin}:{root} 共 {len(inventory.index)} 个文件")
+        return inventory
+
+    def covers(self, remote_file_path):
+        """清单是否可以回答该路径的查询"""
+        return self.available and is_sub_path(normalize_remote_path(remote_file_path), self.root)
+
+    def relative(self, remote_file_path):
+        """转换为相对清单根目录的路径"""
+        path = normalize_remote_path(remote_file_path)
+        if not self.root:
+            return path
+        return path[len(self.root) + 1:]
+
+    def get(self, remote_file_path):
+        """获取目标文件信息, 不存在时返回 None"""
+        return self.index.get(self.relative(remote_file_path))
+
+    def exists(self, remote_file_path):
+        return self.relative(remote_file_path) in self.index
+
+
+class LazyInventory:
+    """
+    延迟列举的目标清单
+
+    接口与 DestinationInventory 相同, 第一次查询时才从缓存获取清单;
+    没有新增或变化文件的文件夹不会列举目标端
+    """
+
+    def __init__(self, cache, origin, remote_path):
+        self.cache = cache
+        self.origin = origin
+        self.remote_path = remote_path
+
+    def load(self):
+        return self.cache.get(self.origin, self.remote_path)
+
+    @property
+    def hash_type(self):
+        return self.load().hash_type
+
+    def covers(self, remote_file_path):
+        return self.load().covers(remote_file_path)
+
+    def get(self, remote_file_path):
+        return self.load().get(remote_file_path)
+
+    def exists(self, remote_file_path):
+        return self.load().exists(remote_file_path)
+
+
+class InventoryCache:
+    """
+    一轮检测内共享的目标清单缓存
+
+    预先登记本轮所有文件夹的目标路径, 共享同一前缀的文件夹只列举一次最上层目录;
+    hash_types 中登记的网盘在列举时同时获取该类型的哈希
+    """
+
+    def __init__(self, targets=(), hash_types=None):
+        self._lock = threading.Lock()
+        self._root_locks = {}
+        self._items = {}
+        self._roots = {}
+        self.hash_types = hash_types or {}
+        for origin, remote_path in targets:
+            self.register(origin, remote_path)
+
+    def register(self, origin, remote_path):
+        """登记目标路径, 已被其他根目录覆盖时忽略, 覆盖其他根目录时替换之"""
+        path = normalize_remote_path(remote_path)
+        with self._lock:
+            roots = self._roots.setdefault(origin, set())
+            if any(is_sub_path(path, root) for root in roots):
+                return
+            roots.difference_update({root for root in roots if is_sub_path(root, path)})
+            roots.add(path)
+
+    def resolve_root(self, origin, remote_path):
+        path = normalize_remote_path(remote_path)
+        with self._lock:
+            for root in self._roots.get(origin, ()):
+                if is_sub_path(path, root):
+                    return root
+        self.register(origin, path)
+        return path
+
+    def get(self, origin, remote_path):
+        """获取覆盖该目标路径的清单, 首次访问时列举"""
+        root = self.resolve_root(origin, remote_path)
+        key = (origin, root)
+        with self._lock:
+            root_lock = self._root_locks.setdefault(key, threading.Lock())
+        with root_lock:
+            inventory = self._items.get(key)
+            if inventory is None:
+                inventory = DestinationInventory.load(origin, root, self.hash_types.get(origin))
+                self._items[key] = inventory
+        return inventory
+
+    def lazy(self, origin, remote_path):
+        """返回该目标路径的延迟清单, 首次查询时才列举"""
+        return LazyInventory(self, origin, remote_path)
@@ -0,0 +1,164 @@
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.utils.env import get_env_int
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+# 节点标识, 同一台机器上运行多个上传进程时需要分别设置; 未设置时使用 NODE_ID_FILE 中持久化的标识
+_node_id = os.environ.get('NODE_ID')
+NODE_ID_FILE = os.environ.get('NODE_ID_FILE') or os.path.join(BASE_DIR, 'data', 'node_id')
+# 任务租约时长(秒), 节点在租约内没有续约时其任务可被其他节点领取
+_lease_seconds = get_env_int('LEASE_SECONDS', 120)
+
+# 任务结束或重新排队时清除租约
+RELEASED = {'leaseOwner': None, 'leaseExpiresAt': None}
+
+
+def now_ms():
+    """MongoDB 中的时间精确到毫秒, 截断后写入的租约可以按值精确匹配"""
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def load_node_id(path=None):
+    """
+    读取持久化的节点标识, 不存在时生成并保存
+    容器重建后主机名会变化, 以主机名作为标识时上次运行遗留的任务无法在启动时核对, 只能等租约过期
+    """
+    path = path or NODE_ID_FILE
+    try:
+        with open(path, encoding='utf-8') as f:
+            node_id = f.read().strip()
+        if node_id:
+            return node_id
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 读取节点标识失败 {path}: {str(e)}")
+    node_id = f'{socket.gethostname()}-{uuid.uuid4().hex[:8]}'
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(node_id)
+        # 多个进程同时启动时只有一个能链接成功, 其余读取已保存的标识
+        os.link(tmp_path, path)
+    except FileExistsError:
+        with open(path, encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError as e:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 无法保存节点标识 {path}, 重启后将使用新的标识: {str(e)}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return node_id
+
+
+def get_node_id():
+    global _node_id
+    if not _node_id:
+        _node_id = load_node_id()
+    return _node_id
+
+
+def get_lease_seconds():
+    return _lease_seconds
+
+
+def claimable_filter(now=None):
+    """已到重试时间的待上传任务, 以及租约已过期(节点退出或失联)的排队中/上传中任务"""
+    now = now or datetime.now()
+    return {'$or': [
+        {'status': 0, 'nextRetryAt': {'$not': {'$gt': now}}},
+        {'status': {'$in': [1, 2]}, 'leaseExpiresAt': {'$lt': now}},
+        # 升级前由旧版本置为排队中/上传中的任务没有租约
+        {'status': {'$in': [1, 2]}, 'leaseExpiresAt': None},
+    ]}
+
+
+def lease_fields(now=None):
+    now = now or now_ms()
+    return {'leaseOwner': get_node_id(), 'leaseExpiresAt': now + timedelta(seconds=_lease_seconds)}
+
+
+def claim_task(collection, task_id, projection=None):
+    """原子地领取单个任务并置为排队中, 已被其他节点领取时返回 None"""
+    now = now_ms()
+    return collection.find_one_and_update(
+        {'_id': ObjectId(task_id), **claimable_filter(now)},
+        {'$set': {'status': 1, **lease_fields(now)}},
+        projection=projection,
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def claim_tasks(collection, task_ids):
+    """领取一组任务, 返回实际领取到的任务 ID(字符串)"""
+    now = now_ms()
+    object_ids = [ObjectId(task_id) for task_id in task_ids]
+    lease = lease_fields(now)
+    collection.update_many(
+        {'_id': {'$in': object_ids}, **claimable_filter(now)},
+        {'$set': {'status': 1, **lease}}
+    )
+    # 同一时刻只会有一个节点的更新命中, 按租约确认哪些任务归本节点
+    return {
+        str(task['_id'])
+        for task in collection.find({'_id': {'$in': object_ids}, **lease}, {'_id': 1})
+    }
+
+
+def owned_filter(task_ids):
+    """本节点仍持有租约的排队中/上传中任务"""
+    return {'_id': {'$in': [ObjectId(task_id) for task_id in task_ids]}, 'leaseOwner': get_node_id(), 'status': {'$in': [1, 2]}}
+
+
+def renew_leases(collection, task_ids):
+    """
+    心跳: 续约本节点正在执行和调度队列中的任务, 返回续约数量
+    只续约进程内仍在跟踪的任务, 已丢失(例如传输协程异常退出)的任务租约会自然过期, 由其他节点或下一轮重新领取
+    """
+    if not task_ids:
+        return 0
+    return collection.update_many(
+        owned_filter(task_ids),
+        {'$set': {'leaseExpiresAt': datetime.now() + timedelta(seconds=_lease_seconds)}}
+    ).modified_count
+
+
+def start_owned(collection, task_ids, fields):
+    """
+    仍持有租约时把任务置为上传中并续约, 返回仍归本节点的任务 ID
+    租约过期后被其他节点领取的任务不再上传; 归属判断和更新在同一条更新语句中完成, 再按新租约确认
+    """
+    now = now_ms()
+    lease = lease_fields(now)
+    collection.update_many(owned_filter(task_ids), {'$set': {**fields, **lease}})
+    return [
+        task['_id']
+        for task in collection.find({'_id': {'$in': [ObjectId(task_id) for task_id in task_ids]}, **lease}, {'_id': 1})
+    ]
+
+
+def release_tasks(collection, task_ids):
+    """把本节点仍持有的任务重新置为待上传, 用于传输异常退出时立即交还任务"""
+    if not task_ids:
+        return 0
+    return collection.update_many(
+        owned_filter(task_ids),
+        {'$set': {'status': 0, **RELEASED}}
+    ).modified_count
+
+
+def release_node_tasks(collection):
+    """启动时把本节点上次运行遗留的任务重新置为待上传, 其他节点的任务不受影响"""
+    return collection.update_many(
+        {'leaseOwner': get_node_id(), 'status': {'$in': [1, 2]}},
+        {'$set': {'status': 0, **RELEASED}}
+    ).modified_count
@@ -0,0 +1,252 @@
+import asyncio
+import re
+import secrets
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from app.tasks.task_manager.autoscale import get_max_workers
+from app.tasks.task_manager.rc_client import RcClient, RcError
+from app.utils.db import mongo_db
+from app.utils.env import get_env_int
+
+# 所有传输共享的总带宽(字节/秒), 0 为不限制
+_global_bwlimit = get_env_int('GLOBAL_BWLIMIT', 0)
+# 网盘限制设置的刷新间隔(秒)
+_limits_refresh = get_env_int('ORIGIN_LIMITS_REFRESH', 30)
+
+
+def allocate_bandwidth(origins, global_limit=0, origin_limits=None):
+    """
+    把带宽预算分给正在执行的传输(注水法)
+
+    每个网盘的预算在该网盘的传输间平分, 总预算在所有传输间平分,
+    受网盘预算限制用不完的部分分给其他传输。
+    :param origins: 每个传输所属的网盘
+    :param origin_limits: {网盘: 预算}, 0 或缺失为不限制
+    :return: 每个传输的限速, 0 为不限制
+    """
+    origin_limits = origin_limits or {}
+    counts = {}
+    for origin in origins:
+        counts[origin] = counts.get(origin, 0) + 1
+    caps = [
+        origin_limits[origin] / counts[origin] if origin_limits.get(origin) else float('inf')
+        for origin in origins
+    ]
+    if not global_limit:
+        return [0 if cap == float('inf') else int(cap) for cap in caps]
+    rates = [0] * len(origins)
+    remaining = global_limit
+    order = sorted(range(len(origins)), key=lambda index: caps[index])
+    for position, index in enumerate(order):
+        rate = min(caps[index], remaining / (len(order) - position))
+        rates[index] = int(rate)
+        remaining -= rate
+    return rates
+
+
+# rclone 进程启动 rc 接口后输出的日志, 例如 Serving remote control on http://127.0.0.1:41234/
+RC_SERVING = re.compile(r'Serving remote control on (https?://\S+)')
+
+
+class TransferSlot:
+    """
+    一个正在执行的传输及其分到的限速
+
+    cli 后端在有带宽预算时为每个 rclone 进程开启 rc 接口, 之后通过 core/bwlimit 调整该进程的限速;
+    rc 接口监听在系统分配的随机端口并启用认证, 实际地址从进程的启动日志中取得
+    """
+
+    def __init__(self, origin, rc=False, rc_client=None):
+        self.origin = origin
+        # 通过 rcd 执行的传输共用 rcd 的限速
+        self.rc_client = rc_client
+        self.rc = rc
+        self.url = None
+        self.user = 'rclone-sync' if rc else None
+        self.password = secrets.token_urlsafe(16) if rc else None
+        self.rate = 0
+        self.tps = 0
+        self.applied = None
+
+    def flags(self):
+        """启动 rclone 进程时的限速参数"""
+        flags = []
+        if self.rate:
+            flags += ['--bwlimit', f'{self.rate}B']
+        if self.tps:
+            flags += ['--tpslimit', f'{self.tps:g}']
+        if self.rc:
+            # 端口由系统分配, 不会与其他进程冲突
+            flags += ['--rc', '--rc-addr=127.0.0.1:0']
+        self.applied = self.rate
+        return flags
+
+    def env(self):
+        """rc 接口的用户名和密码通过环境变量传给 rclone 进程, 不出现在命令行中"""
+        if not self.rc:
+            return {}
+        return {'RCLONE_RC_USER': self.user, 'RCLONE_RC_PASS': self.password}
+
+    def detect_rc_url(self, message):
+        """从 rclone 的日志中取得 rc 接口的地址, 是该条日志时返回 True"""
+        match = RC_SERVING.search(message) if self.rc else None
+        if match:
+            self.url = match.group(1)
+        return match is not None
+
+    def apply(self):
+        """限速变化后通知正在运行的进程, 进程的 rc 接口尚未就绪时留到下次调整"""
+        if self.url is None or self.applied is None or self.applied == self.rate:
+            return
+        try:
+            RcClient(self.url, self.user, self.password, timeout=5).call('core/bwlimit', {'rate': f'{self.rate}B' if self.rate else 'off'})
+            self.applied = self.rate
+        except RcError:
+            pass
+
+
+class OriginLimiter:
+    """
+    按网盘限制并发传输数、每秒请求数(tpslimit)和带宽
+
+    网盘设置保存在 origins 集合的 maxTransfers / maxTps / bwLimit 字段, 0 为不限制;
+    调度器不会取出并发已满的网盘的任务, 带宽预算在传输开始和结束时重新分配。
+    rcd 的 tpslimit 和限速对其中的所有传输生效, 设置了 maxTps 或 bwLimit 的网盘改为启动独立的 rclone 进程执行,
+    rcd 中的其余传输共用 GLOBAL_BWLIMIT 分给它们的带宽
+    """
+
+    def __init__(self, collection=None, global_bwlimit=None):
+        self.collection = collection if collection is not None else mongo_db.get_collection('origins')
+        self.global_bwlimit = _global_bwlimit if global_bwlimit is None else global_bwlimit
+        self.settings = {}
+        self.loaded_at = 0
+        # 已从队列取出的任务数(含准备中), 用于并发限制
+        self.active = {}
+        self.slots = []
+        # 上次设置给 rcd 的限速
+        self.rcd_rate = 0
+        self.lock = threading.RLock()
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self.loaded_at < _limits_refresh:
+            return
+        self.loaded_at = time.monotonic()
+        try:
+            self.settings = {
+                item['name']: {
+                    'maxTransfers': item.get('maxTransfers') or 0,
+                    'maxTps': item.get('maxTps') or 0,
+                    'bwLimit': item.get('bwLimit') or 0,
+                }
+                for item in self.collection.find({}, {'name': 1, 'maxTransfers': 1, 'maxTps': 1, 'bwLimit': 1})
+            }
+        except Exception as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 读取网盘限制失败: {str(e)}")
+
+    def get_setting(self, origin, name):
+        return self.settings.get(origin, {}).get(name) or 0
+
+    def needs_process(self, origin):
+        """网盘有单独的请求频率或带宽限制, 不能在共用的 rcd 中执行"""
+        return bool(self.get_setting(origin, 'maxTps') or self.get_setting(origin, 'bwLimit'))
+
+    def blocked(self):
+        """并发传输数已达上限的网盘; 在事件循环中调用, 使用已读取的设置, 由 refresh 在线程中更新"""
+        with self.lock:
+            return {
+                origin for origin, count in self.active.items()
+                if self.get_setting(origin, 'maxTransfers') and count >= self.get_setting(origin, 'maxTransfers')
+            }
+
+    def acquire(self, origin):
+        with self.lock:
+            self.active[origin] = self.active.get(origin, 0) + 1
+
+    def release(self, origin):
+        with self.lock:
+            count = self.active.get(origin, 0) - 1
+            if count > 0:
+                self.active[origin] = count
+            else:
+                self.active.pop(origin, None)
+
+    @asynccontextmanager
+    async def transfer(self, origin, rc_client=None):
+        """
+        登记一个传输并分配限速, 结束后把带宽分给其他传输
+        在事件循环中使用; 读取网盘设置和通过 rc 接口调整限速都在线程中执行.
+        rcd 后端下有单独限制的网盘返回的 slot.rc_client 为 None, 需要启动独立的 rclone 进程
+        """
+        slot = await asyncio.to_thread(self.add_slot, origin, rc_client)
+        try:
+            yield slot
+        finally:
+            await asyncio.to_thread(self.remove_slot, slot)
+
+    def add_slot(self, origin, rc_client=None):
+        self.refresh()
+        with self.lock:
+            if self.needs_process(origin):
+                # 调用方按 slot.rc_client 选择执行方式, 为 None 时启动独立的 rclone 进程
+                rc_client = None
+            budgeted = rc_client is None and (self.global_bwlimit or self.get_setting(origin, 'bwLimit'))
+            slot = TransferSlot(origin, bool(budgeted), rc_client)
+            self.slots.append(slot)
+            slot.tps = self.tps_share(origin)
+            self.rebalance()
+        return slot
+
+    def remove_slot(self, slot):
+        with self.lock:
+            self.slots.remove(slot)
+            self.rebalance()
+
+    def tps_share(self, origin):
+        """
+        每个传输分到的每秒请求数
+        rclone 进程启动后无法调整 --tpslimit, 按该网盘可能同时运行的最多传输数静态平分, 保证总和不超过 maxTps
+        """
+        max_tps = self.get_setting(origin, 'maxTps')
+        if not max_tps:
+            return 0
+        return max_tps / (self.get_setting(origin, 'maxTransfers') or get_max_workers())
+
+    def rebalance(self):
+        origins = [slot.origin for slot in self.slots]
+        origin_limits = {origin: self.get_setting(origin, 'bwLimit') for origin in set(origins)}
+        rates = allocate_bandwidth(origins, self.global_bwlimit, origin_limits)
+        for slot, rate in zip(self.slots, rates):
+            slot.rate = rate
+        shared = [slot for slot in self.slots if slot.rc_client is not None]
+        if shared:
+            # rcd 中的传输只受总带宽限制, 设置为分给它们的份额之和; 没有总带宽限制时不限速
+            total = max(sum(slot.rate for slot in shared), 1) if self.global_bwlimit else 0
+            if total != self.rcd_rate:
+                try:
+                    shared[0].rc_client.call('core/bwlimit', {'rate': f'{total}B' if total else 'off'})
+                    self.rcd_rate = total
+                except RcError:
+                    pass
+        changed = [slot for slot in self.slots if slot.url and slot.applied is not None and slot.applied != slot.rate]
+        if changed:
+            # 通过各进程的 rc 接口调整, 不在锁内等待
+            threading.Thread(target=self.apply_all, args=(changed,), daemon=True).start()
+
+    @staticmethod
+    def apply_all(slots):
+        for slot in slots:
+            slot.apply()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_origin_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = OriginLimiter()
+        return _limiter
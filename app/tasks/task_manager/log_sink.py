@@ -0,0 +1,116 @@
+import threading
+import time
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+
+from app.utils.env import get_env_int
+
+LOG_COLLECTION = 'task_logs'
+# 缓冲多少行或多久(毫秒)写入一次数据库
+_flush_lines = get_env_int('TASK_LOG_FLUSH_LINES', 100)
+_flush_ms = get_env_int('TASK_LOG_FLUSH_MS', 1000)
+# 每个日志分块保存的行数
+_chunk_lines = get_env_int('TASK_LOG_CHUNK_LINES', 200)
+# 每个任务最多保留的分块数, 超出后删除最早的分块, 只保留日志末尾
+_max_chunks = get_env_int('TASK_LOG_MAX_CHUNKS', 50)
+
+
+def ensure_log_indexes(collection):
+    collection.create_index([('taskId', ASCENDING), ('_id', ASCENDING)], name='task_logs_task')
+
+
+def trim_chunks(collection, task_id, max_chunks=None):
+    """删除超出保留数量的最早分块"""
+    max_chunks = max_chunks or _max_chunks
+    boundary = collection.find_one({'taskId': task_id}, {'_id': 1}, sort=[('_id', DESCENDING)], skip=max_chunks - 1)
+    if boundary is not None:
+        collection.delete_many({'taskId': task_id, '_id': {'$lt': boundary['_id']}})
+
+
+def append_task_logs(collection, logs):
+    """
+    为多个任务各追加一个日志分块, 用于批量任务结束时写入结果
+    :param logs: {任务ID: [日志行]}
+    """
+    docs = [
+        {'taskId': task_id, 'lines': lines, 'created_at': datetime.now()}
+        for task_id, lines in logs.items() if lines
+    ]
+    if docs:
+        collection.insert_many(docs, ordered=False)
+
+
+def read_task_logs(collection, task_id, tail=None, offset=0, limit=None):
+    """
+    读取任务保留的日志行(分块数量有上限, 可以一次读出)
+    :param tail: 只返回最后 tail 行, 否则返回 [offset, offset + limit) 范围
+    :return: (保留的总行数, 日志行)
+    """
+    lines = []
+    for chunk in collection.find({'taskId': task_id}, {'lines': 1}, sort=[('_id', ASCENDING)]):
+        lines.extend(chunk['lines'])
+    if tail:
+        return len(lines), lines[-tail:]
+    end = None if limit is None else offset + limit
+    return len(lines), lines[offset:end]
+
+
+class TaskLogSink:
+    """
+    任务日志缓冲写入
+
+    日志行先缓存在内存, 每 _flush_lines 行或 _flush_ms 毫秒写入一次 task_logs 集合,
+    每个分块最多 _chunk_lines 行, 每个任务最多保留 _max_chunks 个分块;
+    事件循环中只调用 append 写入缓冲, flush 由调用方放到线程中执行
+    """
+
+    def __init__(self, collection, task_id):
+        self.collection = collection
+        self.task_id = task_id
+        self.buffer = []
+        # lock 只保护缓冲, 写入数据库时持有 flush_lock, 追加日志不会等待数据库
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        # 当前写入的分块及其行数, 每次执行都从新分块开始
+        self.chunk_id = None
+        self.chunk_size = 0
+
+    def append(self, text):
+        """只追加到缓冲, 返回是否已达到写入条件"""
+        lines = [line for line in text.splitlines() if line.strip()]
+        with self.lock:
+            self.buffer.extend(lines)
+        return self.due()
+
+    def due(self):
+        """缓冲达到 _flush_lines 行或距上次写入超过 _flush_ms 毫秒"""
+        with self.lock:
+            return bool(self.buffer) and (len(self.buffer) >= _flush_lines or (time.monotonic() - self.last_flush) * 1000 >= _flush_ms)
+
+    def write(self, text):
+        if self.append(text):
+            self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                self.last_flush = time.monotonic()
+                lines, self.buffer = self.buffer, []
+            self._write_chunks(lines)
+
+    def _write_chunks(self, lines):
+        while lines:
+            if self.chunk_id is None or self.chunk_size >= _chunk_lines:
+                part, lines = lines[:_chunk_lines], lines[_chunk_lines:]
+                self.chunk_id = self.collection.insert_one({
+                    'taskId': self.task_id, 'lines': part, 'created_at': datetime.now()
+                }).inserted_id
+                self.chunk_size = len(part)
+                trim_chunks(self.collection, self.task_id)
+            else:
+                room = _chunk_lines - self.chunk_size
+                part, lines = lines[:room], lines[room:]
+                self.collection.update_one({'_id': self.chunk_id}, {'$push': {'lines': {'$each': part}}})
+                self.chunk_size += len(part)
@@ -2,14 +2,38 @@ import asyncio
 import os
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
 from app.api.v1.models.task import TaskCreate
-from app.tasks.task_manager.rclone_operator import check_file_exists, get_origin_files
+from app.tasks.task_manager.rclone_operator import check_file_exists, iter_origin_files, get_origin_hashes, supports_server_side_copy
+from app.tasks.task_manager.hasher import HashCache, hash_files, select_hash_type
+from app.tasks.task_manager.inventory import InventoryCache
+from app.tasks.task_manager.manifest import FolderManifest
+from app.tasks.task_manager.filters import PathFilter
+from app.tasks.task_manager.dispatch import notify_new_tasks
+from app.tasks.task_manager.leases import get_node_id, release_node_tasks
+from app.tasks.task_manager.log_sink import LOG_COLLECTION, ensure_log_indexes
+from app.tasks.task_manager.recovery import reconcile_node_tasks
+from app.tasks.task_manager.watcher import FolderWatcher
 from app.utils.db import mongo_db
+from app.utils.env import get_env_int
 from app.tasks.task_manager.queue import TaskQueue
+from app.tasks.task_manager.autoscale import WorkerAutoscaler
 from app.utils.logger import Logger
 
+# 任务唯一键, 同一文件同一目标只会存在一个任务
+TASK_UNIQUE_KEY = [('localPath', 1), ('origin', 1), ('remotePath', 1)]
+# 每批去重/写入的任务数量
+_batch_size = get_env_int('TASK_BATCH_SIZE', 1000)
+# 同时检测的文件夹数量
+_scan_folder_workers = get_env_int('SCAN_FOLDER_WORKERS', 4)
+# 同一网盘同时检测的文件夹数量
+_scan_origin_concurrency = get_env_int('SCAN_ORIGIN_CONCURRENCY', 2)
+
 
 class TaskManager:
     def __init__(self, mongo_db):
@@ -19,84 +43,92 @@ class TaskManager:
         asyncio.set_event_loop(self.loop)
         self.loop = asyncio.get_event_loop()
         self.logger = Logger()
+        self.batch_size = _batch_size
+        self.folder_locks = {}
+        self.folder_locks_lock = threading.Lock()
+        self.watcher = FolderWatcher(self)
+        self.scan_pool = ThreadPoolExecutor(max_workers=_scan_folder_workers, thread_name_prefix='folder-scan')
+        self.origin_semaphores = {}
+        self.hash_cache = HashCache(self.mongo_db.get_collection('hash_cache'))
 
     def add_task(self, task: TaskCreate):
         collection = self.mongo_db.get_collection('tasks')
         collection.insert_one(task.model_dump())
+        notify_new_tasks()
 
     def find_task_by_db(self, query: dict):
         collection = self.mongo_db.get_collection('tasks')
         return collection.find_one(query)
 
-    def scan_directory(self, local_path, max_depth, folder_id=None, folder_name=None, remote_path='', origin=''):
-        """递归扫描目录（优化版）"""
+    def scan_directory(self, local_path, max_depth, folder_id=None, folder_name=None, remote_path='', origin='', inventory=None, hash_type=None, path_filter=None):
+        """增量扫描目录, 只处理相对上次扫描清单新增或变化的文件, 返回新增任务数量"""
         if not os.path.exists(local_path):
             print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 无效路径: {local_path}")
-            return
+            return 0
 
+        path_filter = path_filter or PathFilter()
+        # 同步路径或目标网盘变化后上次的清单不再适用, 需要重新完整扫描
+        manifest = FolderManifest.load(folder_id, path_filter.signature, [local_path, remote_path, origin])
+        inserted = 0
+        candidates = []
         try:
-            for root, dirs, files in os.walk(local_path):
-                if self.should_skip_path(root, local_path, max_depth):
-                    continue
-
-                clean_files = self.filter_hidden_files(files)
-                self.process_files(root, clean_files, local_path, remote_path, origin, folder_id, folder_name)
+            for rel_path, record, changed, real_path in manifest.diff(local_path, max_depth, path_filter):
+                file_path = os.path.join(local_path, rel_path)
+                candidates.append({
+                    'localPath': real_path,
+                    'remotePath': self.build_remote_dir(file_path, local_path, remote_path),
+                    'fileName': os.path.basename(rel_path),
+                    'fileBytes': record[0],
+                    'mtime_ns': record[1],
+                    'inode': record[2],
+                    'changed': changed,
+                })
+                if len(candidates) >= self.batch_size:
+                    inserted += self.create_tasks_bulk(candidates, origin, folder_id, folder_name, inventory, hash_type=hash_type)
+                    candidates = []
+            if candidates:
+                inserted += self.create_tasks_bulk(candidates, origin, folder_id, folder_name, inventory, hash_type=hash_type)
+            # 任务全部写入后才保存清单, 中途失败时下次扫描会重新产出这些文件
+            if folder_id is not None:
+                manifest.save()
 
         except PermissionError as pe:
             self.log_error(f"权限拒绝: {str(pe)}")
         except Exception as e:
             self.log_error(f"遍历异常: {str(e)}")
+        return inserted
 
-    def scan_remote_directory(self, origin_path, max_depth, folder_id=None, folder_name=None, remote_path='', origin=''):
-        """递归扫描远程目录（优化版）"""
+    def scan_remote_directory(self, origin_path, max_depth, folder_id=None, folder_name=None, remote_path='', origin='', inventory=None, hash_type=None, path_filter=None):
+        """递归扫描远程目录（优化版）, 返回新增任务数量"""
         if not check_file_exists(origin_path):
             print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 无效路径: {origin_path}")
-            return
-        file_list = get_origin_files(origin_path, max_depth)
-        for file in file_list:
+            return 0
+        inserted = 0
+        candidates = []
+        # 流式读取列表, 列举尚未结束时即开始分批创建任务
+        source_origin = origin_path.split(':', 1)[0]
+        source_hash_type = hash_type if hash_type in self.get_origin_hash_types(source_origin) else None
+        transfer_mode = self.get_transfer_mode(source_origin, origin)
+        # 过滤规则交给 rclone 在列举时处理, 被排除的目录不会被列举
+        filter_flags = path_filter.rclone_flags() if path_filter else []
+        for file in iter_origin_files(origin_path, max_depth, source_hash_type, filter_flags):
             if file['IsDir']:
                 continue
             file_path = os.path.join(origin_path, file['Path']).replace('\\', '/')
-            remote_file_dir = self.build_remote_dir(file_path, origin_path, remote_path)
-            if self.find_task_by_db({'remotePath': remote_file_dir, 'origin': origin, 'localPath': file_path}):
-                continue
-            remote_file_path = os.path.join(remote_path, file['Path']).replace('\\', '/')
-            is_has = check_file_exists(f'{origin}:{remote_file_path}')
-            filename = file['Name']
-            task_json = {
+            candidates.append({
                 'localPath': file_path,
-                'remotePath': remote_file_dir,
-                'origin': origin,
-                'status': 3 if is_has else 0,
-                'progress': '100' if is_has else '0',
-                'name': folder_name,
-                'folderId': folder_id,
-                'fileName': filename,
-                'fileSize': self.get_size_format('', file['Size']),
-                'created_at': datetime.now(),
-            }
-            task_item = TaskCreate(**task_json)
-            self.add_task(task_item)
-
-    @staticmethod
-    def should_skip_path(root, base_path, max_depth):
-        """判断是否跳过当前路径"""
-        current_depth = root[len(base_path):].count(os.sep)
-        if current_depth > max_depth:
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 超过最大深度{str(max_depth)}层，停止遍历: {root}")
-            return True
-        return False
-    @staticmethod
-    def filter_hidden_files(files):
-        """过滤隐藏文件"""
-        return [f for f in files if not f.startswith('.') and not f.endswith('~')]
-
-    def process_files(self, root, files, local_path, remote_path, origin, folder_id, folder_name):
-        """处理单个目录下的文件"""
-        for file in files:
-            file_path = os.path.join(root, file)
-            remote_file_dir = self.build_remote_dir(file_path, local_path, remote_path)
-            self.create_task_if_needed(file_path, remote_file_dir, origin, folder_id, folder_name, file)
+                'remotePath': self.build_remote_dir(file_path, origin_path, remote_path),
+                'fileName': file['Name'],
+                'fileBytes': file['Size'],
+                'hash': (file.get('Hashes') or {}).get(source_hash_type),
+                'transferMode': transfer_mode,
+            })
+            if len(candidates) >= self.batch_size:
+                inserted += self.create_tasks_bulk(candidates, origin, folder_id, folder_name, inventory, hash_type=hash_type)
+                candidates = []
+        if candidates:
+            inserted += self.create_tasks_bulk(candidates, origin, folder_id, folder_name, inventory, hash_type=hash_type)
+        return inserted
 
     @staticmethod
     def build_remote_dir(file_path, local_path, remote_path):
@@ -116,7 +148,7 @@ class TaskManager:
         返回:
             str - 格式化的字符串 (如 '250.00KB')
         """
-        if not size_bytes:
+        if size_bytes is None:
             size_bytes = os.path.getsize(file_path)
         try:
            units = ['B', 'KB', 'MB', 'GB', 'TB']
@@ -134,65 +166,350 @@ class TaskManager:
         except Exception as e:
             return '0B'
 
-    def create_task_if_needed(self, file_path, remote_dir, origin, folder_id, folder_name, filename):
-        """创建任务（如果不存在）"""
-        real_path = os.path.realpath(file_path)
-        if self.find_task_by_db({'localPath': real_path, 'origin': origin, 'remotePath': remote_dir}):
-            return
-
-        is_has = check_file_exists(f'{origin}:{os.path.join(remote_dir, filename)}')
+    @staticmethod
+    def build_task_doc(candidate, origin, folder_id, folder_name, is_has):
+        """根据候选文件构建任务文档"""
         task_json = {
-            'localPath': real_path,
-            'remotePath': remote_dir,
+            'localPath': candidate['localPath'],
+            'remotePath': candidate['remotePath'],
             'origin': origin,
             'status': 3 if is_has else 0,
             'progress': '100' if is_has else '0',
             'name': folder_name,
             'folderId': folder_id,
-            'fileName': filename,
-            'fileSize': self.get_size_format(file_path),
+            'fileName': candidate['fileName'],
+            'fileSize': TaskManager.get_size_format(candidate['localPath'], candidate['fileBytes']),
+            'fileBytes': candidate['fileBytes'],
+            'transferMode': candidate.get('transferMode', 'upload'),
             'created_at': datetime.now(),
         }
-        task_item = TaskCreate(**task_json)
-        self.add_task(task_item)
+        return TaskCreate(**task_json).model_dump()
+
+    def find_existing_task_keys(self, candidates, origin):
+        """一次查询找出候选文件中已存在的任务, 返回 (localPath, remotePath) 集合"""
+        collection = self.mongo_db.get_collection('tasks')
+        local_paths = list({c['localPath'] for c in candidates})
+        cursor = collection.find(
+            {'localPath': {'$in': local_paths}, 'origin': origin},
+            {'_id': 0, 'localPath': 1, 'remotePath': 1}
+        )
+        return {(item['localPath'], item['remotePath']) for item in cursor}
+
+    @staticmethod
+    def destination_exists(origin, remote_file_path, inventory=None):
+        """目标文件是否已存在, 优先查询目标清单, 清单不可用时回退到 rclone lsf"""
+        if inventory is not None and inventory.covers(remote_file_path):
+            return inventory.exists(remote_file_path)
+        return check_file_exists(f'{origin}:{remote_file_path}')
 
     @staticmethod
-    def log_error(self, message):
+    def get_remote_file_path(candidate):
+        return os.path.join(candidate['remotePath'], candidate['fileName']).replace('\\', '/')
+
+    def is_uploaded(self, candidate, origin, inventory=None, hash_type=None, same_content=()):
+        """目标端是否已有该文件; 哈希模式下还要求大小与内容一致"""
+        if candidate['localPath'] in same_content:
+            return True
+        # 内容有变化的文件目标端即使存在也是旧版本, 需要重新上传
+        if candidate.get('changed'):
+            return False
+        remote_file_path = self.get_remote_file_path(candidate)
+        if hash_type and inventory is not None and inventory.hash_type == hash_type and inventory.covers(remote_file_path):
+            entry = inventory.get(remote_file_path)
+            # 目标端有哈希却未匹配说明内容不同; 没有哈希时只能以存在且大小一致为准
+            return entry is not None and entry['Size'] == candidate['fileBytes'] and not entry.get('Hash')
+        return self.destination_exists(origin, remote_file_path, inventory)
+
+    def get_local_hashes(self, candidates, hash_type):
+        """获取候选文件的哈希: 远程来源取列表中的哈希, 本地文件先查缓存, 缺失的在进程池中计算"""
+        hashes = {}
+        keyed = {}
+        for candidate in candidates:
+            if candidate.get('hash'):
+                hashes[candidate['localPath']] = candidate['hash']
+            elif candidate.get('inode') is not None:
+                key = HashCache.key(candidate['inode'], candidate['fileBytes'], candidate['mtime_ns'], hash_type)
+                keyed[key] = candidate['localPath']
+        cached = self.hash_cache.get_many(keyed)
+        hashes.update({keyed[key]: value for key, value in cached.items()})
+        missing = {key: path for key, path in keyed.items() if key not in cached}
+        computed = hash_files(list(missing.values()), hash_type)
+        self.hash_cache.set_many({key: computed[path] for key, path in missing.items() if path in computed})
+        hashes.update(computed)
+        return hashes
+
+    def match_destination_hashes(self, candidates, inventory, hash_type):
+        """比较本地与目标端哈希, 返回内容一致的文件 localPath 集合; 大小不同的文件不计算哈希"""
+        if inventory is None or inventory.hash_type != hash_type:
+            return set()
+        pending = []
+        for candidate in candidates:
+            remote_file_path = self.get_remote_file_path(candidate)
+            entry = inventory.get(remote_file_path) if inventory.covers(remote_file_path) else None
+            if entry and entry.get('Hash') and entry['Size'] == candidate['fileBytes']:
+                pending.append((candidate, entry['Hash'].lower()))
+        if not pending:
+            return set()
+        local_hashes = self.get_local_hashes([candidate for candidate, _ in pending], hash_type)
+        return {
+            candidate['localPath'] for candidate, remote_hash in pending
+            if (local_hashes.get(candidate['localPath']) or '').lower() == remote_hash
+        }
+
+    def get_origin_hash_types(self, origin):
+        try:
+            return get_origin_hashes(origin)
+        except Exception as e:
+            self.log_error(f"获取网盘 {origin} 支持的哈希类型失败: {str(e)}")
+            return []
+
+    def get_transfer_mode(self, source_origin, origin):
+        """网盘间同步的传输方式: 两端支持时服务端复制, 否则经本机中转"""
+        try:
+            return 'server-side' if supports_server_side_copy(source_origin, origin) else 'stream'
+        except Exception as e:
+            self.log_error(f"检测网盘 {source_origin} -> {origin} 服务端复制能力失败: {str(e)}")
+            return 'stream'
+
+    def get_folder_hash_type(self, folder):
+        """开启哈希比较的文件夹使用的哈希类型, 目标网盘不支持本地可计算的哈希时返回 None"""
+        if not folder.get('hashCheck'):
+            return None
+        return select_hash_type(self.get_origin_hash_types(folder['origin']))
+
+    def create_tasks_from_paths(self, folder, paths):
+        """为监听到的新文件创建任务, 返回新增数量"""
+        local_path = folder['localPath']
+        path_filter = PathFilter.from_folder(folder)
+        candidates = []
+        for file_path in paths:
+            rel_path = os.path.relpath(file_path, local_path)
+            name = os.path.basename(file_path)
+            if not path_filter.match_file(rel_path) or rel_path.count(os.sep) > folder['maxDepth']:
+                continue
+            try:
+                if not os.path.isfile(file_path):
+                    continue
+                size = os.path.getsize(file_path)
+            except OSError:
+                continue
+            candidates.append({
+                'localPath': os.path.realpath(file_path),
+                'remotePath': self.build_remote_dir(file_path, local_path, folder['remotePath']),
+                'fileName': name,
+                'fileBytes': size,
+            })
+        if not candidates:
+            return 0
+        # 新文件跳过目标端检查以保证及时入队, 目标端已有相同文件时 rclone copy 会直接跳过
+        inserted = self.create_tasks_bulk(candidates, folder['origin'], folder['_id'], folder['name'], check_destination=False)
+        if inserted:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 文件夹 {folder['name']} 监听到 {inserted} 个新文件")
+        return inserted
+
+    def create_tasks_bulk(self, candidates, origin, folder_id, folder_name, inventory=None, check_destination=True, hash_type=None):
+        """批量创建任务（如果不存在）, 返回实际新增数量"""
+        existing = self.find_existing_task_keys(candidates, origin)
+        new = []
+        changed = []
+        for candidate in candidates:
+            key = (candidate['localPath'], candidate['remotePath'])
+            if key in existing:
+                if candidate.get('changed'):
+                    changed.append(candidate)
+                continue
+            existing.add(key)
+            new.append(candidate)
+        # 哈希模式: 只有内容确实不同的文件才需要上传; 没有候选文件时不访问清单, 避免触发列举
+        same_content = self.match_destination_hashes(new + changed, inventory, hash_type) if hash_type and check_destination and (new or changed) else set()
+        changed = [candidate for candidate in changed if candidate['localPath'] not in same_content]
+        docs = []
+        for candidate in new:
+            is_has = check_destination and self.is_uploaded(candidate, origin, inventory, hash_type, same_content)
+            try:
+                docs.append(self.build_task_doc(candidate, origin, folder_id, folder_name, is_has))
+            except Exception as e:
+                self.log_error(f"任务数据校验失败 {candidate['localPath']}: {str(e)}")
+        created = self.bulk_add_tasks(docs) + self.bulk_requeue_tasks(changed, origin)
+        if created:
+            notify_new_tasks()
+        return created
+
+    def bulk_add_tasks(self, docs):
+        """
+        按唯一键无序批量 upsert 任务, 已存在的任务不会被覆盖
+
+        返回:
+            int - 实际插入的任务数量
+        """
+        collection = self.mongo_db.get_collection('tasks')
+        inserted = 0
+        for start in range(0, len(docs), self.batch_size):
+            operations = [
+                UpdateOne(
+                    {'localPath': doc['localPath'], 'origin': doc['origin'], 'remotePath': doc['remotePath']},
+                    {'$setOnInsert': doc},
+                    upsert=True
+                )
+                for doc in docs[start:start + self.batch_size]
+            ]
+            try:
+                result = collection.bulk_write(operations, ordered=False)
+                inserted += result.upserted_count
+            except BulkWriteError as bwe:
+                # 并发 upsert 可能触发唯一索引冲突(11000), 其余写入仍然生效
+                inserted += bwe.details.get('nUpserted', 0)
+                errors = [err for err in bwe.details.get('writeErrors', []) if err.get('code') != 11000]
+                if errors:
+                    self.log_error(f"批量写入任务失败: {errors[0].get('errmsg')}")
+        return inserted
+
+    def bulk_requeue_tasks(self, candidates, origin):
+        """将内容发生变化且已结束的任务重新置为待上传, 返回重新排队的数量"""
+        if not candidates:
+            return 0
+        collection = self.mongo_db.get_collection('tasks')
+        operations = [
+            UpdateOne(
+                {'localPath': c['localPath'], 'origin': origin, 'remotePath': c['remotePath'], 'status': {'$in': [3, 4]}},
+                {'$set': {
+                    'status': 0,
+                    'progress': '0',
+                    'attempts': 0,
+                    'nextRetryAt': None,
+                    'fileBytes': c['fileBytes'],
+                    'fileSize': self.get_size_format(c['localPath'], c['fileBytes']),
+                }}
+            )
+            for c in candidates
+        ]
+        result = collection.bulk_write(operations, ordered=False)
+        return result.modified_count
+
+    @staticmethod
+    def log_error(message):
         """统一错误日志"""
         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}")
 
-    def check_folders(self, status, delay):
+    def get_folder_lock(self, folder_id):
+        with self.folder_locks_lock:
+            return self.folder_locks.setdefault(folder_id, threading.Lock())
+
+    def scan_folder(self, folder, inventory=None):
+        """检测单个文件夹, 同一文件夹同时只会有一次扫描, 返回新增任务数量"""
+        lock = self.get_folder_lock(folder['_id'])
+        if not lock.acquire(blocking=False):
+            print(f'文件夹正在检测中, 跳过  --->{folder["name"]}')
+            return 0
         collection = self.mongo_db.get_collection('folders')
-        tasks_collection = self.mongo_db.get_collection('tasks')
-        folders = collection.find({'status': status})
-        for folder in folders:
+        try:
             print(f'检测文件夹  --->{folder["name"]} {folder["syncType"]}')
-            # 记录检测前的任务数量
-            initial_tasks_count = tasks_collection.count_documents({})
             collection.update_one({'_id': folder['_id']}, {'$set': {'status': 1, 'lastSyncAt': datetime.now()}})
+            hash_type = self.get_folder_hash_type(folder)
+            path_filter = PathFilter.from_folder(folder)
+            if inventory is None:
+                inventory = InventoryCache(hash_types={folder['origin']: hash_type}).lazy(folder['origin'], folder['remotePath'])
+            # 新增任务数量取自批量写入结果
             if folder['syncType'] == 'remote':
-                self.scan_remote_directory(folder['originPath'], folder['maxDepth'], folder['_id'], folder['name'], folder['remotePath'], folder['origin'])
+                new_tasks_count = self.scan_remote_directory(folder['originPath'], folder['maxDepth'], folder['_id'], folder['name'], folder['remotePath'], folder['origin'], inventory, hash_type, path_filter)
             else:
-                self.scan_directory(folder['localPath'], folder['maxDepth'], folder['_id'], folder['name'], folder['remotePath'], folder['origin'])
-            # 计算新增的任务数量
-            final_tasks_count = tasks_collection.count_documents({})
-            new_tasks_count = final_tasks_count - initial_tasks_count
-            # 更新文件夹状态
-            collection.update_one({'_id': folder['_id']}, {'$set': {'status': 2, 'lastSyncAt': datetime.now()}})
+                new_tasks_count = self.scan_directory(folder['localPath'], folder['maxDepth'], folder['_id'], folder['name'], folder['remotePath'], folder['origin'], inventory, hash_type, path_filter)
             # 添加日志记录
             self.logger.add_log({
                 'name': '文件夹检测',
                 'description': f'检测文件夹 {folder["name"]} ({folder["localPath"]})，新增 {new_tasks_count} 个文件任务'
             })
+            return new_tasks_count
+        except Exception as e:
+            self.log_error(f"检测文件夹 {folder['name']} 异常: {str(e)}")
+            self.logger.add_log({
+                'name': '文件夹检测失败',
+                'description': f'检测文件夹 {folder["name"]} ({folder["localPath"]}) 失败: {str(e)}'
+            })
+            return 0
+        finally:
+            # 更新文件夹状态
+            collection.update_one({'_id': folder['_id']}, {'$set': {'status': 2, 'lastSyncAt': datetime.now()}})
+            lock.release()
+
+    @staticmethod
+    def get_folder_origins(folder):
+        """文件夹检测时会访问的网盘: 目标网盘, 远程文件夹还包括来源网盘"""
+        origins = {folder['origin']}
+        if folder['syncType'] == 'remote' and ':' in folder['originPath']:
+            origins.add(folder['originPath'].split(':', 1)[0])
+        return sorted(origins)
+
+    def get_origin_semaphore(self, origin):
+        with self.folder_locks_lock:
+            return self.origin_semaphores.setdefault(origin, threading.BoundedSemaphore(_scan_origin_concurrency))
+
+    def scan_folder_limited(self, folder, inventory_cache=None):
+        """在网盘并发上限内检测文件夹, 按固定顺序获取信号量避免死锁; 未传入清单缓存时单独列举目标端"""
+        semaphores = [self.get_origin_semaphore(origin) for origin in self.get_folder_origins(folder)]
+        for semaphore in semaphores:
+            semaphore.acquire()
+        try:
+            inventory = inventory_cache.lazy(folder['origin'], folder['remotePath']) if inventory_cache is not None else None
+            return self.scan_folder(folder, inventory)
+        finally:
+            for semaphore in reversed(semaphores):
+                semaphore.release()
+
+    @staticmethod
+    def interleave_by_origin(folders):
+        """按网盘轮流排列文件夹, 避免同一网盘的文件夹占满线程池"""
+        groups = {}
+        for folder in folders:
+            groups.setdefault(folder['origin'], []).append(folder)
+        ordered = []
+        queues = list(groups.values())
+        while queues:
+            ordered.extend(queue.pop(0) for queue in queues)
+            queues = [queue for queue in queues if queue]
+        return ordered
+
+    def check_folders(self, status, delay):
+        self.watcher.sync_folders()
+        collection = self.mongo_db.get_collection('folders')
+        folders = list(collection.find({'status': status}))
+        # 本轮共享的目标清单, 目标前缀相同的文件夹只列举一次
+        hash_types = {folder['origin']: self.get_folder_hash_type(folder) for folder in folders if folder.get('hashCheck')}
+        inventory_cache = InventoryCache(((folder['origin'], folder['remotePath']) for folder in folders), hash_types)
+        futures = [
+            self.scan_pool.submit(self.scan_folder_limited, folder, inventory_cache)
+            for folder in self.interleave_by_origin(folders)
+        ]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                self.log_error(f"文件夹检测异常: {str(e)}")
         self.loop.call_later(delay, self.check_folders, 0 if status == 2 else 2, delay)
 
     def add_task_with_delay(self, delay):
+        self.watcher.start()
+        self.watcher.sync_folders()
         self.loop.call_later(delay, self.check_folders, 0, delay)
         self.loop.run_forever()
 
 value = os.environ.get('DELAY')
 _delay = int(value) if value and value.isdigit() else 60 * 10
 
+
+def ensure_task_indexes():
+    """为 tasks 集合建立索引: 唯一复合索引供批量 upsert 去重, 租约索引供各节点领取任务, 大小索引供按策略领取"""
+    collection = mongo_db.get_collection('tasks')
+    try:
+        collection.create_index(TASK_UNIQUE_KEY, unique=True, name='task_unique_key')
+    except OperationFailure as e:
+        TaskManager.log_error(f"创建任务唯一索引失败(可能存在重复任务): {str(e)}")
+    collection.create_index([('status', 1), ('leaseExpiresAt', 1)], name='task_lease')
+    collection.create_index([('leaseOwner', 1), ('status', 1)], name='task_lease_owner')
+    collection.create_index([('folderId', 1), ('status', 1), ('fileBytes', 1)], name='task_claim_size')
+    ensure_log_indexes(mongo_db.get_collection(LOG_COLLECTION))
+
+
 def initialize_the_project():
     print(f'------->初始化定时任务脚本 {_delay}s执行一次<-------')
     '''
@@ -201,7 +518,15 @@ def initialize_the_project():
     folder_collection = mongo_db.get_collection('folders')
     task_collection = mongo_db.get_collection('tasks')
     folder_collection.update_many({'status': 1}, {'$set': {'status': 2}})
-    task_collection.update_many({'status': {'$in': [1, 2]}}, {'$set': {'status': 0}})
+    # 只核对本节点上次运行遗留的任务, 其他节点的任务在租约过期后才会被重新领取
+    try:
+        done, requeued = reconcile_node_tasks(task_collection, folder_collection, mongo_db.get_collection(LOG_COLLECTION))
+        if done or requeued:
+            print(f'------->节点 {get_node_id()} 核对上次运行中断的任务: {done} 个已完成, {requeued} 个重新排队<-------')
+    except Exception as e:
+        released = release_node_tasks(task_collection)
+        print(f'------->节点 {get_node_id()} 核对中断任务失败, 重新排队 {released} 个任务: {str(e)}<-------')
+    ensure_task_indexes()
     threading.Thread(target=loop_check_folders).start()
     threading.Thread(target=loop_check_task).start()
 
@@ -213,5 +538,5 @@ def loop_check_folders():
 
 
 def loop_check_task():
-    task_queue = TaskQueue(num_threads=2)
+    task_queue = TaskQueue(concurrency=WorkerAutoscaler().min_workers)
     task_queue.add_task_with_delay(_delay)
\ No newline at end of file
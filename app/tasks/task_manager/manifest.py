@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+import time
+
+from app.tasks.task_manager.walker import ScandirWalker
+from app.utils.env import get_env_int
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+MANIFEST_DIR = os.environ.get('MANIFEST_DIR') or os.path.join(BASE_DIR, 'data', 'manifests')
+MANIFEST_VERSION = 1
+# 每隔多少轮做一次完整扫描, 用于发现目录 mtime 未变化但内容被原地修改的文件
+_full_scan_every = get_env_int('MANIFEST_FULL_SCAN_EVERY', 24)
+
+
+class FolderManifest:
+    """
+    文件夹扫描清单, 记录上次扫描时每个目录及文件的状态
+
+    dirs 结构: 相对目录 -> [目录 mtime_ns, {文件名: [size, mtime_ns, inode]}, [子目录名]]
+    目录 mtime 未变化时直接复用记录的文件和子目录, 不再列举和 stat
+    记录的文件和子目录已按过滤规则筛选, filters 保存生成清单时的规则签名
+    target 保存生成清单时的 [本地路径, 远程路径, 网盘], 文件夹改为同步到别处后清单失效
+    """
+
+    def __init__(self, folder_id=None, dirs=None, scans=0, filters=None, target=None):
+        self.folder_id = folder_id
+        self.dirs = dirs or {}
+        self.scans = scans
+        self.filters = filters
+        self.target = target
+
+    @staticmethod
+    def get_path(folder_id):
+        return os.path.join(MANIFEST_DIR, f'{folder_id}.json.gz')
+
+    @classmethod
+    def load(cls, folder_id, filters=None, target=None):
+        """读取清单, 不存在、损坏、过滤规则或同步路径已变化时返回空清单(相当于完整扫描)"""
+        path = cls.get_path(folder_id)
+        if not os.path.exists(path):
+            return cls(folder_id, filters=filters, target=target)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION or data.get('filters') != filters or data.get('target') != target:
+                return cls(folder_id, filters=filters, target=target)
+            return cls(folder_id, data.get('dirs'), data.get('scans', 0), filters, target)
+        except Exception as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 读取扫描清单失败 {path}: {str(e)}")
+            return cls(folder_id, filters=filters, target=target)
+
+    def save(self):
+        """原子写入清单文件"""
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        path = self.get_path(self.folder_id)
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump({'version': MANIFEST_VERSION, 'scans': self.scans, 'filters': self.filters, 'target': self.target, 'dirs': self.dirs}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def is_full_scan(self):
+        return not self.dirs or (_full_scan_every > 0 and self.scans % _full_scan_every == 0)
+
+    def diff(self, local_path, max_depth, path_filter=None, full=None, workers=None):
+        """
+        并发扫描目录并与上次的清单比较, 逐个产出新增或变化的文件
+
+        产出:
+            (相对路径, [size, mtime_ns, inode], 是否为已有文件的变化, 文件 realpath)
+
+        扫描完成后 self.dirs 被替换为本次结果, 需要调用 save() 持久化
+        """
+        if full is None:
+            full = self.is_full_scan()
+        previous = self.dirs
+        # 不进入符号链接目录, 子目录的 realpath 可由根目录的 realpath 直接拼接得到
+        real_root = os.path.realpath(local_path)
+
+        def visit(rel_dir, abs_dir):
+            old = previous.get(rel_dir)
+            changes = []
+            try:
+                dir_mtime = os.stat(abs_dir).st_mtime_ns
+                if not full and old and old[0] == dir_mtime:
+                    # 目录项未增删, 复用上次记录
+                    return (old, changes), old[2]
+                files, subdirs = {}, []
+                old_files = old[1] if old else {}
+                real_dir = os.path.join(real_root, rel_dir) if rel_dir else real_root
+                with os.scandir(abs_dir) as entries:
+                    for entry in entries:
+                        rel_path = os.path.join(rel_dir, entry.name)
+                        if entry.is_dir():
+                            # 被排除的目录直接剪枝, 不再进入
+                            if not entry.is_symlink() and (path_filter is None or path_filter.match_dir(rel_path)):
+                                subdirs.append(entry.name)
+                            continue
+                        if path_filter and not path_filter.match_file(rel_path):
+                            continue
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            # 失效的符号链接等
+                            continue
+                        record = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+                        files[entry.name] = record
+                        old_record = old_files.get(entry.name)
+                        if old_record != record:
+                            real_path = os.path.realpath(entry.path) if entry.is_symlink() else os.path.join(real_dir, entry.name)
+                            changes.append((rel_path, record, old_record is not None, real_path))
+            except OSError as e:
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 无法读取目录 {abs_dir}: {str(e)}")
+                return (old, changes), []
+            return ([dir_mtime, files, subdirs], changes), subdirs
+
+        current = {}
+        for rel_dir, (record, changes) in ScandirWalker(local_path, max_depth, visit, workers).walk():
+            if record:
+                current[rel_dir] = record
+            yield from changes
+        self.dirs = current
+        self.scans += 1
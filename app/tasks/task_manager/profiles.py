@@ -0,0 +1,210 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app.utils.db import mongo_db
+from app.utils.env import get_env_int
+
+PROFILE_COLLECTION = 'transfer_profiles'
+# 每隔多少秒根据已完成任务的吞吐调整一次传输参数
+_tune_interval = get_env_int('PROFILE_TUNE_INTERVAL', 300)
+# 每个档位至少完成多少个任务才参与比较
+_min_samples = get_env_int('PROFILE_MIN_SAMPLES', 5)
+# 提升档位后吞吐至少提升多少(百分比)才继续提升
+_min_gain_percent = get_env_int('PROFILE_MIN_GAIN_PERCENT', 10)
+# 档位的吞吐记录保留多少小时, 过期后重新试探
+_history_hours = get_env_int('PROFILE_HISTORY_HOURS', 24)
+
+MiB = 1 << 20
+# 文件大小分类: (名称, 上限字节数)
+SIZE_CLASSES = [('tiny', MiB), ('small', 64 * MiB), ('medium', 1024 * MiB), ('large', None)]
+
+# 小文件: 不分块, 快速失败重试, 批量任务时提高检查并发
+# 不使用 --no-check-dest: 重试或重新分发的批量任务会重复上传已存在的文件, 允许同名文件的网盘会产生重复文件
+FIXED_PROFILES = {
+    'tiny': {'streams': 0, 'checkers': 16, 'timeout': '10m', 'contimeout': '1m'},
+    'small': {'streams': 0, 'checkers': 8},
+}
+# 中等和大文件按档位自动调整, 档位越高并行流、缓冲区和分块越大
+LEVELS = [
+    {'streams': 2, 'buffer': '16M', 'chunk': 0},
+    {'streams': 4, 'buffer': '32M', 'chunk': 1},
+    {'streams': 8, 'buffer': '64M', 'chunk': 2},
+    {'streams': 16, 'buffer': '128M', 'chunk': 3},
+]
+TUNED_CLASSES = {'medium': 1, 'large': 1}
+# 各后端的分块参数及可选值(需满足后端限制, 例如 OneDrive 须为 320KiB 的整数倍, Google Drive 须为 2 的幂)
+CHUNK_SIZES = {
+    'drive': ['8M', '16M', '32M', '64M'],
+    'onedrive': ['10M', '20M', '40M', '60M'],
+    's3': ['5M', '16M', '32M', '64M'],
+    'b2': ['96M', '128M', '192M', '256M'],
+    'dropbox': ['48M', '96M', '128M', '144M'],
+    'azureblob': ['4M', '16M', '32M', '64M'],
+}
+
+
+def get_size_class(size):
+    size = size or 0
+    for name, limit in SIZE_CLASSES:
+        if limit is None or size < limit:
+            return name
+    return SIZE_CLASSES[-1][0]
+
+
+def build_profile(size_class, level=None, backend_type=None):
+    """档位对应的参数, 未自动调整的分类返回固定参数"""
+    if size_class not in TUNED_CLASSES:
+        return dict(FIXED_PROFILES.get(size_class, {}))
+    level = TUNED_CLASSES[size_class] if level is None else level
+    params = dict(LEVELS[level])
+    chunk_sizes = CHUNK_SIZES.get(backend_type)
+    params['chunk'] = chunk_sizes[params['chunk']] if chunk_sizes else None
+    # 中等文件也使用多线程传输
+    params['cutoff'] = '64M'
+    return params
+
+
+def profile_flags(profile, backend_type=None):
+    """转换为 rclone 命令行参数"""
+    flags = []
+    if 'streams' in profile:
+        flags += ['--multi-thread-streams', str(profile['streams'])]
+    if profile.get('cutoff'):
+        flags += ['--multi-thread-cutoff', profile['cutoff']]
+    if profile.get('buffer'):
+        flags += ['--buffer-size', profile['buffer']]
+    if profile.get('checkers'):
+        flags += ['--checkers', str(profile['checkers'])]
+    if profile.get('chunk') and backend_type:
+        flags += [f'--{backend_type}-chunk-size', profile['chunk']]
+    if profile.get('timeout'):
+        flags.append(f"--timeout={profile['timeout']}")
+    if profile.get('contimeout'):
+        flags.append(f"--contimeout={profile['contimeout']}")
+    return flags
+
+
+def profile_rc_config(profile):
+    """转换为 rc 接口的 _config, 分块大小通过目标路径的连接参数设置"""
+    config = {}
+    if 'streams' in profile:
+        config['MultiThreadStreams'] = profile['streams']
+    if profile.get('cutoff'):
+        config['MultiThreadCutoff'] = profile['cutoff']
+    if profile.get('buffer'):
+        config['BufferSize'] = profile['buffer']
+    if profile.get('checkers'):
+        config['Checkers'] = profile['checkers']
+    return config
+
+
+def next_level(level, history, max_level=None, min_gain_percent=None):
+    """
+    爬山法选择下一个档位
+    :param history: {档位: 平均吞吐}, 只包含有足够样本的档位
+    比下一档慢则退回; 上一档未试过或明显更快则提升; 否则保持
+    """
+    max_level = len(LEVELS) - 1 if max_level is None else max_level
+    gain = 1 + (_min_gain_percent if min_gain_percent is None else min_gain_percent) / 100
+    current = history.get(level)
+    if current is None:
+        return level
+    lower = history.get(level - 1)
+    if level > 0 and lower is not None and lower > current:
+        return level - 1
+    upper = history.get(level + 1)
+    if level < max_level and (upper is None or upper > current * gain):
+        if upper is None and lower is not None and current < lower * gain:
+            # 上次提升收益不足, 不再继续试探
+            return level
+        return level + 1
+    return level
+
+
+class ProfileTuner:
+    """
+    按 (网盘, 文件大小分类) 记录当前档位, 根据已完成任务的吞吐定期调整
+
+    档位保存在 transfer_profiles 集合, 多个节点共用; 读取时缓存 PROFILE_TUNE_INTERVAL 秒
+    """
+
+    def __init__(self, collection=None, tasks_collection=None):
+        self.collection = collection if collection is not None else mongo_db.get_collection(PROFILE_COLLECTION)
+        self.tasks_collection = tasks_collection if tasks_collection is not None else mongo_db.get_collection('tasks')
+        self.interval = _tune_interval
+        self.levels = {}
+        self.loaded_at = 0
+        self.lock = threading.Lock()
+
+    def get_level(self, origin, size_class):
+        if size_class not in TUNED_CLASSES:
+            return None
+        with self.lock:
+            if time.monotonic() - self.loaded_at >= self.interval:
+                self.loaded_at = time.monotonic()
+                try:
+                    self.levels = {
+                        (item['origin'], item['sizeClass']): item['level']
+                        for item in self.collection.find({}, {'origin': 1, 'sizeClass': 1, 'level': 1})
+                    }
+                except Exception as e:
+                    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 读取传输参数档位失败: {str(e)}")
+            return self.levels.get((origin, size_class), TUNED_CLASSES[size_class])
+
+    def get_profile(self, origin, size, backend_type=None):
+        size_class = get_size_class(size)
+        level = self.get_level(origin, size_class)
+        profile = build_profile(size_class, level, backend_type)
+        return size_class, level, profile
+
+    def tune(self):
+        """统计各档位的平均吞吐并调整档位, 返回 [(网盘, 分类, 原档位, 新档位)]"""
+        now = datetime.now()
+        since = now - timedelta(hours=_history_hours)
+        pipeline = [
+            {'$match': {'status': 3, 'finishedAt': {'$gte': since}, 'profile.level': {'$ne': None}, 'throughputBps': {'$gt': 0}}},
+            {'$group': {
+                '_id': {'origin': '$origin', 'sizeClass': '$profile.sizeClass', 'level': '$profile.level'},
+                'bps': {'$avg': '$throughputBps'},
+                'samples': {'$sum': 1},
+            }},
+        ]
+        stats = {}
+        for item in self.tasks_collection.aggregate(pipeline):
+            if item['samples'] < _min_samples:
+                continue
+            key = (item['_id']['origin'], item['_id']['sizeClass'])
+            stats.setdefault(key, {})[item['_id']['level']] = item['bps']
+        changes = []
+        for (origin, size_class), history in stats.items():
+            if size_class not in TUNED_CLASSES:
+                continue
+            profile_id = f'{origin}:{size_class}'
+            state = self.collection.find_one({'_id': profile_id}) or {}
+            level = state.get('level', TUNED_CLASSES[size_class])
+            target = next_level(level, history)
+            self.collection.update_one({'_id': profile_id}, {'$set': {
+                'origin': origin,
+                'sizeClass': size_class,
+                'level': target,
+                'history': {str(key): int(value) for key, value in history.items()},
+                'updatedAt': now,
+            }}, upsert=True)
+            if target != level:
+                changes.append((origin, size_class, level, target))
+        with self.lock:
+            self.loaded_at = 0
+        return changes
+
+
+_tuner = None
+_tuner_lock = threading.Lock()
+
+
+def get_profile_tuner():
+    global _tuner
+    with _tuner_lock:
+        if _tuner is None:
+            _tuner = ProfileTuner()
+        return _tuner
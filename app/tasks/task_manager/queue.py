@@ -1,64 +1,311 @@
-import threading
 import asyncio
-from queue import Queue
-from app.tasks.task_manager.rclone_operator import RcloneCommand
-from app.utils.db import mongo_db
+import time
+from queue import Empty
+from app.tasks.task_manager.autoscale import POOL_COLLECTION, WorkerAutoscaler, save_pool_state
+from app.tasks.task_manager.batch import group_tasks
+from app.tasks.task_manager.dispatch import DispatchTrigger, TaskChangeWatcher, subscribe
+from app.tasks.task_manager.leases import claimable_filter, claim_tasks, get_lease_seconds, get_node_id, release_tasks, renew_leases
+from app.tasks.task_manager.limits import get_origin_limiter
+from app.tasks.task_manager.profiles import get_profile_tuner
+from app.tasks.task_manager.rclone_operator import RcloneCommand, BatchRcloneCommand
+from app.tasks.task_manager.scheduler import TaskScheduler
+from app.utils.db import mongo_db, pool_metrics
+from app.utils.env import get_env_int
 from app.utils.logger import Logger
 
+# 预先领取的任务数: 排队中(已领取未开始)的任务不超过该值, 其余任务留在数据库
+_dispatch_prefetch = get_env_int('DISPATCH_PREFETCH', 500)
+
 class TaskQueue:
-    def __init__(self, num_threads=5):
-        self.queue = Queue()
+    """
+    在一个事件循环中调度和执行上传任务
+
+    每个传输是事件循环中的一个协程, rclone 进程通过 asyncio 子进程启动, 不再占用线程;
+    并发数由自动伸缩调整, 有空闲并发时立即从调度队列取下一个任务;
+    调度队列只保留 DISPATCH_PREFETCH 个已领取的任务, 消耗过半时再从数据库批量领取
+    """
+
+    def __init__(self, concurrency=5):
+        self.queue = TaskScheduler(limiter=get_origin_limiter())
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
         self.loop = asyncio.get_event_loop()
-        self.num_threads = num_threads
-        self.threads = []
-        self._create_threads()
+        self.concurrency = concurrency
+        # 正在执行的传输(asyncio.Task -> 命令), 以及上次采样后完成/失败的任务数
+        self.running = {}
+        self.finished = 0
+        self.failed = 0
         self.logger = Logger()
+        self.autoscaler = WorkerAutoscaler()
+        self.node = get_node_id()
+        self.trigger = DispatchTrigger(self.loop, self.dispatch)
+        self.prefetch = _dispatch_prefetch
+        # 各网盘已领取但还在调度队列中的任务数
+        self.prefetched = {}
+        # 本节点持有租约的任务 ID(调度队列中和正在执行的), 心跳只续约这些任务
+        self.leased = set()
+        # 上次领取时数据库中已没有更多待上传任务, 新任务通过通知或兜底轮询分发
+        self.exhausted = False
+        # 同时只进行一次分发, 分发期间的请求合并为结束后再分发一次
+        self.dispatching = False
+        self.dispatch_again = False
+        # 在线程中执行的定时任务, 保留引用直到完成
+        self.background = set()
 
-    def _create_threads(self):
-        for _ in range(self.num_threads):
-            thread = threading.Thread(target=self._worker)
-            thread.daemon = True
-            thread.start()
-            self.threads.append(thread)
-
-    def _worker(self):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        while True:
-            task_id = self.queue.get()
-            if task_id is None:
+    @staticmethod
+    def get_task_ids(item):
+        return item['task_ids'] if isinstance(item, dict) else [item]
+
+    @staticmethod
+    def create_command(item):
+        # 批量任务为 dict, 单个任务为任务 ID
+        if isinstance(item, dict):
+            return BatchRcloneCommand(item)
+        return RcloneCommand({'task_id': item})
+
+    def start_transfers(self):
+        """并发未满时从调度队列取任务执行, 只在事件循环线程中调用"""
+        while len(self.running) < self.concurrency:
+            try:
+                entry = self.queue.get_nowait()
+            except Empty:
                 break
-            rclone_command = RcloneCommand({'task_id': task_id})
-            rclone_command.run()
+            if entry is None:
+                self.queue.task_done()
+                continue
+            self.count_prefetched(entry.origin, entry.item, -1)
+            self.running[self.loop.create_task(self.transfer(entry))] = None
+        if not self.exhausted and sum(self.prefetched.values()) <= self.window() // 2:
+            self.trigger.wake()
+
+    def window(self):
+        return max(self.prefetch, self.concurrency)
+
+    def count_prefetched(self, origin, item, sign):
+        count = self.prefetched.get(origin, 0) + sign * len(self.get_task_ids(item))
+        if count > 0:
+            self.prefetched[origin] = count
+        else:
+            self.prefetched.pop(origin, None)
+
+    async def transfer(self, entry):
+        current = asyncio.current_task()
+        command = None
+        try:
+            command = await asyncio.to_thread(self.create_command, entry.item)
+            self.running[current] = command
+            await command.run()
+        except Exception as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 执行任务 {entry.item} 失败: {str(e)}")
+            # 未正常结束的任务立即交还, 不必等租约过期
+            try:
+                await asyncio.to_thread(release_tasks, mongo_db.get_collection('tasks'), self.get_task_ids(entry.item))
+            except Exception as e:
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 释放任务 {entry.item} 的租约失败: {str(e)}")
+        finally:
+            self.leased.difference_update(self.get_task_ids(entry.item))
+            self.running.pop(current, None)
+            if command is not None:
+                self.finished += command.succeeded + command.failed
+                self.failed += command.failed
+            self.queue.release(entry.origin)
             self.queue.task_done()
-            
-            # Wait for a new task if the queue is empty
-            if self.queue.empty():
-                self.queue.join()
+            self.start_transfers()
+
+    def add_task(self, task, size=0, origin=None, group=None, priority=0):
+        self.count_prefetched(origin, task, 1)
+        self.leased.update(self.get_task_ids(task))
+        self.queue.put_task(task, size, origin, group, priority)
+
+    def set_concurrency(self, concurrency):
+        """调整并发数; 减少时正在执行的传输不受影响, 完成后不再补充"""
+        self.concurrency = concurrency
+        self.start_transfers()
+
+    def sample(self):
+        """采样当前并发数、排队数、总速度和上次采样后的完成/失败任务数"""
+        sample = {
+            'workers': self.concurrency,
+            'busy': len(self.running),
+            'queueDepth': self.queue.qsize(),
+            'bytesPerSec': int(sum(command.speed_bps or 0 for command in self.running.values() if command is not None)),
+            'finished': self.finished,
+            'failed': self.failed,
+        }
+        self.finished = self.failed = 0
+        return sample
+
+    def spawn(self, coro):
+        task = self.loop.create_task(coro)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
 
-    def add_task(self, task):
-        self.queue.put(task)
+    async def run_off_loop(self, error, func, *args):
+        """在线程中执行阻塞的数据库或 HTTP 操作, 失败时只打印日志"""
+        try:
+            return await asyncio.to_thread(func, *args)
+        except Exception as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {error}: {str(e)}")
 
-    def set_num_threads(self, num_threads):
-        self.num_threads = num_threads
-        self._create_threads()
+    def autoscale(self, interval):
+        try:
+            sample = self.sample()
+            target, reason = self.autoscaler.decide(sample)
+            if target != sample['workers']:
+                self.set_concurrency(target)
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 上传并发数 {sample['workers']} -> {target}: {reason}")
+            # 一并记录本进程的数据库连接池使用情况
+            state = {**sample, 'mongoPool': pool_metrics.snapshot()}
+            self.spawn(self.run_off_loop(
+                '保存上传并发状态失败', save_pool_state, mongo_db.get_collection(POOL_COLLECTION), self.node, state, target, reason
+            ))
+        except Exception as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 调整上传并发数失败: {str(e)}")
+        self.loop.call_later(interval, self.autoscale, interval)
 
     def stop(self):
-        for _ in self.threads:
-            self.queue.put(None)
-        for thread in self.threads:
-            thread.join()
+        """取消正在执行的传输, rclone 进程随之结束; 只在事件循环线程中调用"""
+        for task in list(self.running):
+            task.cancel()
 
-    def check_task_to_queue(self, delay):
+    def dispatch(self):
+        """把待上传任务分组后放入调度队列, 只在事件循环线程中调用; 查询和领取在线程中执行"""
+        if self.dispatching:
+            self.dispatch_again = True
+            return
+        self.dispatching = True
+        self.spawn(self.dispatch_pending())
+
+    async def dispatch_pending(self):
+        try:
+            while True:
+                self.dispatch_again = False
+                try:
+                    await self.enqueue_pending_tasks()
+                except Exception as e:
+                    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 分发待上传任务失败: {str(e)}")
+                if not self.dispatch_again:
+                    break
+        finally:
+            self.dispatching = False
+
+    async def enqueue_pending_tasks(self):
+        """
+        领取不超过预取窗口的待上传任务放入调度队列
+        并发已满的网盘不再领取, 其排队任务也不占用窗口, 避免其他网盘的任务被挡住
+        """
+        blocked = self.queue.blocked()
+        saturated = [origin for origin in blocked if self.prefetched.get(origin)]
+        room = self.window() - sum(count for origin, count in self.prefetched.items() if origin not in blocked)
+        if room <= 0:
+            return
+        entries, self.exhausted = await asyncio.to_thread(self.claim_pending_tasks, room, saturated)
+        for entry in entries:
+            self.add_task(*entry)
+        self.start_transfers()
+
+    def claim_pending_tasks(self, room, saturated):
+        """
+        在线程中查询并领取待上传任务
+        :return: ([(任务, 大小, 网盘, 文件夹, 优先级)], 数据库中是否已没有更多待上传任务)
+        """
+        # 顺便刷新网盘限制, 调度时使用刷新后的设置
+        self.queue.limiter.refresh()
         collection = mongo_db.get_collection('tasks')
-        tasks = collection.find({'status': 0})
-        for task in tasks:
-            self.add_task(str(task['_id']))
-            collection.update_one({'_id': task['_id']}, {'$set': {'status': 1}})
+        query = claimable_filter()
+        if saturated:
+            query['origin'] = {'$nin': saturated}
+        tasks = self.find_claimable(collection, query, room)
+        exhausted = len(tasks) < room
+        if not tasks:
+            return [], exhausted
+        # 一次批量更新领取本轮的所有任务; 多个节点共用一个数据库, 只有领取成功的任务才放入本节点的队列
+        owned = claim_tasks(collection, [str(task['_id']) for task in tasks])
+        tasks = [task for task in tasks if str(task['_id']) in owned]
+        tasks_by_id = {str(task['_id']): task for task in tasks}
+        folder_ids = list({task.get('folderId') for task in tasks})
+        priorities = {
+            folder['_id']: folder.get('priority') or 0
+            for folder in mongo_db.get_collection('folders').find({'_id': {'$in': folder_ids}}, {'priority': 1})
+        } if folder_ids else {}
+        entries = []
+        # 源根目录和目标根目录相同的小文件合并为一次 rclone 调用
+        for item in group_tasks(tasks):
+            task_ids = self.get_task_ids(item)
+            # 批量任务按第一个任务所在的文件夹参与调度
+            task = tasks_by_id[task_ids[0]]
+            size = item['bytes'] if isinstance(item, dict) else task.get('fileBytes')
+            entries.append((item, size, task['origin'], str(task.get('folderId')), priorities.get(task.get('folderId'), 0)))
+        return entries, exhausted
+
+    def find_claimable(self, collection, query, room):
+        """
+        按调度策略查询最多 room 个可领取的任务
+        fifo 按入队顺序, sjf 按文件大小; fair/priority 在各文件夹间轮流领取, 文件夹内小文件优先,
+        priority 先领完高优先级文件夹的任务, 避免一个文件夹的积压占满领取窗口
+        """
+        projection = {'localPath': 1, 'remotePath': 1, 'origin': 1, 'fileBytes': 1, 'transferMode': 1, 'folderId': 1}
+        policy = self.queue.policy
+        if policy in ('fifo', 'sjf'):
+            order = [('_id', 1)] if policy == 'fifo' else [('fileBytes', 1), ('_id', 1)]
+            return list(collection.find(query, projection).sort(order).limit(room))
+        folder_ids = collection.distinct('folderId', query)
+        # 不属于任何文件夹的任务(folderId 缺失)单独作为一组
+        if None not in folder_ids:
+            folder_ids.append(None)
+        priorities = {
+            folder['_id']: folder.get('priority') or 0
+            for folder in mongo_db.get_collection('folders').find({'_id': {'$in': folder_ids}}, {'priority': 1})
+        } if policy == 'priority' else {}
+        lanes = {}
+        for folder_id in folder_ids:
+            lanes.setdefault(priorities.get(folder_id, 0), []).append(folder_id)
+        tasks = []
+        for priority in sorted(lanes, reverse=True):
+            # 游标按批读取, 每个文件夹实际只取出轮到它的任务
+            cursors = [
+                iter(collection.find({**query, 'folderId': folder_id}, projection).sort([('fileBytes', 1), ('_id', 1)]).limit(room - len(tasks)))
+                for folder_id in lanes[priority]
+            ]
+            while cursors and len(tasks) < room:
+                for cursor in list(cursors):
+                    task = next(cursor, None)
+                    if task is None:
+                        cursors.remove(cursor)
+                        continue
+                    tasks.append(task)
+                    if len(tasks) == room:
+                        break
+        return tasks
+
+    def heartbeat(self, interval):
+        """续约本节点调度队列中和正在执行的任务"""
+        self.spawn(self.run_off_loop('任务续约失败', renew_leases, mongo_db.get_collection('tasks'), list(self.leased)))
+        self.loop.call_later(interval, self.heartbeat, interval)
+
+    def tune_profiles(self, interval):
+        """根据已完成任务的吞吐调整各网盘、各文件大小分类的传输参数档位"""
+        self.spawn(self.run_tuner())
+        self.loop.call_later(interval, self.tune_profiles, interval)
+
+    async def run_tuner(self):
+        for origin, size_class, level, target in await self.run_off_loop('调整传输参数失败', get_profile_tuner().tune) or []:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 网盘 {origin} {size_class} 文件传输档位 {level} -> {target}")
+
+    def check_task_to_queue(self, delay):
+        """兜底轮询, 通知丢失或数据库不支持 change stream 时保证任务最终被分发"""
+        self.dispatch()
         self.loop.call_later(delay, self.check_task_to_queue, delay)
 
     def add_task_with_delay(self, delay):
-        self.loop.call_later(delay, self.check_task_to_queue, delay)
+        # 本进程的扫描器通过 notify_new_tasks 唤醒, 其他进程写入的任务通过 change stream 唤醒
+        subscribe(self.trigger.wake)
+        TaskChangeWatcher(mongo_db.get_collection('tasks'), self.trigger.wake).start()
+        delay = min(delay, self.trigger.poll_seconds)
+        self.loop.call_soon(self.check_task_to_queue, delay)
+        self.loop.call_later(self.autoscaler.interval, self.autoscale, self.autoscaler.interval)
+        tune_interval = get_profile_tuner().interval
+        self.loop.call_later(tune_interval, self.tune_profiles, tune_interval)
+        heartbeat_interval = max(get_lease_seconds() // 3, 1)
+        self.loop.call_later(heartbeat_interval, self.heartbeat, heartbeat_interval)
         self.loop.run_forever()
\ No newline at end of file
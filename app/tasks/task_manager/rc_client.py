@@ -0,0 +1,173 @@
+import asyncio
+import base64
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from app.utils.env import get_env_int
+
+# rclone 调用方式: cli 每次操作启动一个 rclone 进程; rcd 通过常驻 rclone rcd 的 rc 接口调用
+_backend = os.environ.get('RCLONE_BACKEND', 'cli')
+# rc 接口地址, 未运行时自动在该地址启动 rclone rcd
+_rc_addr = os.environ.get('RCLONE_RC_ADDR', '127.0.0.1:5572')
+_rc_user = os.environ.get('RCLONE_RC_USER', '')
+_rc_pass = os.environ.get('RCLONE_RC_PASS', '')
+# 启动 rclone rcd 时的全局参数, 对通过 rc 执行的所有操作生效
+_rcd_flags = os.environ.get('RCLONE_RCD_FLAGS', '--use-server-modtime --timeout=4h --contimeout=10m --expect-continue-timeout=10m --low-level-retries=10')
+# 异步任务状态轮询间隔(毫秒)
+_rc_poll_ms = get_env_int('RCLONE_RC_POLL_MS', 500)
+
+
+class RcError(Exception):
+    """rc 接口调用失败"""
+
+
+class RcClient:
+    """
+    rclone rc 接口客户端
+
+    所有命令均为 POST JSON, 例如 operations/copyfile、operations/list、core/stats、job/status
+    """
+
+    def __init__(self, url, user='', password='', timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json'}
+        if user:
+            token = base64.b64encode(f'{user}:{password}'.encode('utf-8')).decode('ascii')
+            self.headers['Authorization'] = f'Basic {token}'
+
+    def call(self, command, params=None):
+        request = urllib.request.Request(
+            f'{self.url}/{command}',
+            data=json.dumps(params or {}).encode('utf-8'),
+            headers=self.headers,
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            try:
+                error_msg = json.loads(e.read()).get('error') or str(e)
+            except ValueError:
+                error_msg = str(e)
+            raise RcError(f"rc 命令 {command} 执行失败: {error_msg}")
+        except (urllib.error.URLError, OSError) as e:
+            raise RcError(f"无法连接 rclone rc 接口 {self.url}: {str(e)}")
+
+    def ping(self):
+        try:
+            self.call('rc/noop')
+            return True
+        except RcError:
+            return False
+
+    def start_job(self, command, params=None):
+        """以异步任务方式执行命令, 返回 jobid"""
+        return self.call(command, {**(params or {}), '_async': True})['jobid']
+
+    def wait_job(self, job_id, on_stats=None):
+        """
+        等待异步任务结束, 返回 job/status 的结果
+        :param on_stats: 每次轮询时以该任务的 core/stats 结果回调
+        """
+        while True:
+            status = self.call('job/status', {'jobid': job_id})
+            if on_stats:
+                on_stats(self.call('core/stats', {'group': f'job/{job_id}'}))
+            if status.get('finished'):
+                return status
+            time.sleep(_rc_poll_ms / 1000)
+
+    async def wait_job_async(self, job_id, on_stats=None):
+        """wait_job 的协程版本, 请求放到默认线程池, 轮询间隔不占用线程"""
+        while True:
+            status = await asyncio.to_thread(self.call, 'job/status', {'jobid': job_id})
+            if on_stats:
+                on_stats(await asyncio.to_thread(self.call, 'core/stats', {'group': f'job/{job_id}'}))
+            if status.get('finished'):
+                return status
+            await asyncio.sleep(_rc_poll_ms / 1000)
+
+
+class RcDaemon:
+    """常驻的 rclone rcd 进程, 多个进程共用同一个地址上的 rcd"""
+
+    def __init__(self, addr, user='', password=''):
+        self.addr = addr
+        self.user = user
+        self.password = password
+        self.proc = None
+        self.lock = threading.Lock()
+
+    def get_cmd(self):
+        cmd = ['rclone', 'rcd', f'--rc-addr={self.addr}'] + shlex.split(_rcd_flags)
+        if self.user:
+            return cmd + [f'--rc-user={self.user}', f'--rc-pass={self.password}']
+        return cmd + ['--rc-no-auth']
+
+    def ensure_running(self, client, timeout=10):
+        with self.lock:
+            if not client.ping():
+                self.start(client, timeout)
+            if self.proc is not None and self.proc.poll() is not None:
+                # 端口被其他进程的 rcd 占用时本进程启动的 rcd 会退出, 直接使用对方的 rcd
+                self.proc = None
+
+    def start(self, client, timeout):
+        if self.proc is None or self.proc.poll() is not None:
+            try:
+                self.proc = subprocess.Popen(self.get_cmd(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except FileNotFoundError:
+                raise Exception("Rclone未安装或未添加到系统PATH")
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 启动 rclone rcd: {self.addr}")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if client.ping():
+                return
+            time.sleep(0.1)
+        raise RcError(f"rclone rcd 启动超时: {self.addr}")
+
+
+_client = None
+_daemon = None
+_client_lock = threading.Lock()
+
+
+def get_rc_client():
+    """RCLONE_BACKEND=rcd 时返回可用的 rc 客户端, 否则返回 None"""
+    global _client, _daemon
+    if _backend != 'rcd':
+        return None
+    with _client_lock:
+        if _client is None:
+            client = RcClient(f'http://{_rc_addr}', _rc_user, _rc_pass)
+            _daemon = RcDaemon(_rc_addr, _rc_user, _rc_pass)
+            _daemon.ensure_running(client)
+            _client = client
+        elif _daemon.proc is not None and _daemon.proc.poll() is not None:
+            # 本进程启动的 rcd 已退出, 重新确认或启动
+            _daemon.ensure_running(_client)
+    return _client
+
+
+def split_fs_path(path):
+    """
+    拆分为 rc 接口使用的 (fs, remote)
+    例如 aliyun:photos/a.jpg -> ('aliyun:photos', 'a.jpg'), /data/a.jpg -> ('/data', 'a.jpg')
+    """
+    prefix = ''
+    if not path.startswith('/') and ':' in path:
+        prefix, path = path.split(':', 1)
+        prefix += ':'
+    path = path.rstrip('/')
+    if '/' not in path:
+        return prefix or '/', path
+    parent, name = path.rsplit('/', 1)
+    return prefix + (parent or '/'), name
@@ -1,18 +1,67 @@
+import asyncio
+import os
 import subprocess
 import json
 import re
 import sys
 import shlex
+import tempfile
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 from select import select
-import threading
 import time
+from collections import deque
 from app.utils.db import mongo_db
 from bson import ObjectId
+from pymongo import UpdateOne
 from app.utils.logger import Logger
+from app.tasks.task_manager.rc_client import get_rc_client, split_fs_path, RcError
+from app.tasks.task_manager.dispatch import notify_new_tasks
+from app.tasks.task_manager.leases import RELEASED, start_owned
+from app.tasks.task_manager.limits import get_origin_limiter
+from app.tasks.task_manager.profiles import get_profile_tuner, profile_flags, profile_rc_config
+from app.tasks.task_manager.log_sink import LOG_COLLECTION, TaskLogSink, append_task_logs
+from app.tasks.task_manager.retry import failure_fields
+from app.utils.env import get_env_int
+
+DEFAULT_RCLONE_FLAGS = '--use-server-modtime --no-traverse --timeout=4h --contimeout=10m --expect-continue-timeout=10m --low-level-retries=10 --retries=5 --retries-sleep=30s'
+# 以 JSON 日志输出每秒的传输统计, 代替解析 --progress 的文本输出
+STATS_FLAGS = ['--use-json-log', '--stats-log-level', 'NOTICE', '--stats', '1s']
+# 兼容自定义参数中带 --progress 时的文本进度
+PROGRESS_PATTERN = re.compile(
+    r'Transferred:\s+([\d.]+\s*\w*) / ([\d.]+\s*\w*),\s+(\d+)%,\s+([\d.]+\s*\w+)/s,\s+ETA\s+([\dwdhms]+|-)'
+)
+SIZE_UNITS = {'': 1, 'B': 1, 'KiB': 1 << 10, 'MiB': 1 << 20, 'GiB': 1 << 30, 'TiB': 1 << 40, 'PiB': 1 << 50}
+ETA_UNITS = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+# 读取 rclone 输出时单行的最大长度
+STREAM_LIMIT = 1 << 20
+# 传输进度写入数据库的间隔(毫秒), 期间的多次进度合并为一次写入
+_progress_write_ms = get_env_int('PROGRESS_WRITE_MS', 1000)
+# rcd 后端下批量任务改用 rclone 进程的提示只输出一次
+_batch_cli_logged = False
+
+
+def parse_size(text):
+    """'12.3 MiB' -> 字节数"""
+    match = re.fullmatch(r'([\d.]+)\s*(\w*)', text.strip())
+    if not match or match.group(2) not in SIZE_UNITS:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_eta(text):
+    """'1h2m3s' -> 秒数, '-' 表示未知"""
+    parts = re.findall(r'(\d+)([wdhms])', text)
+    if not parts:
+        return None
+    return sum(int(value) * ETA_UNITS[unit] for value, unit in parts)
+
 
 def get_rclone_config():
+    client = get_rc_client()
+    if client is not None:
+        return client.call('config/listremotes').get('remotes') or []
     try:
         result = subprocess.run(
             ['rclone', 'config', 'show'],
@@ -36,6 +85,14 @@ def get_rclone_config():
 
 def check_file_exists(remote_path):
     """检查远程文件是否存在"""
+    client = get_rc_client()
+    if client is not None:
+        fs, remote = split_fs_path(remote_path)
+        try:
+            return client.call('operations/stat', {'fs': fs, 'remote': remote}).get('item') is not None
+        except RcError:
+            # 上级目录不存在
+            return False
     try:
         result = subprocess.run(
             ['rclone', 'lsf', remote_path],
@@ -54,37 +111,46 @@ def check_file_exists(remote_path):
 
 class RcloneCommand:
     def __init__(self, params: dict):
-        self.task_id = ObjectId(params['task_id'])
-        self.other = params.get('other', '--progress --use-server-modtime --no-traverse --timeout=4h --contimeout=10m --expect-continue-timeout=10m --low-level-retries=10 --retries=5 --retries-sleep=30s')
+        self.other = params.get('other', DEFAULT_RCLONE_FLAGS)
+        # 未指定附加参数时按文件大小和网盘选择传输参数
+        self.use_profile = 'other' not in params
+        self.profile = {}
+        self.backend_type = None
         self.collection = mongo_db.get_collection('tasks')
         self.folder_collection = mongo_db.get_collection('folders')
+        # 尚未写入数据库的最新进度
+        self.pending_progress = None
+        self.logger = Logger()
+        # 当前速度和执行结果, 供线程池采样
+        self.speed_bps = 0
+        self.succeeded = 0
+        self.failed = 0
+        # 最近的错误输出, 失败时用于判断能否重试
+        self.error_lines = deque(maxlen=20)
+        # 以 rclone 进程执行时的限速登记, 用于取得该进程的 rc 接口地址
+        self.slot = None
+        self.load(params)
+
+    def load(self, params):
+        """读取要上传的任务"""
+        self.task_id = ObjectId(params['task_id'])
         self.task = self.collection.find_one({'_id': self.task_id})
-        self.last_time = time.time()
         self.created_at = self.task['created_at']
-        self.logger = Logger()
+        self.log_sink = TaskLogSink(mongo_db.get_collection(LOG_COLLECTION), self.task_id)
 
     def update_fields(self, fields_to_update):
         """
         通用字段更新方法
-        :param fields_to_update: 字典类型，key为字段名，value为要更新或追加的值
-        :return: UpdateResult
+        :param fields_to_update: 字典类型，key为字段名，value为要更新的值; logs 写入日志缓冲, 不再追加到任务文档
+        :return: UpdateResult, 只有日志时为 None
         """
-        # 构建聚合管道更新操作
-        set_stage = {}
-        for field, value in fields_to_update.items():
-            if field == "logs":
-                # 对 logs 字段特殊处理：字符串追加
-                set_stage[field] = {"$concat": [{"$ifNull": [f"${field}", ""]}, value]}
-            else:
-                # 其他字段直接赋值
-                set_stage[field] = value
-
-        # 执行更新
-        result = self.collection.update_one(
-            {"_id": self.task_id},
-            [{"$set": set_stage}]
-        )
-        return result
+        fields_to_update = dict(fields_to_update)
+        logs = fields_to_update.pop('logs', None)
+        if logs:
+            self.log_sink.write(logs)
+        if not fields_to_update:
+            return None
+        return self.collection.update_one({"_id": self.task_id}, {"$set": fields_to_update})
 
 
     def parse_rclone_flags(self):
@@ -99,8 +165,30 @@ class RcloneCommand:
             print(f"无法解析 rclone 参数字符串: {self.other!r}\n错误信息: {e}")
             return []
 
-    def get_cmd(self):
-        return ['rclone', 'copy', self.task['localPath'], f"{self.task['origin']}:{self.task['remotePath']}"] + self.parse_rclone_flags()
+    @staticmethod
+    def transfer_mode_flags(transfer_mode):
+        if transfer_mode == 'server-side':
+            return ['--server-side-across-configs']
+        if transfer_mode == 'stream':
+            # 禁用服务端复制, 经本机下载再上传
+            return ['--disable', 'Copy']
+        return []
+
+    def get_cmd(self, transfer_mode=None):
+        cmd = ['rclone', 'copy', self.task['localPath'], f"{self.task['origin']}:{self.task['remotePath']}"] + self.parse_rclone_flags() + STATS_FLAGS
+        cmd += profile_flags(self.profile, self.backend_type)
+        return cmd + self.transfer_mode_flags(transfer_mode or self.task.get('transferMode'))
+
+    def select_profile(self, origin, size):
+        """按文件大小分类和网盘当前档位选择传输参数, 返回 (分类, 档位)"""
+        if not self.use_profile:
+            return None, None
+        try:
+            self.backend_type = get_origin_type(origin)
+        except Exception:
+            self.backend_type = None
+        size_class, level, self.profile = get_profile_tuner().get_profile(origin, size, self.backend_type)
+        return size_class, level
 
     @staticmethod
     def parse_rclone_progress(line):
@@ -109,103 +197,308 @@ class RcloneCommand:
         :param line: 进度信息字符串
         :return: 解析后的进度信息字典
         """
-        progress_pattern = re.compile(
-            r'Transferred:\s+([\d.]+\s*\w*) / ([\d.]+\s*\w*),\s+(\d+)%,\s+([\d.]+\s*\w+/s),\s+ETA\s+([\dwdhms]+)'
-        )
-        match = progress_pattern.search(line)
+        match = PROGRESS_PATTERN.search(line)
         if match:
             return {
                 'current': match.group(1),
                 'total': match.group(2),
                 'percent': match.group(3),
-                'speed': match.group(4),
-                'eta': match.group(5)
+                'speed': match.group(4) + '/s',
+                'eta': match.group(5),
+                'bytesDone': parse_size(match.group(1)),
+                'bytesTotal': parse_size(match.group(2)),
+                'speedBps': parse_size(match.group(4)),
+                'etaSeconds': parse_eta(match.group(5)),
             }
         return None
 
+    @staticmethod
+    def format_bytes(size):
+        for unit in ('B', 'KiB', 'MiB', 'GiB'):
+            if size < 1024:
+                return f'{size:.3f} {unit}' if unit != 'B' else f'{size} B'
+            size /= 1024
+        return f'{size:.3f} TiB'
+
+    @classmethod
+    def parse_stats(cls, stats):
+        """
+        解析 JSON 日志中的 stats 或 rc 接口 core/stats 的结果
+        数值字段 bytesDone/bytesTotal/speedBps/etaSeconds 用于排序和统计, 字符串字段用于展示
+        """
+        total = stats.get('totalBytes') or 0
+        if not total:
+            return None
+        done = stats.get('bytes') or 0
+        speed = stats.get('speed') or 0
+        eta = stats.get('eta')
+        return {
+            'current': cls.format_bytes(done),
+            'total': cls.format_bytes(total),
+            'percent': str(int(done * 100 / total)),
+            'speed': cls.format_bytes(speed) + '/s',
+            'eta': f'{int(eta)}s' if eta is not None else '-',
+            'bytesDone': done,
+            'bytesTotal': total,
+            'speedBps': speed,
+            'etaSeconds': int(eta) if eta is not None else None,
+        }
+
+    @staticmethod
+    def format_progress(progress):
+        return 'Transferred: {current} / {total}, {percent}%, {speed}, ETA {eta}'.format(**progress)
+
+    @staticmethod
+    def parse_json_log(line):
+        """--use-json-log 输出的一行日志, 不是 JSON 时返回 None"""
+        line = line.strip()
+        if not line.startswith('{'):
+            return None
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+        return entry if isinstance(entry, dict) else None
+
+    def log(self, text):
+        """在事件循环中记录日志, 只写入缓冲, 由 write_updates 在线程中写入数据库"""
+        self.log_sink.append(text)
+
+    def record_progress(self, params):
+        """记录最新进度, 由 write_updates 每隔 _progress_write_ms 合并写入一次"""
+        self.speed_bps = params.get('speedBps') or 0
+        self.pending_progress = {
+            'progress': params.get('percent'),
+            'speed': params.get('speed'),
+            'eta': params.get('eta'),
+            'current': params.get('current'),
+            'total': params.get('total'),
+            'bytesDone': params.get('bytesDone'),
+            'bytesTotal': params.get('bytesTotal'),
+            'speedBps': params.get('speedBps'),
+            'etaSeconds': params.get('etaSeconds'),
+        }
+
     def callback(self, params, line=''):
-        now = time.time()
-        if now - self.last_time > 1 and params:
-            self.update_fields({
-                'progress': params.get('percent'),
-                'speed': params.get('speed'),
-                'eta': params.get('eta'),
-                'current': params.get('current'),
-                'total': params.get('total'),
-                'logs': "\n" + line
-            })
-            self.last_time = now
+        if params:
+            self.record_progress(params)
+        self.log("\n" + line)
+
+    def write_updates(self, progress):
+        """在线程中写入合并后的进度和到期的日志缓冲"""
+        if progress:
+            self.update_fields(progress)
+        if self.log_sink.due():
+            self.log_sink.flush()
+
+    async def write_updates_periodically(self, stop):
+        while True:
+            try:
+                await asyncio.wait_for(stop.wait(), _progress_write_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            progress, self.pending_progress = self.pending_progress, None
+            try:
+                await asyncio.to_thread(self.write_updates, progress)
+            except Exception as e:
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 写入传输进度失败: {str(e)}")
+            if stop.is_set():
+                return
+
+    @asynccontextmanager
+    async def progress_writer(self):
+        """传输期间定时在线程中写入进度, 每个任务同一时间最多一次写入; 退出时写入最后的进度"""
+        stop = asyncio.Event()
+        writer = asyncio.create_task(self.write_updates_periodically(stop))
+        try:
+            yield
+        finally:
+            stop.set()
+            await writer
+
+    def handle_log(self, entry):
+        """处理一条 JSON 日志: 统计信息更新进度, 其余写入任务日志"""
+        if self.slot is not None and self.slot.detect_rc_url(entry.get('msg', '')):
+            return
+        if 'stats' in entry:
+            progress = self.parse_stats(entry['stats'])
+            if progress:
+                self.callback(progress, self.format_progress(progress))
             return
-        self.update_fields({'logs': "\n" + line})
+        if entry.get('level') in ('error', 'critical'):
+            self.error_lines.append(entry.get('msg', ''))
+            self.log("\nerror:::: " + entry.get('msg', ''))
+        else:
+            self.log("\n" + entry.get('msg', ''))
 
-    def stream_reader(self, stream, is_error=False):
+    def handle_line(self, line, is_error=False):
         """
-        读取并解析rclone的输出流
-        :param stream: 输出流
-        :param is_error: 是否是错误流
+        解析rclone输出的一行
+        :param line: 输出内容
+        :param is_error: 是否来自错误流
         """
-        for line in iter(stream.readline, ''):
-            if is_error:
-                sys.stderr.write(line)
-                sys.stderr.flush()
-                self.update_fields({'logs': "\nerror:::: " + line})
-            else:
-                progress = self.parse_rclone_progress(line)
-                if progress:
-                    self.callback(progress, line)
-                sys.stdout.write(line)
-                sys.stdout.flush()
-        stream.close()
-
-    def run(self):
-        self.created_at = datetime.now()
-        self.update_fields({'status': 2, 'startedAt': self.created_at})
-        cmd = self.get_cmd()
-        proc = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                universal_newlines=True,
-                encoding='utf-8'
-            )
-        # 创建独立线程读取输出流
-        stdout_thread = threading.Thread(
-            target=self.stream_reader,
-            args=(proc.stdout, False)
-        )
-        stderr_thread = threading.Thread(
-            target=self.stream_reader,
-            args=(proc.stderr, True)
+        entry = self.parse_json_log(line)
+        if entry is not None:
+            self.handle_log(entry)
+        elif is_error:
+            self.error_lines.append(line)
+            self.log("\nerror:::: " + line)
+        else:
+            progress = self.parse_rclone_progress(line)
+            if progress:
+                self.callback(progress, line)
+        output = sys.stderr if is_error else sys.stdout
+        output.write(line)
+        output.flush()
+
+    async def stream_reader(self, stream, is_error=False):
+        """逐行读取子进程的输出流直到结束"""
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            self.handle_line(line.decode('utf-8', errors='replace'), is_error)
+
+    def get_rc_params(self, transfer_mode=None):
+        """operations/copyfile 的参数, 传输方式通过 _config 设置"""
+        src_fs, src_remote = split_fs_path(self.task['localPath'])
+        params = {
+            'srcFs': src_fs,
+            'srcRemote': src_remote,
+            'dstFs': f"{self.task['origin']}:{self.task['remotePath']}",
+            'dstRemote': self.task['fileName'],
+        }
+        if self.profile.get('chunk') and self.backend_type:
+            # 分块大小是后端参数, 通过连接字符串设置, 例如 onedrive,chunk_size=20M:backup
+            params['dstFs'] = f"{self.task['origin']},chunk_size={self.profile['chunk']}:{self.task['remotePath']}"
+        config = profile_rc_config(self.profile)
+        transfer_mode = transfer_mode or self.task.get('transferMode')
+        if transfer_mode == 'server-side':
+            config['ServerSideAcrossConfigs'] = True
+        elif transfer_mode == 'stream':
+            config['DisableFeatures'] = ['Copy']
+        if config:
+            params['_config'] = config
+        return params
+
+    async def transfer(self, transfer_mode=None):
+        """执行一次复制, 返回 (退出码, 命令); rcd 后端通过 rc 接口复制, 不再启动 rclone 进程"""
+        client = await asyncio.to_thread(get_rc_client)
+        # 按网盘设置限速, 其他传输开始或结束时重新分配带宽; 有单独限制的网盘不使用 rcd
+        async with get_origin_limiter().transfer(self.task['origin'], client) as slot, self.progress_writer():
+            if slot.rc_client is None:
+                self.slot = slot
+                cmd = self.get_cmd(transfer_mode) + slot.flags()
+                return await self.execute(cmd, slot.env()), cmd
+            params = self.get_rc_params(transfer_mode)
+            return await self.execute_rc(slot.rc_client, params), ['operations/copyfile', params]
+
+    async def execute_rc(self, client, params):
+        """通过 rc 异步任务复制并轮询 core/stats 更新进度, 返回退出码"""
+        def on_stats(stats):
+            progress = self.parse_stats(stats)
+            if progress:
+                self.callback(progress, self.format_progress(progress))
+
+        try:
+            job_id = await asyncio.to_thread(client.start_job, 'operations/copyfile', params)
+            job = await client.wait_job_async(job_id, on_stats)
+        except RcError as e:
+            self.error_lines.append(str(e))
+            self.log("\nerror:::: " + str(e))
+            return 1
+        if not job.get('success'):
+            self.error_lines.append(job.get('error') or '')
+            self.log("\nerror:::: " + (job.get('error') or '未知错误'))
+            return 1
+        return 0
+
+    async def execute(self, cmd, env=None):
+        """
+        执行 rclone 命令并实时解析输出, 返回退出码
+        子进程的两个输出流都由事件循环读取, 不再为每个传输创建线程; 被取消时结束 rclone 进程
+        :param env: 追加给 rclone 进程的环境变量
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT,
+            env={**os.environ, **env} if env else None
         )
+        try:
+            await asyncio.gather(self.stream_reader(proc.stdout), self.stream_reader(proc.stderr, True))
+            return await proc.wait()
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
 
-        stdout_thread.start()
-        stderr_thread.start()
+    async def run(self):
+        """在事件循环中执行; 读写数据库等阻塞操作放到默认线程池"""
+        try:
+            await self.run_transfer()
+        finally:
+            await asyncio.to_thread(self.log_sink.flush)
 
-        # 等待子进程结束
-        proc.wait()
+    def start(self):
+        """选择传输参数并把任务置为上传中, 租约已失效时返回 False"""
+        self.created_at = datetime.now()
+        size_class, level = self.select_profile(self.task['origin'], self.task.get('fileBytes'))
+        fields = {'status': 2, 'startedAt': self.created_at}
+        if size_class:
+            # 记录使用的档位, 完成后的吞吐用于自动调整
+            fields['profile'] = {'sizeClass': size_class, 'level': level}
+        if not start_owned(self.collection, [self.task_id], fields):
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 任务 {self.task['fileName']} 的租约已失效, 跳过")
+            return False
+        return True
 
-        # 确保线程完成
-        stdout_thread.join()
-        stderr_thread.join()
+    async def run_transfer(self):
+        if not await asyncio.to_thread(self.start):
+            return
+        returncode, cmd = await self.transfer()
+        if returncode != 0 and self.task.get('transferMode') == 'server-side':
+            # 服务端复制失败时回退为经本机中转的复制, 并记录实际使用的方式
+            await asyncio.to_thread(self.update_fields, {'logs': f"\n服务端复制失败: {returncode}, 改为经本机复制", 'transferMode': 'stream'})
+            returncode, cmd = await self.transfer('stream')
+        await asyncio.to_thread(self.finish, returncode, cmd)
 
-        if proc.returncode != 0:
+    def finish(self, returncode, cmd):
+        """按退出码写回任务结果"""
+        self.speed_bps = 0
+        if returncode != 0:
+            self.failed = 1
+            fields, retry = failure_fields(self.task.get('attempts'), returncode, self.error_lines)
             self.update_fields({
-                'logs': f"\nRclone命令执行失败: {proc.returncode} 命令:{cmd}",
-                'status': 4,
+                'logs': f"\nRclone命令执行失败: {returncode} 命令:{cmd}",
+                **fields,
                 'finishedAt': datetime.now(),
                 'duration': str(datetime.now() - self.created_at),
+                **RELEASED,
             })
-            self.logger.add_log({
-                'name': '任务失败',
-                'description': f'任务 {self.task["fileName"]} 执行失败 耗时: {str(datetime.now() - self.created_at)} 命令: {cmd} 上传开始时间: {self.created_at} 上传结束时间: {datetime.now()}'
-            })
+            if retry:
+                notify_new_tasks((fields['nextRetryAt'] - datetime.now()).total_seconds())
+                self.logger.add_log({
+                    'name': '任务重试',
+                    'description': f'任务 {self.task["fileName"]} 第 {fields["attempts"]} 次执行失败({fields["lastError"]}), 将于 {fields["nextRetryAt"].strftime("%Y-%m-%d %H:%M:%S")} 重试 命令: {cmd}'
+                })
+            else:
+                self.logger.add_log({
+                    'name': '任务失败',
+                    'description': f'任务 {self.task["fileName"]} 执行失败({fields["lastError"]}) 耗时: {str(datetime.now() - self.created_at)} 命令: {cmd} 上传开始时间: {self.created_at} 上传结束时间: {datetime.now()}'
+                })
         else:
+            self.succeeded = 1
+            elapsed = (datetime.now() - self.created_at).total_seconds()
             self.update_fields({
                 'logs': '\nRclone命令执行成功',
                 'status': 3,
                 'finishedAt': datetime.now(),
                 'duration': str(datetime.now() - self.created_at),
+                'throughputBps': int((self.task.get('fileBytes') or 0) / elapsed) if elapsed > 0 else None,
+                'nextRetryAt': None,
+                **RELEASED,
             })
             self.folder_collection.update_one({"_id": self.task['folderId']}, {"$inc": {'uploadNum': 1}, '$set': {'lastSyncAt': datetime.now()}})
             self.logger.add_log({
@@ -214,7 +507,166 @@ class RcloneCommand:
             })
 
 
+class BatchRcloneCommand(RcloneCommand):
+    """
+    将源根目录和目标根目录相同的多个任务合并为一次 rclone copy --files-from-raw
+
+    通过 --use-json-log 输出的逐文件日志(object 字段为相对路径)把结果写回各个任务.
+    rcd 后端下也启动 rclone 进程执行: rc 的 sync/copy 只能从 core/transferred 取得最近 100 个文件的结果,
+    无法可靠地把逐文件结果写回任务
+    """
+    SUCCESS_PREFIXES = ('Copied', 'Moved', 'Unchanged skipping')
+
+    def load(self, params):
+        self.task_ids = [ObjectId(task_id) for task_id in params['task_ids']]
+        self.files = params['files']
+        self.origin = params['origin']
+        self.src_root = params['src_root']
+        self.dst_root = params['dst_root']
+        self.transfer_mode = params.get('transferMode')
+        self.transfers = params.get('transfers', 4)
+        # 批量任务按平均文件大小选择参数, 不参与自动调整
+        self.select_profile(self.origin, (params.get('bytes') or 0) / max(len(self.files), 1))
+        # 相对路径 -> 任务 ID
+        self.task_by_file = dict(zip(self.files, self.task_ids))
+        # 相对路径 -> (是否成功, 日志)
+        self.results = {}
+        self.created_at = datetime.now()
+
+    def get_cmd(self, files_from, transfer_mode=None):
+        return [
+            'rclone', 'copy', self.src_root, f"{self.origin}:{self.dst_root}",
+            '--files-from-raw', files_from,
+            '--transfers', str(self.transfers), '-v',
+        ] + self.parse_rclone_flags() + STATS_FLAGS + profile_flags(self.profile, self.backend_type) + self.transfer_mode_flags(transfer_mode or self.transfer_mode)
+
+    def handle_log(self, entry):
+        """记录单个文件的结果, 同一文件以最后一条日志为准(rclone 重试后可能先失败再成功)"""
+        if self.slot is not None and self.slot.detect_rc_url(entry.get('msg', '')):
+            return
+        if 'stats' in entry:
+            progress = self.parse_stats(entry['stats'])
+            if progress:
+                self.callback(progress)
+            return
+        path = entry.get('object')
+        if path not in self.task_by_file:
+            return
+        message = entry.get('msg', '')
+        if entry.get('level') == 'error':
+            self.results[path] = (False, message)
+        elif message.startswith(self.SUCCESS_PREFIXES):
+            self.results[path] = (True, message)
+
+    def callback(self, params, line=''):
+        if params:
+            self.record_progress(params)
+
+    def write_updates(self, progress):
+        if progress:
+            # 批量任务只有整体进度, 同步到所有仍在上传中的任务
+            self.collection.update_many({'_id': {'$in': self.task_ids}, 'status': 2}, {'$set': progress})
+
+    def handle_line(self, line, is_error=False):
+        entry = self.parse_json_log(line)
+        if entry is not None:
+            self.handle_log(entry)
+            return
+        progress = self.parse_rclone_progress(line)
+        if progress:
+            self.callback(progress, line)
+        output = sys.stderr if is_error else sys.stdout
+        output.write(line)
+        output.flush()
+
+    def start(self):
+        """把仍持有租约的任务置为上传中, 全部失效时返回 False"""
+        owned = set(start_owned(self.collection, self.task_ids, {'status': 2, 'startedAt': self.created_at}))
+        if len(owned) < len(self.task_ids):
+            # 租约失效的任务已被其他节点领取, 不再上传
+            self.task_by_file = {path: task_id for path, task_id in self.task_by_file.items() if task_id in owned}
+            self.files = list(self.task_by_file)
+            self.task_ids = list(self.task_by_file.values())
+        return bool(self.files)
+
+    async def run(self):
+        if not await asyncio.to_thread(self.start):
+            return
+        global _batch_cli_logged
+        if not _batch_cli_logged and await asyncio.to_thread(get_rc_client) is not None:
+            _batch_cli_logged = True
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] rcd 后端下批量任务仍启动 rclone 进程执行, 设置 BATCH_MAX_FILES=1 可全部通过 rcd 上传")
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt', delete=False) as f:
+            f.write('\n'.join(self.files) + '\n')
+            files_from = f.name
+        try:
+            async with get_origin_limiter().transfer(self.origin) as slot, self.progress_writer():
+                self.slot = slot
+                cmd = self.get_cmd(files_from) + slot.flags()
+                returncode = await self.execute(cmd, slot.env())
+        finally:
+            os.remove(files_from)
+        await asyncio.to_thread(self.finish, returncode, cmd)
+
+    def finish(self, returncode, cmd):
+        self.speed_bps = 0
+        finished_at = datetime.now()
+        duration = str(finished_at - self.created_at)
+        summary = f"批量任务 {len(self.files)} 个文件, 退出码: {returncode} 命令:{cmd}"
+        operations = []
+        logs = {}
+        succeeded = []
+        failed = 0
+        retried = []
+        attempts = {
+            task['_id']: task.get('attempts')
+            for task in self.collection.find({'_id': {'$in': self.task_ids}}, {'attempts': 1})
+        }
+        for path, task_id in self.task_by_file.items():
+            ok, message = self.results.get(path, (returncode == 0, '' if returncode == 0 else '未返回该文件的结果'))
+            logs[task_id] = [summary, message] if message else [summary]
+            if ok:
+                fields = {'status': 3, 'progress': '100', 'nextRetryAt': None}
+                succeeded.append(task_id)
+            elif self.transfer_mode == 'server-side':
+                # 服务端复制失败的文件改为经本机复制, 重新排队
+                fields = {'status': 0, 'transferMode': 'stream'}
+                logs[task_id].append('服务端复制失败, 改为经本机复制')
+            else:
+                fields, retry = failure_fields(attempts.get(task_id), returncode, [message])
+                if retry:
+                    retried.append(fields['nextRetryAt'])
+                    logs[task_id].append(f"第 {fields['attempts']} 次执行失败({fields['lastError']}), 将于 {fields['nextRetryAt'].strftime('%Y-%m-%d %H:%M:%S')} 重试")
+                else:
+                    failed += 1
+            fields.update({'finishedAt': finished_at, 'duration': duration, **RELEASED})
+            operations.append(UpdateOne({'_id': task_id}, {'$set': fields}))
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+        self.succeeded, self.failed = len(succeeded), failed + len(retried)
+        if len(succeeded) + failed + len(retried) < len(operations):
+            # 有任务改为经本机复制后重新排队
+            notify_new_tasks()
+        if retried:
+            notify_new_tasks((min(retried) - finished_at).total_seconds())
+        append_task_logs(mongo_db.get_collection(LOG_COLLECTION), logs)
+
+        # 按文件夹累加上传数量
+        folder_counts = {}
+        for task in self.collection.find({'_id': {'$in': succeeded}}, {'folderId': 1}):
+            folder_counts[task['folderId']] = folder_counts.get(task['folderId'], 0) + 1
+        for folder_id, count in folder_counts.items():
+            self.folder_collection.update_one({'_id': folder_id}, {'$inc': {'uploadNum': count}, '$set': {'lastSyncAt': finished_at}})
+        self.logger.add_log({
+            'name': '批量任务完成' if not failed else '批量任务部分失败',
+            'description': f'批量任务 {self.src_root} -> {self.origin}:{self.dst_root} 共 {len(self.files)} 个文件, 成功 {len(succeeded)} 个, 失败 {failed} 个, 等待重试 {len(retried)} 个 耗时: {duration}'
+        })
+
+
 def get_origin_size(origin_id):
+    client = get_rc_client()
+    if client is not None:
+        return json.dumps(client.call('operations/size', {'fs': origin_id + ':'}))
     try:
         result = subprocess.run(
             ['rclone', 'size', origin_id + ':', '--json', '--fast-list'],
@@ -253,27 +705,245 @@ def get_rclone_origin_list():
             continue
     return result
 
+def iter_json_array(stream, chunk_size=1 << 16):
+    """
+    增量解析 JSON 数组, 逐个产出数组元素, 不需要一次读入全部输出
+    :param stream: 文本流, 内容形如 [{...},{...}]
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        # rclone 每行输出一个元素, 按行读取可以在子进程输出的同时解析
+        chunk = stream.readline(chunk_size)
+        eof = not chunk
+        buffer += chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise json.JSONDecodeError('应为 JSON 数组', buffer, pos)
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, pos_end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # 元素不完整, 等待更多数据
+                break
+            yield item
+            pos = pos_end
+        buffer = buffer[pos:]
+        if eof:
+            if started:
+                raise json.JSONDecodeError('JSON 数组不完整', buffer, 0)
+            return
+
+
+def iter_lsjson(args, missing_ok=False):
+    '''
+     流式执行 rclone lsjson, 边读取边逐条产出文件信息, 内存占用与文件数量无关
+     :param args: lsjson 的参数, 例如 ['aliyun:backup', '-R', '--files-only']
+     :param missing_ok: 目录不存在(退出码3)时视为空目录
+    '''
+    # stderr 写入临时文件, 避免管道写满导致子进程阻塞
+    with tempfile.TemporaryFile(mode='w+', encoding='utf-8') as stderr:
+        try:
+            proc = subprocess.Popen(
+                ['rclone', 'lsjson'] + args,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                encoding='utf-8'
+            )
+        except FileNotFoundError:
+            raise Exception("Rclone未安装或未添加到系统PATH")
+        try:
+            try:
+                yield from iter_json_array(proc.stdout)
+            except json.JSONDecodeError:
+                if proc.wait() == 0:
+                    raise Exception("解析rclone文件列表输出失败")
+            returncode = proc.wait()
+            if returncode == 3 and missing_ok:
+                return
+            if returncode != 0:
+                stderr.seek(0)
+                error_msg = stderr.read() or '未知错误'
+                raise Exception(f"执行rclone命令失败: {error_msg}")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+
+
+def hash_flags(hash_type):
+    """lsjson 输出指定类型哈希的参数"""
+    return ['--hash', '--hash-type', hash_type] if hash_type else []
+
+
+# rclone 过滤参数对应的 rc _filter 字段
+RC_FILTER_OPTIONS = {'--filter': 'FilterRule', '--include': 'IncludeRule', '--exclude': 'ExcludeRule'}
+
+
+def rc_filter(filter_flags):
+    """把 ['--filter', '- node_modules/**'] 形式的过滤参数转换为 rc 的 _filter"""
+    options = {}
+    for flag, value in zip(filter_flags[::2], filter_flags[1::2]):
+        if flag not in RC_FILTER_OPTIONS:
+            raise ValueError(f'rc 接口不支持过滤参数 {flag}')
+        options.setdefault(RC_FILTER_OPTIONS[flag], []).append(value)
+    return options
+
+
+def iter_rc_list(client, fs, hash_type=None, recurse=True, max_depth=None, filter_flags=(), missing_ok=False):
+    '''
+     通过 rc 的 operations/list 列出文件, 条目格式与 lsjson 相同
+     rc 接口一次返回完整列表, 不能像 lsjson 一样边输出边解析
+     :param missing_ok: 目录不存在时视为空目录
+    '''
+    params = {'fs': fs, 'remote': '', 'opt': {'recurse': recurse, 'filesOnly': True, 'noMimeType': True}}
+    if hash_type:
+        params['opt'].update({'showHash': True, 'hashTypes': [hash_type]})
+    if max_depth is not None:
+        params['_config'] = {'MaxDepth': max_depth}
+    if filter_flags:
+        params['_filter'] = rc_filter(list(filter_flags))
+    try:
+        result = client.call('operations/list', params)
+    except RcError as e:
+        if missing_ok and 'directory not found' in str(e):
+            return
+        raise
+    yield from result.get('list') or []
+
+
+def iter_origin_files(origin_path, max_depth, hash_type=None, filter_flags=()):
+    '''
+     流式列出远程目录下的文件, rcd 后端通过 rc 接口列出
+     > rclone lsjson aliyun: --max-depth 3 --files-only
+     :param filter_flags: rclone 过滤参数, 例如 ['--filter', '- node_modules/**']
+    '''
+    client = get_rc_client()
+    if client is not None:
+        return iter_rc_list(client, origin_path, hash_type, max_depth=max_depth, filter_flags=filter_flags)
+    return iter_lsjson([origin_path, '--max-depth', str(max_depth), '--files-only', '--no-mimetype'] + hash_flags(hash_type) + list(filter_flags))
+
+
 def get_origin_files(origin_path, max_depth):
     '''
      > rclone lsjson aliyun: --max-depth 3 --files-only
     '''
-    try:
-        result = subprocess.run(
-            ['rclone', 'lsjson', origin_path, '--max-depth', str(max_depth), '--files-only'],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            encoding='utf-8'
-        )
+    return list(iter_origin_files(origin_path, max_depth))
+
+
+def list_origin_tree(remote_path, hash_type=None):
+    '''
+     流式递归列出目标目录下的所有文件, 目录不存在时不产出任何条目; rcd 后端通过 rc 接口列出
+     > rclone lsjson aliyun:backup -R --files-only --no-mimetype
+    '''
+    client = get_rc_client()
+    if client is not None:
+        return iter_rc_list(client, remote_path, hash_type, missing_ok=True)
+    return iter_lsjson([remote_path, '-R', '--files-only', '--no-mimetype'] + hash_flags(hash_type), missing_ok=True)
+
+
+def list_origin_dir(remote_path):
+    '''
+     流式列出目标目录下一层的文件, 目录不存在时不产出任何条目; rcd 后端通过 rc 接口列出
+     > rclone lsjson aliyun:backup --files-only --no-mimetype
+    '''
+    client = get_rc_client()
+    if client is not None:
+        return iter_rc_list(client, remote_path, recurse=False, missing_ok=True)
+    return iter_lsjson([remote_path, '--files-only', '--no-mimetype'], missing_ok=True)
+
+
+_origin_features = {}
+
+
+def get_origin_features(origin):
+    '''
+     获取网盘后端支持的功能和哈希类型(按网盘缓存)
+     > rclone backend features aliyun:
+    '''
+    if origin not in _origin_features:
+        client = get_rc_client()
+        if client is not None:
+            _origin_features[origin] = client.call('operations/fsinfo', {'fs': f'{origin}:'})
+            return _origin_features[origin]
         try:
-            return json.loads(result.stdout)
-        except Exception as e:
-            raise Exception(f"执行rclone命令失败: {e}")
+            result = subprocess.run(
+                ['rclone', 'backend', 'features', f'{origin}:'],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                encoding='utf-8'
+            )
+            _origin_features[origin] = json.loads(result.stdout)
+        except FileNotFoundError:
+            raise Exception("Rclone未安装或未添加到系统PATH")
+        except subprocess.CalledProcessError as e:
+            error_msg = e.stderr or '未知错误'
+            raise Exception(f"执行rclone命令失败: {error_msg}")
+        except json.JSONDecodeError:
+            raise Exception("解析rclone后端功能输出失败")
+    return _origin_features[origin]
 
-    except FileNotFoundError:
-        raise Exception("Rclone未安装或未添加到系统PATH")
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stderr or '未知错误'
-        raise Exception(f"执行rclone命令失败: {error_msg}")
-    except json.JSONDecodeError:
-        raise Exception("解析rclone配置输出失败")
\ No newline at end of file
+
+def get_origin_hashes(origin):
+    """网盘支持的哈希类型, 例如 ['md5', 'sha1']"""
+    return get_origin_features(origin).get('Hashes') or []
+
+
+_origin_types = {}
+
+
+def get_origin_type(origin):
+    '''
+     获取网盘的后端类型, 例如 drive、s3、onedrive
+     > rclone config dump
+    '''
+    if origin not in _origin_types:
+        client = get_rc_client()
+        if client is not None:
+            for name, config in client.call('config/dump').items():
+                _origin_types[name] = config.get('type')
+            return _origin_types.get(origin)
+        try:
+            result = subprocess.run(
+                ['rclone', 'config', 'dump'],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                encoding='utf-8'
+            )
+            for name, config in json.loads(result.stdout).items():
+                _origin_types[name] = config.get('type')
+        except FileNotFoundError:
+            raise Exception("Rclone未安装或未添加到系统PATH")
+        except subprocess.CalledProcessError as e:
+            error_msg = e.stderr or '未知错误'
+            raise Exception(f"执行rclone命令失败: {error_msg}")
+        except json.JSONDecodeError:
+            raise Exception("解析rclone配置输出失败")
+    return _origin_types.get(origin)
+
+
+def supports_server_side_copy(source_origin, origin):
+    """
+    两个网盘之间能否服务端复制(数据不经过本机)
+    - 同一网盘: 后端支持 Copy 即可
+    - 不同网盘: 需为同一后端类型, 复制时加上 --server-side-across-configs
+    """
+    if not get_origin_features(origin).get('Features', {}).get('Copy'):
+        return False
+    return source_origin == origin or get_origin_type(source_origin) == get_origin_type(origin)
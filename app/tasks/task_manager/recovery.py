@@ -0,0 +1,96 @@
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from app.tasks.task_manager.inventory import normalize_remote_path
+from app.tasks.task_manager.leases import RELEASED, get_node_id
+from app.tasks.task_manager.log_sink import append_task_logs
+from app.tasks.task_manager.rclone_operator import list_origin_dir
+
+# 目标端修改时间的误差(秒), 部分网盘只精确到秒
+MODTIME_TOLERANCE = 1
+
+
+def parse_mod_time(value):
+    """解析 rclone 的 ModTime, 例如 2024-01-02T03:04:05.123456789+08:00 或以 Z 结尾, 返回时间戳"""
+    match = re.fullmatch(r'(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)?', value or '')
+    if not match:
+        return None
+    text = match.group(1) + '.' + (match.group(2) or '0')[:6].ljust(6, '0')
+    zone = match.group(3)
+    text += '+00:00' if zone in (None, 'Z') else zone
+    return datetime.fromisoformat(text).astimezone(timezone.utc).timestamp()
+
+
+def source_stat(task):
+    """本地源文件的 (大小, 修改时间), 远程来源或文件已删除时以任务记录的大小为准"""
+    try:
+        stat = os.stat(task['localPath'])
+    except (OSError, TypeError):
+        return task.get('fileBytes'), None
+    return stat.st_size, stat.st_mtime
+
+
+def is_landed(task, entry):
+    """目标文件大小与源文件一致且不早于源文件, 视为上次已上传完成"""
+    if entry is None:
+        return False
+    size, mtime = source_stat(task)
+    if size is None or entry.get('Size') != size:
+        return False
+    if mtime is None:
+        return True
+    remote_mtime = parse_mod_time(entry.get('ModTime'))
+    # 目标端是更早的旧版本时需要重新上传; 不保留修改时间的网盘记录的是上传时间, 不会早于源文件
+    return remote_mtime is not None and remote_mtime >= mtime - MODTIME_TOLERANCE
+
+
+def reconcile_node_tasks(collection, folder_collection, log_collection, list_dir=list_origin_dir):
+    """
+    启动时核对本节点上次运行中断的任务
+
+    上传中的任务按 (网盘, 目标目录) 分组, 每个目录只列举一次, 目标文件已完整存在的置为完成;
+    其余任务(包括尚未开始的排队中任务和列举失败的目录)重新置为待上传.
+    没有租约归属的排队中/上传中任务(引入租约前的旧数据)也一并核对, 否则不会被任何节点领取
+    :return: (置为完成的数量, 重新排队的数量)
+    """
+    # leaseOwner 为 None 同时匹配字段缺失的文档
+    owned = {'leaseOwner': {'$in': [get_node_id(), None]}, 'status': {'$in': [1, 2]}}
+    tasks = list(collection.find(
+        owned,
+        {'localPath': 1, 'remotePath': 1, 'origin': 1, 'fileName': 1, 'fileBytes': 1, 'folderId': 1, 'status': 1}
+    ))
+    directories = {}
+    for task in tasks:
+        if task['status'] == 2:
+            directories.setdefault((task['origin'], normalize_remote_path(task['remotePath'])), []).append(task)
+
+    landed = []
+    for (origin, remote_path), dir_tasks in directories.items():
+        try:
+            entries = {entry['Path']: entry for entry in list_dir(f'{origin}:{remote_path}')}
+        except Exception as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 核对中断任务时列举 {origin}:{remote_path} 失败, 重新上传: {str(e)}")
+            continue
+        landed += [task for task in dir_tasks if is_landed(task, entries.get(task['fileName']))]
+
+    now = datetime.now()
+    landed_ids = {task['_id'] for task in landed}
+    operations = [
+        UpdateOne({'_id': task['_id'], **owned}, {'$set': {
+            'status': 3, 'progress': '100', 'finishedAt': now, 'nextRetryAt': None, **RELEASED,
+        }} if task['_id'] in landed_ids else {'$set': {'status': 0, 'progress': '0', **RELEASED}})
+        for task in tasks
+    ]
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    append_task_logs(log_collection, {task['_id']: ['启动核对: 目标文件已完整存在, 标记为完成'] for task in landed})
+    folder_counts = {}
+    for task in landed:
+        folder_counts[task['folderId']] = folder_counts.get(task['folderId'], 0) + 1
+    for folder_id, count in folder_counts.items():
+        folder_collection.update_one({'_id': folder_id}, {'$inc': {'uploadNum': count}, '$set': {'lastSyncAt': now}})
+    return len(landed), len(tasks) - len(landed)
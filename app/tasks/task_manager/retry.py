@@ -0,0 +1,83 @@
+import random
+import re
+from datetime import datetime, timedelta
+
+from app.utils.env import get_env_int
+
+# 临时性失败最多自动重试的次数(不含首次执行)
+_retry_max_attempts = get_env_int('RETRY_MAX_ATTEMPTS', 5)
+# 首次重试的等待时间(秒), 之后每次翻倍
+_retry_base_seconds = get_env_int('RETRY_BASE_SECONDS', 30)
+# 单次重试的最长等待时间(秒)
+_retry_max_seconds = get_env_int('RETRY_MAX_SECONDS', 60 * 60)
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# rclone 退出码: https://rclone.org/docs/#exit-code
+PERMANENT_EXIT_CODES = {2: '参数错误', 3: '目录不存在', 4: '文件不存在', 7: '致命错误'}
+TRANSIENT_EXIT_CODES = {5: '临时错误', 8: '超出传输量限制', 10: '超出运行时长限制'}
+
+# 先匹配永久性错误, 例如 403 中的存储空间不足不应当作限流重试
+PERMANENT_PATTERNS = [
+    (re.compile(r'storageQuotaExceeded|quota exceeded for storage|insufficient storage|not enough space|\b507\b', re.I), '存储空间不足'),
+    (re.compile(r'invalid_grant|token has been expired or revoked|unauthorized_client', re.I), '授权失效, 需要重新配置网盘'),
+    (re.compile(r'no such file or directory|file not found|directory not found|object not found|not a directory', re.I), '文件不存在'),
+    (re.compile(r'permission denied|access denied|insufficientFilePermissions', re.I), '没有权限'),
+    (re.compile(r'file name too long|invalid (file )?name|illegal character|too large|exceeds the maximum', re.I), '文件名或大小不被支持'),
+    (re.compile(r"didn't find section in config file|unknown backend|failed to create file system", re.I), '网盘配置错误'),
+]
+TRANSIENT_PATTERNS = [
+    (re.compile(r'\b429\b|too many requests|rate ?limit|userRateLimitExceeded|throttl|slow ?down', re.I), '限流'),
+    (re.compile(r'timeout|timed out|deadline exceeded', re.I), '超时'),
+    (re.compile(r'connection (reset|refused|closed)|broken pipe|unexpected EOF|\bEOF\b|no route to host|network is unreachable|TLS handshake', re.I), '网络错误'),
+    (re.compile(r'\b50[0234]\b|internal server error|bad gateway|service unavailable|backendError', re.I), '服务端错误'),
+    (re.compile(r"couldn't fetch token|failed to refresh token|token expired|oauth2: cannot fetch token", re.I), '刷新令牌失败'),
+    (re.compile(r'dailyLimitExceeded|max transfer limit reached|transferLimitExceeded', re.I), '超出每日传输量'),
+]
+
+
+def classify_failure(returncode, messages=()):
+    """
+    根据 rclone 退出码和错误输出判断失败类型
+    :return: (TRANSIENT 或 PERMANENT, 原因)
+    """
+    text = '\n'.join(message for message in messages if message)
+    for pattern, reason in PERMANENT_PATTERNS:
+        if pattern.search(text):
+            return PERMANENT, reason
+    if returncode in PERMANENT_EXIT_CODES:
+        return PERMANENT, PERMANENT_EXIT_CODES[returncode]
+    for pattern, reason in TRANSIENT_PATTERNS:
+        if pattern.search(text):
+            return TRANSIENT, reason
+    if returncode in TRANSIENT_EXIT_CODES:
+        return TRANSIENT, TRANSIENT_EXIT_CODES[returncode]
+    # 未能识别的错误(例如退出码 1、6)按临时错误处理, 由重试次数兜底
+    return TRANSIENT, '未知错误'
+
+
+def backoff_seconds(attempt, base=None, cap=None):
+    """第 attempt 次重试前的等待时间: 指数增长, 一半固定一半随机, 避免大量任务同时重试"""
+    base = _retry_base_seconds if base is None else base
+    cap = _retry_max_seconds if cap is None else cap
+    delay = min(cap, base * 2 ** max(attempt - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def failure_fields(attempts, returncode, messages=(), now=None):
+    """
+    失败后的任务字段: 临时性失败且未超过重试次数时重新置为待上传并设置下次重试时间, 否则置为失败
+    :param attempts: 本次执行前已失败的次数
+    :return: (字段, 是否会重试)
+    """
+    now = now or datetime.now()
+    kind, reason = classify_failure(returncode, messages)
+    attempts = (attempts or 0) + 1
+    fields = {'attempts': attempts, 'failureKind': kind, 'lastError': reason}
+    if kind == TRANSIENT and attempts <= _retry_max_attempts:
+        delay = backoff_seconds(attempts)
+        fields.update({'status': 0, 'nextRetryAt': now + timedelta(seconds=delay), 'progress': '0'})
+        return fields, True
+    fields.update({'status': 4, 'nextRetryAt': None})
+    return fields, False
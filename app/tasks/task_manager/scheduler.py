@@ -0,0 +1,146 @@
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from queue import Queue
+
+from app.utils.env import get_env_int
+
+# 调度策略: fifo 按入队顺序; sjf 小文件优先; fair 在各 (网盘, 文件夹) 间轮转, 组内小文件优先;
+# priority 先按文件夹优先级, 同一优先级内与 fair 相同
+POLICIES = ('fifo', 'sjf', 'fair', 'priority')
+_policy = os.environ.get('SCHEDULER_POLICY', 'priority')
+# 排队超过该秒数的任务不论大小和优先级直接取出, 避免大文件和低优先级任务饿死, 0 为不启用
+_aging_seconds = get_env_int('SCHEDULER_AGING_SECONDS', 60 * 60)
+
+
+class ScheduledEntry:
+    __slots__ = ('item', 'seq', 'size', 'origin', 'group', 'priority', 'queued_at', 'taken')
+
+    def __init__(self, item, seq, size, origin, group, priority):
+        self.item = item
+        self.seq = seq
+        self.size = size
+        self.origin = origin
+        self.group = group
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.taken = False
+
+
+class TaskScheduler(Queue):
+    """
+    按调度策略出队的任务队列, 与 queue.Queue 接口相同(get/put/qsize/task_done/join)
+
+    任务通过 put_task 带上大小、网盘、分组和优先级入队, get 返回 ScheduledEntry;
+    直接 put 的控制项(例如停止线程的 None)原样最先取出。
+    各组内按 (大小, 入队顺序) 排序, 组之间轮转, 优先级高的组全部取完才轮到低优先级。
+    传入 limiter 时跳过并发已满的网盘, qsize 只统计可以取出的任务。
+    """
+
+    def __init__(self, policy=None, aging_seconds=None, limiter=None):
+        self.policy = policy or _policy
+        if self.policy not in POLICIES:
+            raise ValueError(f'未知的调度策略: {self.policy}, 可选 {", ".join(POLICIES)}')
+        self.aging_seconds = _aging_seconds if aging_seconds is None else aging_seconds
+        self.limiter = limiter
+        self.counter = itertools.count()
+        super().__init__()
+
+    def _init(self, maxsize):
+        self.control = deque()
+        # 优先级 -> (组轮转顺序, {(网盘, 组): 堆})
+        self.lanes = {}
+        # 按入队顺序保存, 用于老化; 已取出的任务延迟删除
+        self.arrivals = deque()
+        # 各网盘排队的任务数
+        self.pending = {}
+
+    def blocked(self):
+        return self.limiter.blocked() if self.limiter else set()
+
+    def _qsize(self):
+        size = sum(self.pending.values())
+        blocked = self.blocked()
+        if blocked:
+            size -= sum(self.pending.get(origin, 0) for origin in blocked)
+        return size + len(self.control)
+
+    def put_task(self, item, size=0, origin=None, group=None, priority=0):
+        self.put(ScheduledEntry(item, next(self.counter), size or 0, origin, group, priority or 0))
+
+    def release(self, origin):
+        """任务结束后释放网盘的并发名额, 唤醒等待的线程"""
+        if self.limiter:
+            self.limiter.release(origin)
+        with self.not_empty:
+            self.not_empty.notify_all()
+
+    def _put(self, entry):
+        if not isinstance(entry, ScheduledEntry):
+            self.control.append(entry)
+            return
+        self.pending[entry.origin] = self.pending.get(entry.origin, 0) + 1
+        self.arrivals.append(entry)
+        lane_key = -entry.priority if self.policy == 'priority' else 0
+        group = (entry.origin, entry.group if self.policy in ('fair', 'priority') else None)
+        order = entry.seq if self.policy == 'fifo' else (entry.size, entry.seq)
+        rotation, groups = self.lanes.setdefault(lane_key, (deque(), {}))
+        if group not in groups:
+            groups[group] = []
+            rotation.append(group)
+        heapq.heappush(groups[group], (order, entry))
+
+    def _get(self):
+        if self.control:
+            return self.control.popleft()
+        blocked = self.blocked()
+        entry = self._pop_aged(blocked) or self._pop_lane(blocked)
+        entry.taken = True
+        self.pending[entry.origin] -= 1
+        if not self.pending[entry.origin]:
+            del self.pending[entry.origin]
+        if self.limiter:
+            self.limiter.acquire(entry.origin)
+        return entry
+
+    def _pop_aged(self, blocked):
+        while self.arrivals and self.arrivals[0].taken:
+            self.arrivals.popleft()
+        if not self.aging_seconds:
+            return None
+        deadline = time.monotonic() - self.aging_seconds
+        for entry in self.arrivals:
+            if entry.queued_at > deadline:
+                break
+            if not entry.taken and entry.origin not in blocked:
+                return entry
+        return None
+
+    def _pop_lane(self, blocked):
+        for lane_key in sorted(self.lanes):
+            rotation, groups = self.lanes[lane_key]
+            for group in list(rotation):
+                heap = groups[group]
+                while heap and heap[0][1].taken:
+                    heapq.heappop(heap)
+                if not heap:
+                    # 该组只剩已被老化取出的任务
+                    rotation.remove(group)
+                    del groups[group]
+            if not rotation:
+                del self.lanes[lane_key]
+                continue
+            candidates = [group for group in rotation if group[0] not in blocked]
+            if not candidates:
+                continue
+            if self.policy in ('fair', 'priority'):
+                group = candidates[0]
+                # 取出后移到轮转末尾
+                rotation.remove(group)
+                rotation.append(group)
+            else:
+                group = min(candidates, key=lambda key: groups[key][0][0])
+            return heapq.heappop(groups[group])[1]
+        raise IndexError('没有可以取出的任务')
@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from app.utils.env import get_env_int
+
+# 单个文件夹扫描时并发读取目录的线程数, NFS/SMB 等高延迟挂载建议调大
+_scan_threads = get_env_int('SCAN_THREADS', 8)
+
+
+class ScandirWalker:
+    """
+    基于 os.scandir 的并发目录遍历器
+
+    - 超过 max_depth 的目录在进入前即被剪枝, 不会被列举
+    - 每个目录由 visit(rel_dir, abs_dir) 处理, 返回 (结果, 子目录名列表)
+    - 目录之间的处理分发到线程池, 按完成顺序产出 (rel_dir, 结果)
+    """
+
+    def __init__(self, root, max_depth, visit, workers=None):
+        self.root = root
+        self.max_depth = max_depth
+        self.visit = visit
+        self.workers = workers or _scan_threads
+
+    def _visit(self, rel_dir, depth):
+        abs_dir = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        result, subdirs = self.visit(rel_dir, abs_dir)
+        children = [os.path.join(rel_dir, name) for name in subdirs] if depth < self.max_depth else []
+        return rel_dir, depth, result, children
+
+    def walk(self):
+        if self.workers <= 1:
+            stack = [('', 0)]
+            while stack:
+                rel_dir, depth, result, children = self._visit(*stack.pop())
+                stack.extend((child, depth + 1) for child in children)
+                yield rel_dir, result
+            return
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scandir')
+        try:
+            pending = {pool.submit(self._visit, '', 0)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rel_dir, depth, result, children = future.result()
+                    pending.update(pool.submit(self._visit, child, depth + 1) for child in children)
+                    yield rel_dir, result
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
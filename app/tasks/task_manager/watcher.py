@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+from app.tasks.task_manager.filters import PathFilter
+from app.utils.env import get_env_int
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # 未安装 watchdog 时仅使用定时扫描
+    FileSystemEventHandler = object
+    Observer = None
+
+try:
+    from watchdog.observers.inotify import InotifyObserver
+except ImportError:  # 非 Linux 平台
+    InotifyObserver = None
+
+# 是否启用本地文件夹实时监听
+_watch_enabled = get_env_int('WATCH_ENABLED', 1) == 1
+# 未收到写入完成事件的文件, 在无新事件多久后视为写入结束(毫秒)
+_quiet_ms = get_env_int('WATCH_QUIET_MS', 2000)
+# 待处理事件上限, 超出后丢弃触发文件夹的事件并改为完整扫描
+_max_pending = get_env_int('WATCH_MAX_PENDING', 10000)
+# 待处理事件的检查间隔(毫秒)
+_poll_ms = get_env_int('WATCH_POLL_MS', 200)
+
+
+class FolderEventHandler(FileSystemEventHandler):
+    """将 watchdog 事件转发给 FolderWatcher"""
+
+    def __init__(self, watcher, folder_id):
+        self.watcher = watcher
+        self.folder_id = folder_id
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.touch(self.folder_id, event.src_path, closed=False)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.touch(self.folder_id, event.src_path, closed=False)
+
+    def on_closed(self, event):
+        # close_write: 写入完成
+        self.watcher.touch(self.folder_id, event.src_path, closed=True)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            if event.src_path:
+                self.watcher.discard(event.src_path)
+            # rename 是原子操作, 移入的文件可以直接处理
+            if event.dest_path:
+                self.watcher.touch(self.folder_id, event.dest_path, closed=True)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.watcher.discard(event.src_path)
+
+
+class FolderWatcher:
+    """
+    本地文件夹事件监听 (syncType == 'local')
+
+    通过 inotify(watchdog) 监听文件创建/移入/写入完成事件, 去抖后直接创建任务,
+    不再等待下一轮 check_folders。监听失败或事件积压时回退为对该文件夹做一次完整扫描。
+    """
+
+    def __init__(self, task_manager):
+        self.task_manager = task_manager
+        self.enabled = _watch_enabled and Observer is not None
+        self.observer = self.create_observer() if self.enabled else None
+        self.lock = threading.Lock()
+        # folder_id -> (watch, folder)
+        self.watches = {}
+        # path -> [folder_id, 最后事件时间, 是否写入完成]
+        self.pending = {}
+        self.overflowed = set()
+
+    @staticmethod
+    def create_observer():
+        if InotifyObserver is not None:
+            # 从未监听目录移入的文件会产生 FileMovedEvent 而不是 FileCreatedEvent, 可以立即处理
+            return InotifyObserver(generate_full_events=True)
+        return Observer()
+
+    def start(self):
+        if not self.enabled:
+            if _watch_enabled:
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 未安装 watchdog, 本地文件夹仅使用定时扫描")
+            return
+        self.observer.daemon = True
+        self.observer.start()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def sync_folders(self):
+        """按数据库中的本地文件夹增删监听"""
+        if not self.enabled:
+            return
+        collection = self.task_manager.mongo_db.get_collection('folders')
+        folders = {
+            folder['_id']: folder
+            for folder in collection.find({'syncType': {'$ne': 'remote'}, 'watch': {'$ne': False}})
+        }
+        with self.lock:
+            for folder_id in list(self.watches):
+                watch, watched = self.watches[folder_id]
+                folder = folders.get(folder_id)
+                if folder is None or folder['localPath'] != watched['localPath']:
+                    self.observer.unschedule(watch)
+                    del self.watches[folder_id]
+                else:
+                    self.watches[folder_id] = (watch, folder)
+            for folder_id, folder in folders.items():
+                if folder_id in self.watches or not os.path.isdir(folder['localPath']):
+                    continue
+                try:
+                    watch = self.observer.schedule(FolderEventHandler(self, folder_id), folder['localPath'], recursive=True)
+                except OSError as e:
+                    # 常见原因: 超出 fs.inotify.max_user_watches
+                    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 监听文件夹失败 {folder['localPath']}: {str(e)}")
+                    continue
+                self.watches[folder_id] = (watch, folder)
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 开始监听文件夹 {folder['name']} ({folder['localPath']})")
+
+    def touch(self, folder_id, path, closed):
+        with self.lock:
+            if folder_id in self.overflowed or folder_id not in self.watches:
+                return
+            # 被过滤规则排除的文件(如 node_modules 下的文件)不进入待处理队列
+            folder = self.watches[folder_id][1]
+            if not PathFilter.from_folder(folder).match_file(os.path.relpath(path, folder['localPath'])):
+                return
+            item = self.pending.get(path)
+            if item is None:
+                if len(self.pending) >= _max_pending:
+                    # 事件积压, 丢弃该文件夹的待处理事件, 稍后完整扫描
+                    self.overflowed.add(folder_id)
+                    self.pending = {p: v for p, v in self.pending.items() if v[0] != folder_id}
+                    return
+                self.pending[path] = [folder_id, time.monotonic(), closed]
+            else:
+                item[1] = time.monotonic()
+                item[2] = item[2] or closed
+
+    def discard(self, path):
+        with self.lock:
+            self.pending.pop(path, None)
+
+    def take_ready(self):
+        """取出已写入完成的文件, 按文件夹分组"""
+        now = time.monotonic()
+        ready = {}
+        with self.lock:
+            for path, (folder_id, last, closed) in list(self.pending.items()):
+                if closed or now - last >= _quiet_ms / 1000:
+                    del self.pending[path]
+                    ready.setdefault(folder_id, []).append(path)
+            overflowed, self.overflowed = self.overflowed, set()
+            folders = {folder_id: watch[1] for folder_id, watch in self.watches.items()}
+        return ready, overflowed, folders
+
+    def flush(self):
+        """为写入完成的文件创建任务, 事件积压的文件夹提交完整扫描"""
+        ready, overflowed, folders = self.take_ready()
+        for folder_id, paths in ready.items():
+            if folder_id in folders:
+                self.task_manager.create_tasks_from_paths(folders[folder_id], paths)
+        for folder_id in overflowed:
+            if folder_id in folders:
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 文件夹事件积压, 改为完整扫描: {folders[folder_id]['name']}")
+                # 与定时检测共用扫描线程池和网盘并发上限, 不阻塞事件处理
+                self.task_manager.scan_pool.submit(self.task_manager.scan_folder_limited, folders[folder_id])
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(_poll_ms / 1000)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 处理文件夹事件异常: {str(e)}")
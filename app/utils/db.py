@@ -1,14 +1,136 @@
 import os
+import threading
 from pymongo import MongoClient
+from pymongo.monitoring import ConnectionCheckOutFailedReason, ConnectionPoolListener
 from flask import current_app, g
 
+from app.utils.env import get_env_int
+
 MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/'
 MONGO_NAME = 'rclone'
 print('db.py =====>', MONGO_URI)
+# 每个进程的连接池大小, API 进程和后台任务进程各自一份
+_max_pool_size = get_env_int('MONGO_MAX_POOL_SIZE', 100)
+_min_pool_size = get_env_int('MONGO_MIN_POOL_SIZE', 0)
+# 空闲连接保留时长(毫秒), 超时后关闭
+_max_idle_ms = get_env_int('MONGO_MAX_IDLE_MS', 5 * 60 * 1000)
+# 连接池耗尽时等待空闲连接的最长时间(毫秒), 超时抛出异常
+_wait_queue_timeout_ms = get_env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10 * 1000)
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """统计本进程各连接池的连接数、借出数和等待情况"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+
+    def _update(self, address, **changes):
+        key = f'{address[0]}:{address[1]}'
+        with self.lock:
+            pool = self.pools.setdefault(key, {
+                'open': 0, 'inUse': 0, 'maxInUse': 0, 'created': 0, 'closed': 0,
+                'checkouts': 0, 'checkoutFailures': 0, 'waitTimeouts': 0, 'waitMs': 0.0, 'cleared': 0,
+            })
+            for name, value in changes.items():
+                pool[name] += value
+            pool['maxInUse'] = max(pool['maxInUse'], pool['inUse'])
+
+    def snapshot(self):
+        with self.lock:
+            pools = [
+                {
+                    'address': address,
+                    **{name: value for name, value in pool.items() if name != 'waitMs'},
+                    'avgWaitMs': round(pool['waitMs'] / pool['checkouts'], 3) if pool['checkouts'] else 0,
+                }
+                for address, pool in sorted(self.pools.items())
+            ]
+        return {
+            'pid': os.getpid(),
+            'maxPoolSize': _max_pool_size,
+            'minPoolSize': _min_pool_size,
+            'pools': pools,
+        }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(event.address, created=1, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, closed=1, open=-1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, checkoutFailures=1, waitTimeouts=int(event.reason == ConnectionCheckOutFailedReason.TIMEOUT))
+
+    def connection_checked_out(self, event):
+        duration = getattr(event, 'duration', None) or 0
+        self._update(event.address, checkouts=1, inUse=1, waitMs=duration * 1000)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, inUse=-1)
+
+
+pool_metrics = PoolMetrics()
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(uri=MONGO_URI):
+    """
+    进程内共享的 MongoClient, 同一地址只创建一次
+    connect=False 时在第一次操作时才连接, 断线后由驱动自动重连
+    """
+    with _clients_lock:
+        client = _clients.get(uri)
+        if client is None:
+            client = MongoClient(
+                uri,
+                connect=False,
+                maxPoolSize=_max_pool_size,
+                minPoolSize=_min_pool_size,
+                maxIdleTimeMS=_max_idle_ms,
+                waitQueueTimeoutMS=_wait_queue_timeout_ms,
+                event_listeners=[pool_metrics],
+            )
+            _clients[uri] = client
+        return client
+
+
+def _reset_after_fork():
+    """gunicorn fork 出的子进程不能复用父进程的连接和监控线程, 丢弃后按需重新创建"""
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+    pool_metrics.reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
 
 class DatabaseManager:
     """数据库连接管理类"""
-    _client = None
     _db = None
 
     @classmethod
@@ -18,10 +140,8 @@ class DatabaseManager:
 
     @classmethod
     def get_client(cls):
-        """获取MongoClient实例（连接池）"""
-        if not cls._client:
-            cls._client = MongoClient(MONGO_URI + MONGO_NAME, maxPoolSize=100)
-        return cls._client
+        """获取MongoClient实例（与后台任务共用进程内的连接池, 数据库由 get_db 选择）"""
+        return get_client(MONGO_URI)
 
     @classmethod
     def get_db(cls):
@@ -44,10 +164,8 @@ class DatabaseManager:
 
     @classmethod
     def close_connections(cls, exception=None):
-        """关闭数据库连接"""
-        if cls._client:
-            cls._client.close()
-            cls._client = None
+        """请求结束时只释放 g.db, 连接池在进程内共享, 不随请求关闭"""
+        g.pop('db', None)
 
 # 兼容层（逐步迁移后移除）
 def get_db():
@@ -113,9 +231,7 @@ class MongoDatabase:
         self.db_name = db_name
 
     def get_collection(self, collection_name):
-        """获取指定集合."""
-        client = MongoClient(self.mongo_uri)
-        db = client[self.db_name]
-        return db[collection_name]
+        """获取指定集合, 使用进程内共享的连接池."""
+        return get_client(self.mongo_uri)[self.db_name][collection_name]
 
 mongo_db = MongoDatabase(MONGO_URI, MONGO_NAME)
@@ -0,0 +1,7 @@
+import os
+
+
+def get_env_int(name, default):
+    """读取整数类型的环境变量, 未设置或格式错误时返回默认值"""
+    value = os.environ.get(name)
+    return int(value) if value and value.isdigit() else default
@@ -0,0 +1,44 @@
+import unittest
+
+from app.tasks.task_manager.autoscale import WorkerAutoscaler
+
+
+def sample(workers, busy=None, queue_depth=10, bps=0, finished=0, failed=0):
+    return {
+        'workers': workers, 'busy': workers if busy is None else busy, 'queueDepth': queue_depth,
+        'bytesPerSec': bps, 'finished': finished, 'failed': failed,
+    }
+
+
+class WorkerAutoscalerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scaler = WorkerAutoscaler(min_workers=1, max_workers=4, min_gain_percent=10, max_error_percent=20, cooldown=2)
+
+    def test_grows_while_throughput_rises(self):
+        self.assertEqual(self.scaler.decide(sample(1, bps=100)), (2, '有排队任务且线程全部忙碌'))
+        self.assertEqual(self.scaler.decide(sample(2, bps=200))[0], 3)
+        self.assertEqual(self.scaler.decide(sample(3, bps=300))[0], 4)
+        # 达到上限后保持
+        self.assertEqual(self.scaler.decide(sample(4, bps=400)), (4, None))
+
+    def test_plateau_reverts_and_cools_down(self):
+        self.assertEqual(self.scaler.decide(sample(2, bps=200))[0], 3)
+        self.assertEqual(self.scaler.decide(sample(3, bps=205)), (2, '吞吐不再提升'))
+        # 冷却期内不再增加
+        self.assertEqual(self.scaler.decide(sample(2, bps=200)), (2, None))
+        self.assertEqual(self.scaler.decide(sample(2, bps=200)), (2, None))
+        self.assertEqual(self.scaler.decide(sample(2, bps=200))[0], 3)
+
+    def test_sheds_on_errors_and_idle(self):
+        self.assertEqual(self.scaler.decide(sample(3, finished=10, failed=5)), (2, '失败率过高'))
+        self.assertEqual(self.scaler.decide(sample(2, busy=1, queue_depth=0)), (1, '队列为空'))
+        # 不低于下限
+        self.assertEqual(self.scaler.decide(sample(1, busy=0, queue_depth=0)), (1, None))
+
+    def test_clamps_to_bounds(self):
+        self.assertEqual(self.scaler.decide(sample(6))[0], 4)
+        self.assertEqual(self.scaler.decide(sample(0))[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from unittest import mock
+
+from bson import ObjectId
+
+from app.tasks.task_manager import rclone_operator
+from app.tasks.task_manager.batch import split_batch_root, group_tasks
+from app.tasks.task_manager.rclone_operator import BatchRcloneCommand
+
+
+class SplitBatchRootTestCase(unittest.TestCase):
+    def test_strips_common_suffix(self):
+        self.assertEqual(
+            split_batch_root('/data/photos/2024/a.jpg', 'backup/photos/2024'),
+            ('/data', 'backup', 'photos/2024/a.jpg'),
+        )
+        self.assertEqual(split_batch_root('/photos/a.jpg', 'photos'), ('/', '', 'photos/a.jpg'))
+        self.assertEqual(split_batch_root('/data/a.jpg', 'other'), ('/data', 'other', 'a.jpg'))
+
+    def test_remote_source(self):
+        self.assertEqual(split_batch_root('src:photos/a.jpg', 'photos'), ('src:', '', 'photos/a.jpg'))
+        self.assertEqual(split_batch_root('src:a.jpg', 'backup'), ('src:', 'backup', 'a.jpg'))
+
+
+class GroupTasksTestCase(unittest.TestCase):
+    @staticmethod
+    def task(task_id, local_path, remote_path, size=10, origin='o'):
+        return {'_id': task_id, 'localPath': local_path, 'remotePath': remote_path, 'origin': origin, 'fileBytes': size}
+
+    def test_groups_by_root_and_limits(self):
+        """相同根目录的任务合并, 超过数量上限拆分, 大文件和单个任务不合并"""
+        tasks = [
+            self.task('1', '/data/p/a.jpg', 'bk/p'),
+            self.task('2', '/data/p/sub/b.jpg', 'bk/p/sub'),
+            self.task('3', '/data/p/c.jpg', 'bk/p'),
+            self.task('4', '/data/p/big.mkv', 'bk/p', size=100),
+            self.task('5', '/data/p/d.jpg', 'bk/p', origin='other'),
+        ]
+        items = list(group_tasks(tasks, max_files=2, max_bytes=50))
+        batches = [item for item in items if isinstance(item, dict)]
+        singles = sorted(item for item in items if isinstance(item, str))
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0]['task_ids'], ['1', '2'])
+        self.assertEqual(batches[0]['files'], ['p/a.jpg', 'p/sub/b.jpg'])
+        self.assertEqual((batches[0]['src_root'], batches[0]['dst_root']), ('/data', 'bk'))
+        self.assertEqual(singles, ['3', '4', '5'])
+
+    def test_disabled(self):
+        tasks = [self.task('1', '/d/a', 'x'), self.task('2', '/d/b', 'x')]
+        self.assertEqual(list(group_tasks(tasks, max_files=1)), ['1', '2'])
+
+
+class BatchRcloneCommandTestCase(unittest.TestCase):
+    def test_shares_base_state(self):
+        """批量命令通过基类初始化, 错误输出和限速登记等状态与单个任务一致"""
+        task_ids = [str(ObjectId()), str(ObjectId())]
+        with mock.patch.object(rclone_operator, 'mongo_db'), mock.patch.object(rclone_operator, 'Logger'):
+            command = BatchRcloneCommand({
+                'task_ids': task_ids, 'files': ['p/a.jpg', 'p/b.jpg'], 'origin': 'o',
+                'src_root': '/data', 'dst_root': 'bk', 'other': '',
+            })
+        self.assertEqual(command.task_by_file, dict(zip(['p/a.jpg', 'p/b.jpg'], map(ObjectId, task_ids))))
+        self.assertEqual(list(command.error_lines), [])
+        self.assertIsNone(command.slot)
+        self.assertEqual(command.get_cmd('files.txt')[:4], ['rclone', 'copy', '/data', 'o:bk'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from types import SimpleNamespace
+
+from pymongo.monitoring import ConnectionCheckOutFailedReason
+
+from app.utils import db
+
+
+class SharedClientTestCase(unittest.TestCase):
+    def test_reuses_client_until_fork(self):
+        client = db.get_client('mongodb://localhost:27017/pool_test')
+        self.assertIs(db.get_client('mongodb://localhost:27017/pool_test'), client)
+        self.assertIs(db.mongo_db.get_collection('tasks').database.client, db.mongo_db.get_collection('folders').database.client)
+        # API 和后台任务共用同一个客户端
+        self.assertIs(db.DatabaseManager.get_client(), db.mongo_db.get_collection('tasks').database.client)
+        self.assertEqual(client.options.pool_options.max_pool_size, db._max_pool_size)
+        # 子进程中丢弃父进程的客户端, 下次使用时重新创建
+        db._reset_after_fork()
+        self.assertIsNot(db.get_client('mongodb://localhost:27017/pool_test'), client)
+        client.close()
+
+
+class PoolMetricsTestCase(unittest.TestCase):
+    def test_counts_connections_and_checkouts(self):
+        metrics = db.PoolMetrics()
+        address = ('localhost', 27017)
+        metrics.connection_created(SimpleNamespace(address=address))
+        metrics.connection_created(SimpleNamespace(address=address))
+        metrics.connection_checked_out(SimpleNamespace(address=address, duration=0.002))
+        metrics.connection_checked_out(SimpleNamespace(address=address, duration=0.004))
+        metrics.connection_checked_in(SimpleNamespace(address=address))
+        metrics.connection_check_out_failed(SimpleNamespace(address=address, reason=ConnectionCheckOutFailedReason.TIMEOUT))
+        metrics.connection_closed(SimpleNamespace(address=address))
+        pool = metrics.snapshot()['pools'][0]
+        self.assertEqual(pool['address'], 'localhost:27017')
+        self.assertEqual((pool['open'], pool['inUse'], pool['maxInUse']), (1, 1, 2))
+        self.assertEqual((pool['checkouts'], pool['checkoutFailures'], pool['waitTimeouts']), (2, 1, 1))
+        self.assertAlmostEqual(pool['avgWaitMs'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import asyncio
+import unittest
+
+from app.tasks.task_manager.dispatch import DispatchTrigger, notify_new_tasks, subscribe, unsubscribe
+
+
+class DispatchTriggerTestCase(unittest.TestCase):
+    def test_notifications_are_coalesced(self):
+        loop = asyncio.new_event_loop()
+        calls = []
+        trigger = DispatchTrigger(loop, lambda: calls.append(loop.time()))
+        trigger.debounce = 0.05
+        subscribe(trigger.wake)
+        try:
+            for _ in range(5):
+                notify_new_tasks()
+            loop.call_later(0.2, loop.stop)
+            loop.run_forever()
+            self.assertEqual(len(calls), 1)
+            # 分发后的新通知会再次触发
+            notify_new_tasks()
+            loop.call_later(0.2, loop.stop)
+            loop.run_forever()
+            self.assertEqual(len(calls), 2)
+            # 多个延迟唤醒在同一秒到期时合并为一个定时器
+            for _ in range(3):
+                notify_new_tasks(0.2)
+            loop.call_later(0.05, loop.stop)
+            loop.run_forever()
+            self.assertEqual(len(trigger.delayed), 1)
+            self.assertEqual(len(calls), 2)
+            loop.call_later(2.5, loop.stop)
+            loop.run_forever()
+            self.assertEqual(len(calls), 3)
+            self.assertEqual(trigger.delayed, {})
+        finally:
+            unsubscribe(trigger.wake)
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
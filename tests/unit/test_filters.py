@@ -0,0 +1,59 @@
+import unittest
+
+from app.tasks.task_manager.filters import PathFilter
+
+
+class PathFilterTestCase(unittest.TestCase):
+    def test_default_rule_skips_hidden_files_only(self):
+        """默认只跳过隐藏文件和备份文件, 隐藏目录仍会遍历"""
+        path_filter = PathFilter()
+        self.assertFalse(path_filter.match_file('a/.DS_Store'))
+        self.assertFalse(path_filter.match_file('report.doc~'))
+        self.assertTrue(path_filter.match_file('.config/app.json'))
+        self.assertTrue(path_filter.match_dir('.config'))
+        self.assertTrue(path_filter.match_file('.DS_Store', hidden=True))
+
+    def test_excluded_directory_prunes_subtree(self):
+        path_filter = PathFilter(excludes=['node_modules', '/cache/', '*.tmp'])
+        self.assertFalse(path_filter.match_dir('node_modules'))
+        self.assertFalse(path_filter.match_dir('web/node_modules'))
+        self.assertFalse(path_filter.match_dir('cache'))
+        self.assertTrue(path_filter.match_dir('web/cache'))
+        self.assertFalse(path_filter.match_file('web/node_modules/lib/index.js'))
+        self.assertFalse(path_filter.match_file('cache/a.bin'))
+        self.assertTrue(path_filter.match_file('web/cache/a.bin'))
+        self.assertFalse(path_filter.match_file('a/b/c.tmp'))
+
+    def test_includes_with_excludes_taking_precedence(self):
+        path_filter = PathFilter(includes=['*.{jpg,png}', 'docs/**'], excludes=['thumbs/'])
+        self.assertTrue(path_filter.match_file('2024/a.jpg'))
+        self.assertTrue(path_filter.match_file('docs/a/readme.md'))
+        self.assertFalse(path_filter.match_file('notes.txt'))
+        self.assertFalse(path_filter.match_file('thumbs/a.jpg'))
+        self.assertTrue(path_filter.match_dir('2024'))
+
+    def test_double_star_and_single_star(self):
+        path_filter = PathFilter(excludes=['/logs/*.log', '**/build/**'])
+        self.assertFalse(path_filter.match_file('logs/a.log'))
+        self.assertTrue(path_filter.match_file('logs/old/a.log'))
+        self.assertFalse(path_filter.match_dir('build'))
+        self.assertFalse(path_filter.match_dir('src/build'))
+
+    def test_rclone_flags(self):
+        path_filter = PathFilter(includes=['*.jpg'], excludes=['node_modules', 'cache/tmp/'])
+        self.assertEqual(path_filter.rclone_flags(), [
+            '--filter', '- node_modules', '--filter', '- node_modules/**',
+            '--filter', '- /cache/tmp/**',
+            '--filter', '+ *.jpg', '--filter', '- **',
+        ])
+        self.assertEqual(PathFilter().rclone_flags(), [])
+
+    def test_invalid_rule(self):
+        with self.assertRaises(ValueError):
+            PathFilter(excludes=['{a,b'])
+        with self.assertRaises(ValueError):
+            PathFilter(excludes=['[abc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
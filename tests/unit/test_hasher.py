@@ -0,0 +1,46 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from app.tasks.task_manager.hasher import QuickXorHash, hash_file, select_hash_type
+
+
+class QuickXorHashTestCase(unittest.TestCase):
+    def test_known_digests(self):
+        """与 OneDrive/rclone 的 QuickXorHash 结果一致"""
+        self.assertEqual(QuickXorHash().hexdigest(), '0' * 40)
+        digest = QuickXorHash()
+        digest.update(b'hello world')
+        self.assertEqual(digest.hexdigest(), '6828031bd8f00610dce10d726b03190000000000')
+
+    def test_chunked_update_matches_single_update(self):
+        """分块写入与一次性写入的结果相同"""
+        data = os.urandom(1000)
+        whole = QuickXorHash()
+        whole.update(data)
+        chunked = QuickXorHash()
+        for start in range(0, len(data), 37):
+            chunked.update(data[start:start + 37])
+        self.assertEqual(chunked.hexdigest(), whole.hexdigest())
+
+
+class HashHelpersTestCase(unittest.TestCase):
+    def test_hash_file_uses_hashlib_for_md5(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(b'abc')
+        try:
+            self.assertEqual(hash_file(f.name, 'md5'), hashlib.md5(b'abc').hexdigest())
+        finally:
+            os.unlink(f.name)
+
+    def test_select_hash_type(self):
+        """选择各端都支持且本地可计算的哈希"""
+        self.assertEqual(select_hash_type(['sha1', 'md5']), 'md5')
+        self.assertEqual(select_hash_type(['quickxor'], ['quickxor', 'sha1']), 'quickxor')
+        self.assertIsNone(select_hash_type(['crc32']))
+        self.assertIsNone(select_hash_type(['md5'], ['sha1']))
+
+
+if __name__ == '__main__':
+    unittest.main()
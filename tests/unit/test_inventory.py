@@ -0,0 +1,49 @@
+import unittest
+from unittest import mock
+
+from app.tasks.task_manager import inventory as inventory_module
+from app.tasks.task_manager.inventory import DestinationInventory, InventoryCache
+
+
+class DestinationInventoryTestCase(unittest.TestCase):
+    def test_lookup_by_relative_path(self):
+        """按相对清单根目录的路径查询"""
+        inventory = DestinationInventory('o', '/backup/', [{'Path': 'a/b.txt', 'Size': 3}])
+        self.assertTrue(inventory.exists('backup/a/b.txt'))
+        self.assertFalse(inventory.exists('backup/a/c.txt'))
+        self.assertEqual(inventory.get('/backup/a/b.txt')['Size'], 3)
+        self.assertTrue(inventory.covers('backup/x'))
+        self.assertFalse(inventory.covers('backup2/x'))
+
+    def test_unavailable_inventory_covers_nothing(self):
+        inventory = DestinationInventory('o', 'backup', available=False)
+        self.assertFalse(inventory.covers('backup/a.txt'))
+
+
+class InventoryCacheTestCase(unittest.TestCase):
+    def test_shared_prefix_is_listed_once(self):
+        """共享目标前缀的文件夹只列举一次最上层目录"""
+        listing = mock.Mock(return_value=[{'Path': 'photos/1.jpg'}])
+        with mock.patch.object(inventory_module, 'list_origin_tree', listing):
+            cache = InventoryCache([('o', 'backup/photos'), ('o', 'backup'), ('p', 'backup')])
+            first = cache.get('o', 'backup/photos')
+            second = cache.get('o', 'backup')
+        self.assertIs(first, second)
+        listing.assert_called_once_with('o:backup', None)
+        self.assertTrue(first.exists('backup/photos/1.jpg'))
+
+    def test_lazy_inventory_lists_on_first_lookup(self):
+        """延迟清单在第一次查询前不列举目标端"""
+        listing = mock.Mock(return_value=[{'Path': 'photos/1.jpg'}])
+        with mock.patch.object(inventory_module, 'list_origin_tree', listing):
+            cache = InventoryCache([('o', 'backup')])
+            lazy = cache.lazy('o', 'backup/photos')
+            listing.assert_not_called()
+            self.assertTrue(lazy.exists('backup/photos/1.jpg'))
+            self.assertTrue(lazy.covers('backup/photos/2.jpg'))
+            self.assertIsNone(lazy.get('backup/photos/2.jpg'))
+        listing.assert_called_once_with('o:backup', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from bson import ObjectId
+
+from app.tasks.task_manager import leases
+from app.tasks.task_manager.leases import RELEASED, claim_task, claim_tasks, load_node_id, release_tasks, renew_leases, start_owned
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+class NodeIdTestCase(unittest.TestCase):
+    def test_generated_id_survives_restart(self):
+        """未设置 NODE_ID 时生成的标识保存到文件, 重启后保持不变"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data', 'node_id')
+            node_id = load_node_id(path)
+            self.assertEqual(load_node_id(path), node_id)
+            self.assertEqual(os.listdir(os.path.dirname(path)), ['node_id'])
+            os.remove(path)
+            self.assertNotEqual(load_node_id(path), node_id)
+
+
+@unittest.skipUnless(mongomock, '需要安装 mongomock')
+class LeaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.tasks
+        self.ids = [ObjectId() for _ in range(4)]
+        self.collection.insert_many([{'_id': task_id, 'status': 0} for task_id in self.ids])
+        self.patcher = mock.patch.object(leases, '_node_id', 'node-a')
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def as_node(self, node_id):
+        return mock.patch.object(leases, '_node_id', node_id)
+
+    def test_claim_is_exclusive(self):
+        owned = claim_tasks(self.collection, [str(task_id) for task_id in self.ids[:3]])
+        self.assertEqual(owned, {str(task_id) for task_id in self.ids[:3]})
+        with self.as_node('node-b'):
+            self.assertEqual(claim_tasks(self.collection, [str(task_id) for task_id in self.ids]), {str(self.ids[3])})
+            self.assertIsNone(claim_task(self.collection, str(self.ids[0])))
+        task = self.collection.find_one({'_id': self.ids[0]})
+        self.assertEqual((task['status'], task['leaseOwner']), (1, 'node-a'))
+
+    def test_retry_waits_for_next_retry_at(self):
+        self.collection.update_one({'_id': self.ids[0]}, {'$set': {'nextRetryAt': datetime.now() + timedelta(minutes=5)}})
+        self.assertIsNone(claim_task(self.collection, str(self.ids[0])))
+        self.assertIsNotNone(claim_task(self.collection, str(self.ids[1])))
+
+    def test_expired_lease_can_be_claimed(self):
+        claim_tasks(self.collection, [str(self.ids[0])])
+        self.collection.update_one({'_id': self.ids[0]}, {'$set': {'leaseExpiresAt': datetime.now() - timedelta(seconds=1)}})
+        with self.as_node('node-b'):
+            task = claim_task(self.collection, str(self.ids[0]))
+        self.assertEqual(task['leaseOwner'], 'node-b')
+
+    def test_renew_only_tracked_tasks(self):
+        claim_tasks(self.collection, [str(task_id) for task_id in self.ids[:2]])
+        expired = datetime.now() - timedelta(seconds=1)
+        self.collection.update_many({}, {'$set': {'leaseExpiresAt': expired}})
+        self.assertEqual(renew_leases(self.collection, [str(self.ids[0])]), 1)
+        self.assertEqual(renew_leases(self.collection, []), 0)
+        self.assertGreater(self.collection.find_one({'_id': self.ids[0]})['leaseExpiresAt'], datetime.now())
+        # 未跟踪的任务租约自然过期, 可被其他节点领取
+        with self.as_node('node-b'):
+            self.assertIsNotNone(claim_task(self.collection, str(self.ids[1])))
+
+    def test_start_owned_skips_lost_tasks(self):
+        claim_tasks(self.collection, [str(task_id) for task_id in self.ids[:2]])
+        self.collection.update_one({'_id': self.ids[1]}, {'$set': {'leaseOwner': 'node-b'}})
+        owned = start_owned(self.collection, self.ids[:3], {'status': 2})
+        self.assertEqual(owned, [self.ids[0]])
+        self.assertEqual([task['status'] for task in self.collection.find(sort=[('_id', 1)])][:3], [2, 1, 0])
+
+    def test_release_only_own_tasks(self):
+        claim_tasks(self.collection, [str(task_id) for task_id in self.ids[:2]])
+        self.collection.update_one({'_id': self.ids[1]}, {'$set': {'leaseOwner': 'node-b'}})
+        self.assertEqual(release_tasks(self.collection, [str(task_id) for task_id in self.ids[:2]]), 1)
+        task = self.collection.find_one({'_id': self.ids[0]})
+        self.assertEqual((task['status'], task['leaseOwner'], task['leaseExpiresAt']), (0, *RELEASED.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
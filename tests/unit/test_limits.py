@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from app.tasks.task_manager import limits
+from app.tasks.task_manager.limits import OriginLimiter, allocate_bandwidth
+
+
+class AllocateBandwidthTestCase(unittest.TestCase):
+    def test_unlimited(self):
+        self.assertEqual(allocate_bandwidth(['a', 'b']), [0, 0])
+
+    def test_origin_budget_split_between_transfers(self):
+        self.assertEqual(allocate_bandwidth(['a', 'a', 'b'], origin_limits={'a': 100}), [50, 50, 0])
+
+    def test_global_budget_redistributes_unused_share(self):
+        """a 的预算只有 30, 剩余的总预算分给 b"""
+        self.assertEqual(allocate_bandwidth(['a', 'b', 'b'], 300, {'a': 30}), [30, 135, 135])
+        self.assertEqual(allocate_bandwidth(['a', 'b'], 100), [50, 50])
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, *args, **kwargs):
+        return list(self.docs)
+
+
+class TpsLimitTestCase(unittest.TestCase):
+    def test_tps_split_statically(self):
+        """先启动的传输也只分到一份, 同时运行的传输总和不超过 maxTps"""
+        limiter = OriginLimiter(collection=FakeCollection([
+            {'name': 'a', 'maxTps': 10, 'maxTransfers': 4},
+            {'name': 'b', 'maxTps': 12},
+        ]))
+
+        async def run():
+            async with limiter.transfer('a') as first, limiter.transfer('a') as second:
+                self.assertEqual((first.tps, second.tps), (2.5, 2.5))
+            with mock.patch.object(limits, 'get_max_workers', return_value=6):
+                async with limiter.transfer('b') as slot:
+                    self.assertEqual(slot.flags()[-2:], ['--tpslimit', '2'])
+            self.assertEqual(limiter.slots, [])
+        asyncio.run(run())
+
+
+class RcBandwidthTestCase(unittest.TestCase):
+    def test_process_rc_uses_random_port_and_auth(self):
+        limiter = OriginLimiter(collection=FakeCollection([{'name': 'a', 'bwLimit': 100}]))
+        slot = limiter.add_slot('a')
+        self.assertEqual(slot.flags(), ['--bwlimit', '100B', '--rc', '--rc-addr=127.0.0.1:0'])
+        self.assertEqual(slot.env()['RCLONE_RC_USER'], 'rclone-sync')
+        self.assertTrue(slot.env()['RCLONE_RC_PASS'])
+        self.assertFalse(slot.detect_rc_url('Copied (new)'))
+        self.assertTrue(slot.detect_rc_url('Serving remote control on http://127.0.0.1:41234/'))
+        self.assertEqual(slot.url, 'http://127.0.0.1:41234/')
+
+    def test_rcd_shares_global_budget(self):
+        """有单独限制的网盘不进入 rcd, rcd 中的传输共用总带宽分给它们的份额"""
+        limiter = OriginLimiter(collection=FakeCollection([{'name': 'a', 'maxTps': 5}, {'name': 'b'}]), global_bwlimit=300)
+        client = mock.Mock()
+        limited = limiter.add_slot('a', client)
+        self.assertIsNone(limited.rc_client)
+        self.assertTrue(limited.tps)
+        first = limiter.add_slot('b', client)
+        second = limiter.add_slot('b', client)
+        self.assertIs(first.rc_client, client)
+        self.assertEqual(client.call.call_args[0], ('core/bwlimit', {'rate': '200B'}))
+        limiter.remove_slot(second)
+        self.assertEqual(client.call.call_args[0], ('core/bwlimit', {'rate': '150B'}))
+        limiter.remove_slot(limited)
+        self.assertEqual(client.call.call_args[0], ('core/bwlimit', {'rate': '300B'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
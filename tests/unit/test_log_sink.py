@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+from app.tasks.task_manager import log_sink
+from app.tasks.task_manager.log_sink import TaskLogSink, append_task_logs, read_task_logs
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+@unittest.skipUnless(mongomock, '需要安装 mongomock')
+class TaskLogSinkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.task_logs
+        self.patcher = mock.patch.multiple(log_sink, _flush_lines=3, _flush_ms=1000, _chunk_lines=4, _max_chunks=2)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_flushes_when_buffer_reaches_threshold(self):
+        sink = TaskLogSink(self.collection, 't')
+        sink.write('a\nb\n\n')
+        self.assertEqual(self.collection.count_documents({}), 0)
+        sink.write('c')
+        self.assertEqual(read_task_logs(self.collection, 't'), (3, ['a', 'b', 'c']))
+
+    def test_flushes_after_interval(self):
+        with mock.patch.object(log_sink.time, 'monotonic', return_value=100):
+            sink = TaskLogSink(self.collection, 't')
+            sink.write('a')
+        self.assertEqual(self.collection.count_documents({}), 0)
+        with mock.patch.object(log_sink.time, 'monotonic', return_value=101):
+            sink.write('b')
+        self.assertEqual(read_task_logs(self.collection, 't'), (2, ['a', 'b']))
+
+    def test_flush_on_finish_fills_chunks_and_keeps_tail(self):
+        sink = TaskLogSink(self.collection, 't')
+        sink.write('1\n2')
+        sink.flush()
+        sink.write('3\n4\n5')
+        sink.write('6\n7')
+        sink.flush()
+        self.assertEqual(sink.buffer, [])
+        # 每块 4 行, 未满的分块继续追加
+        self.assertEqual([chunk['lines'] for chunk in self.collection.find()], [['1', '2', '3', '4'], ['5', '6', '7']])
+        # 超过 2 块后删除最早的分块, 只保留日志末尾
+        sink.write('8\n9\n10')
+        self.assertEqual(read_task_logs(self.collection, 't'), (6, ['5', '6', '7', '8', '9', '10']))
+        self.assertEqual(read_task_logs(self.collection, 't', tail=2), (6, ['9', '10']))
+
+    def test_append_task_logs_keeps_order(self):
+        append_task_logs(self.collection, {'t1': ['start'], 't2': []})
+        append_task_logs(self.collection, {'t1': ['done', 'ok'], 't2': ['failed']})
+        self.assertEqual(read_task_logs(self.collection, 't1'), (3, ['start', 'done', 'ok']))
+        self.assertEqual(read_task_logs(self.collection, 't2'), (1, ['failed']))
+        self.assertEqual(read_task_logs(self.collection, 't1', offset=1, limit=1), (3, ['done']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import io
+import json
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from app.tasks.task_manager import rclone_operator
+from app.tasks.task_manager.rc_client import RcError
+from app.tasks.task_manager.rclone_operator import iter_json_array, iter_lsjson, iter_origin_files, list_origin_tree
+
+
+class IterJsonArrayTestCase(unittest.TestCase):
+    def test_small_chunks(self):
+        """元素跨越多个读取块时仍能正确解析"""
+        items = [{'Path': f'dir/{i}.txt', 'Name': f'{i}.txt', 'Size': i, 'IsDir': False} for i in range(50)]
+        text = '[\n' + ',\n'.join(json.dumps(item) for item in items) + '\n]\n'
+        self.assertEqual(list(iter_json_array(io.StringIO(text), chunk_size=7)), items)
+
+    def test_empty_output(self):
+        self.assertEqual(list(iter_json_array(io.StringIO('[\n]\n'))), [])
+        self.assertEqual(list(iter_json_array(io.StringIO(''))), [])
+
+    def test_truncated_output(self):
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_json_array(io.StringIO('[{"Path": "a"},{"Pa'), chunk_size=4))
+
+
+class IterLsjsonTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patcher = mock.patch.dict(os.environ, {'PATH': self.tmp.name + os.pathsep + os.environ['PATH']})
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp.cleanup()
+
+    def fake_rclone(self, stdout, returncode=0):
+        path = os.path.join(self.tmp.name, 'rclone')
+        with open(path, 'w') as f:
+            f.write(f"#!/bin/sh\nprintf '%s' '{stdout}'\necho 'some error' >&2\nexit {returncode}\n")
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+    def test_streams_entries(self):
+        self.fake_rclone('[{"Path":"a.txt","Size":1},\n{"Path":"b.txt","Size":2}\n]\n')
+        self.assertEqual([e['Path'] for e in iter_lsjson(['o:dir'])], ['a.txt', 'b.txt'])
+
+    def test_missing_directory(self):
+        self.fake_rclone('', returncode=3)
+        self.assertEqual(list(iter_lsjson(['o:dir'], missing_ok=True)), [])
+        with self.assertRaises(Exception) as ctx:
+            list(iter_lsjson(['o:dir']))
+        self.assertIn('some error', str(ctx.exception))
+
+
+class RcListTestCase(unittest.TestCase):
+    def test_origin_files_through_rc(self):
+        client = mock.Mock()
+        client.call.return_value = {'list': [{'Path': 'a.txt', 'Size': 1}]}
+        with mock.patch.object(rclone_operator, 'get_rc_client', return_value=client):
+            files = list(iter_origin_files('o:', 3, 'md5', ['--filter', '- tmp/**', '--filter', '- **']))
+        self.assertEqual(files, [{'Path': 'a.txt', 'Size': 1}])
+        command, params = client.call.call_args[0]
+        self.assertEqual(command, 'operations/list')
+        self.assertEqual(params['fs'], 'o:')
+        self.assertEqual(params['opt'], {'recurse': True, 'filesOnly': True, 'noMimeType': True, 'showHash': True, 'hashTypes': ['md5']})
+        self.assertEqual(params['_config'], {'MaxDepth': 3})
+        self.assertEqual(params['_filter'], {'FilterRule': ['- tmp/**', '- **']})
+
+    def test_missing_tree_through_rc(self):
+        client = mock.Mock()
+        client.call.side_effect = RcError('rc 命令 operations/list 执行失败: directory not found')
+        with mock.patch.object(rclone_operator, 'get_rc_client', return_value=client):
+            self.assertEqual(list(list_origin_tree('o:backup')), [])
+            client.call.side_effect = RcError('rc 命令 operations/list 执行失败: permission denied')
+            with self.assertRaises(RcError):
+                list(list_origin_tree('o:backup'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app.tasks.task_manager import manifest as manifest_module
+from app.tasks.task_manager.filters import PathFilter
+from app.tasks.task_manager.manifest import FolderManifest
+
+
+class FolderManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, 'root')
+        os.makedirs(os.path.join(self.root, 'a', 'b', 'c'))
+        for path in ('x.txt', 'a/y.txt', 'a/b/z.txt', 'a/b/c/deep.txt', '.hidden'):
+            with open(os.path.join(self.root, path), 'w') as f:
+                f.write(path)
+        self.patcher = mock.patch.object(manifest_module, 'MANIFEST_DIR', os.path.join(self.tmp.name, 'manifests'))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp.cleanup()
+
+    def diff(self, manifest, **kwargs):
+        return sorted(manifest.diff(self.root, 2, PathFilter(), **kwargs))
+
+    def test_first_scan_reports_all_files_within_depth(self):
+        """首次扫描产出深度范围内的全部文件"""
+        changes = self.diff(FolderManifest('f'))
+        self.assertEqual([c[0] for c in changes], ['a/b/z.txt', 'a/y.txt', 'x.txt'])
+        self.assertFalse(any(c[2] for c in changes))
+
+    def test_rescan_reports_only_new_and_changed(self):
+        """保存后再次扫描只产出新增和变化的文件"""
+        manifest = FolderManifest('f')
+        self.diff(manifest)
+        manifest.save()
+
+        manifest = FolderManifest.load('f')
+        self.assertEqual(self.diff(manifest, full=False), [])
+
+        with open(os.path.join(self.root, 'a', 'new.txt'), 'w') as f:
+            f.write('new')
+        with open(os.path.join(self.root, 'x.txt'), 'a') as f:
+            f.write('changed')
+        changes = self.diff(manifest, full=True)
+        self.assertEqual([(c[0], c[2]) for c in changes], [('a/new.txt', False), ('x.txt', True)])
+
+    def test_excluded_directory_is_pruned_and_rule_change_invalidates_manifest(self):
+        """排除的目录不会被遍历; 规则变化后清单失效并重新完整扫描"""
+        path_filter = PathFilter(excludes=['b/'])
+        manifest = FolderManifest.load('f', path_filter.signature)
+        changes = sorted(manifest.diff(self.root, 2, path_filter))
+        self.assertEqual([c[0] for c in changes], ['a/y.txt', 'x.txt'])
+        self.assertNotIn(os.path.join('a', 'b'), manifest.dirs)
+        manifest.save()
+
+        self.assertEqual(FolderManifest.load('f', path_filter.signature).dirs, manifest.dirs)
+        self.assertEqual(FolderManifest.load('f', PathFilter().signature).dirs, {})
+
+    def test_target_change_invalidates_manifest(self):
+        """本地路径、远程路径或网盘变化后清单失效"""
+        target = [self.root, 'backup', 'o']
+        manifest = FolderManifest.load('f', target=target)
+        self.diff(manifest)
+        manifest.save()
+
+        self.assertEqual(FolderManifest.load('f', target=target).dirs, manifest.dirs)
+        self.assertEqual(FolderManifest.load('f', target=[self.root, 'other', 'o']).dirs, {})
+        self.assertEqual(FolderManifest.load('f', target=[self.root, 'backup', 'p']).dirs, {})
+        self.assertEqual(FolderManifest.load('f', target=[self.tmp.name, 'backup', 'o']).dirs, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
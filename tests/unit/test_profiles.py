@@ -0,0 +1,41 @@
+import unittest
+
+from app.tasks.task_manager.profiles import build_profile, get_size_class, next_level, profile_flags
+
+
+class TransferProfileTestCase(unittest.TestCase):
+    def test_size_class(self):
+        self.assertEqual(get_size_class(0), 'tiny')
+        self.assertEqual(get_size_class(2 << 20), 'small')
+        self.assertEqual(get_size_class(100 << 20), 'medium')
+        self.assertEqual(get_size_class(50 << 30), 'large')
+
+    def test_flags(self):
+        tiny = profile_flags(build_profile('tiny'))
+        # 小文件也要检查目标端, 重试时跳过已上传的文件
+        self.assertNotIn('--no-check-dest', tiny)
+        self.assertEqual(tiny[tiny.index('--multi-thread-streams') + 1], '0')
+        large = profile_flags(build_profile('large', 3, 'onedrive'), 'onedrive')
+        self.assertEqual(large[large.index('--multi-thread-streams') + 1], '16')
+        self.assertEqual(large[large.index('--onedrive-chunk-size') + 1], '60M')
+        # 不支持分块参数的后端不加分块参数
+        self.assertFalse([flag for flag in profile_flags(build_profile('large', 3, 'pcloud'), 'pcloud') if 'chunk' in flag])
+
+
+class NextLevelTestCase(unittest.TestCase):
+    def test_climbs_while_faster(self):
+        self.assertEqual(next_level(1, {}, min_gain_percent=10), 1)
+        self.assertEqual(next_level(1, {1: 100}, min_gain_percent=10), 2)
+        self.assertEqual(next_level(2, {1: 100, 2: 150}, min_gain_percent=10), 3)
+        self.assertEqual(next_level(3, {2: 150, 3: 200}, min_gain_percent=10), 3)
+
+    def test_backs_off_and_settles(self):
+        # 提升后变慢则退回, 退回后不再试探更慢的档位
+        self.assertEqual(next_level(2, {1: 100, 2: 90}, min_gain_percent=10), 1)
+        self.assertEqual(next_level(1, {1: 100, 2: 90}, min_gain_percent=10), 1)
+        # 提升收益不足时保持
+        self.assertEqual(next_level(2, {1: 100, 2: 105}, min_gain_percent=10), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from app.tasks.task_manager.rclone_operator import RcloneCommand, parse_eta, parse_size
+
+
+class ProgressParsingTestCase(unittest.TestCase):
+    def test_json_stats(self):
+        """JSON 日志中的 stats 转换为数值字段和展示字段"""
+        entry = RcloneCommand.parse_json_log(
+            '{"level":"notice","msg":"...","stats":{"bytes":1048576,"totalBytes":4194304,"speed":524288.0,"eta":6}}\n'
+        )
+        progress = RcloneCommand.parse_stats(entry['stats'])
+        self.assertEqual(progress['bytesDone'], 1048576)
+        self.assertEqual(progress['bytesTotal'], 4194304)
+        self.assertEqual(progress['speedBps'], 524288.0)
+        self.assertEqual(progress['etaSeconds'], 6)
+        self.assertEqual(progress['percent'], '25')
+        self.assertEqual(progress['speed'], '512.000 KiB/s')
+        self.assertIsNone(RcloneCommand.parse_stats({'bytes': 0, 'totalBytes': 0}))
+        self.assertIsNone(RcloneCommand.parse_json_log('Transferred: 1 B / 2 B'))
+
+    def test_text_progress_fallback(self):
+        progress = RcloneCommand.parse_rclone_progress('Transferred:   1.5 MiB / 10 MiB, 15%, 512 KiB/s, ETA 1m2s')
+        self.assertEqual(progress['speed'], '512 KiB/s')
+        self.assertEqual((progress['bytesDone'], progress['speedBps'], progress['etaSeconds']), (1572864, 524288, 62))
+
+    def test_parse_helpers(self):
+        self.assertEqual(parse_size('2 GiB'), 2 << 30)
+        self.assertEqual(parse_size('10'), 10)
+        self.assertIsNone(parse_size('1 XB'))
+        self.assertEqual(parse_eta('1d2h'), 93600)
+        self.assertIsNone(parse_eta('-'))
+
+
+if __name__ == '__main__':
+    unittest.main()
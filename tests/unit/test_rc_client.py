@@ -0,0 +1,92 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from app.tasks.task_manager import rclone_operator
+from app.tasks.task_manager.rc_client import RcClient, RcError, split_fs_path
+
+
+class FakeRcHandler(BaseHTTPRequestHandler):
+    """模拟 rclone rcd 的 rc 接口"""
+
+    def do_POST(self):
+        command = self.path.strip('/')
+        params = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'{}')
+        self.server.calls.append((command, params))
+        status, body = 200, {}
+        if command == 'rc/noop':
+            body = params
+        elif command == 'operations/copyfile':
+            body = {'jobid': 7}
+        elif command == 'job/status':
+            self.server.polls += 1
+            body = {'finished': self.server.polls >= 2, 'success': True, 'error': ''}
+        elif command == 'core/stats':
+            body = {'bytes': 512, 'totalBytes': 1024, 'speed': 256.0, 'eta': 2}
+        elif command == 'operations/stat':
+            body = {'item': {'Path': params['remote']} if params['remote'] == 'a.jpg' else None}
+        elif command == 'operations/size':
+            body = {'count': 3, 'bytes': 42, 'sizeless': 0}
+        else:
+            status, body = 404, {'error': f"couldn't find method \"{command}\""}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class RcClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeRcHandler)
+        self.server.calls = []
+        self.server.polls = 0
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        self.client = RcClient(f'http://127.0.0.1:{self.server.server_address[1]}')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_call_and_error(self):
+        self.assertTrue(self.client.ping())
+        with self.assertRaises(RcError) as ctx:
+            self.client.call('unknown/command')
+        self.assertIn("couldn't find method", str(ctx.exception))
+
+    def test_async_job_reports_stats_until_finished(self):
+        """异步任务轮询到结束, 每次轮询都回调该任务的统计"""
+        stats = []
+        job_id = self.client.start_job('operations/copyfile', {'srcFs': '/data', 'srcRemote': 'a.jpg'})
+        with mock.patch('app.tasks.task_manager.rc_client._rc_poll_ms', 1):
+            result = self.client.wait_job(job_id, stats.append)
+        self.assertTrue(result['success'])
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(self.server.calls[0][1]['_async'], True)
+        self.assertEqual(self.server.calls[-1], ('core/stats', {'group': 'job/7'}))
+        progress = rclone_operator.RcloneCommand.parse_stats(stats[0])
+        self.assertEqual(progress['percent'], '50')
+        self.assertEqual(progress['eta'], '2s')
+
+    def test_operations_use_rc_backend(self):
+        with mock.patch.object(rclone_operator, 'get_rc_client', return_value=self.client):
+            self.assertTrue(rclone_operator.check_file_exists('o:photos/a.jpg'))
+            self.assertFalse(rclone_operator.check_file_exists('o:photos/b.jpg'))
+            self.assertEqual(json.loads(rclone_operator.get_origin_size('o'))['bytes'], 42)
+        self.assertIn(('operations/stat', {'fs': 'o:photos', 'remote': 'a.jpg'}), self.server.calls)
+
+    def test_split_fs_path(self):
+        self.assertEqual(split_fs_path('o:photos/a.jpg'), ('o:photos', 'a.jpg'))
+        self.assertEqual(split_fs_path('o:a.jpg'), ('o:', 'a.jpg'))
+        self.assertEqual(split_fs_path('/data/a.jpg'), ('/data', 'a.jpg'))
+        self.assertEqual(split_fs_path('/a.jpg'), ('/', 'a.jpg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
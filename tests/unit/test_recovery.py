@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from app.tasks.task_manager import recovery
+from app.tasks.task_manager.recovery import is_landed, parse_mod_time, reconcile_node_tasks
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.123456789Z')
+
+
+class ParseModTimeTestCase(unittest.TestCase):
+    def test_formats(self):
+        self.assertEqual(parse_mod_time('2024-01-02T03:04:05Z'), datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc).timestamp())
+        self.assertAlmostEqual(parse_mod_time('2024-01-02T11:04:05.500000001+08:00'), datetime(2024, 1, 2, 3, 4, 5, 500000, tzinfo=timezone.utc).timestamp())
+        self.assertIsNone(parse_mod_time('yesterday'))
+
+
+class ReconcileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'a.txt')
+        with open(self.path, 'w') as f:
+            f.write('hello')
+        self.mtime = os.stat(self.path).st_mtime
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_is_landed(self):
+        task = {'localPath': self.path, 'fileBytes': 5}
+        self.assertTrue(is_landed(task, {'Size': 5, 'ModTime': iso(self.mtime)}))
+        self.assertFalse(is_landed(task, {'Size': 4, 'ModTime': iso(self.mtime)}))
+        # 目标端比源文件旧, 是上一个版本
+        self.assertFalse(is_landed(task, {'Size': 5, 'ModTime': iso(self.mtime - 60)}))
+        self.assertFalse(is_landed(task, None))
+        # 远程来源只比较大小
+        self.assertTrue(is_landed({'localPath': 'src:a.txt', 'fileBytes': 5}, {'Size': 5}))
+
+    def test_lists_each_directory_once(self):
+        tasks = [
+            {'_id': 1, 'status': 2, 'origin': 'o', 'remotePath': '/backup/', 'fileName': 'a.txt', 'localPath': self.path, 'fileBytes': 5, 'folderId': 'f'},
+            {'_id': 2, 'status': 2, 'origin': 'o', 'remotePath': 'backup', 'fileName': 'b.txt', 'localPath': 'src:b.txt', 'fileBytes': 9, 'folderId': 'f'},
+            {'_id': 3, 'status': 1, 'origin': 'o', 'remotePath': 'other', 'fileName': 'c.txt', 'localPath': 'src:c.txt', 'fileBytes': 1, 'folderId': 'f'},
+        ]
+        collection, folders, logs = mock.Mock(), mock.Mock(), mock.Mock()
+        collection.find.return_value = tasks
+        list_dir = mock.Mock(return_value=[
+            {'Path': 'a.txt', 'Size': 5, 'ModTime': iso(self.mtime + 1)},
+            {'Path': 'b.txt', 'Size': 3, 'ModTime': iso(self.mtime)},
+        ])
+        with mock.patch.object(recovery, 'get_node_id', return_value='node'):
+            self.assertEqual(reconcile_node_tasks(collection, folders, logs, list_dir), (1, 2))
+        list_dir.assert_called_once_with('o:backup')
+        statuses = {op._filter['_id']: op._doc['$set']['status'] for op in collection.bulk_write.call_args[0][0]}
+        self.assertEqual(statuses, {1: 3, 2: 0, 3: 0})
+        folders.update_one.assert_called_once()
+
+    @unittest.skipUnless(mongomock, '需要安装 mongomock')
+    def test_includes_unowned_tasks(self):
+        collection = mongomock.MongoClient().db.tasks
+        collection.insert_many([
+            {'_id': 1, 'status': 2, 'leaseOwner': 'node'},
+            {'_id': 2, 'status': 2},
+            {'_id': 3, 'status': 1, 'leaseOwner': None},
+            {'_id': 4, 'status': 2, 'leaseOwner': 'other'},
+            {'_id': 5, 'status': 0},
+        ])
+        tasks = mock.Mock()
+        tasks.find.return_value = []
+        with mock.patch.object(recovery, 'get_node_id', return_value='node'):
+            reconcile_node_tasks(tasks, mock.Mock(), mock.Mock())
+        query = tasks.find.call_args[0][0]
+        # 字段缺失或为 None 的旧任务一并核对, 其他节点持有的任务不受影响
+        self.assertEqual(sorted(task['_id'] for task in collection.find(query)), [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from datetime import datetime, timedelta
+
+from app.tasks.task_manager import retry
+from app.tasks.task_manager.retry import PERMANENT, TRANSIENT, backoff_seconds, classify_failure, failure_fields
+
+
+class ClassifyFailureTestCase(unittest.TestCase):
+    def test_transient_messages(self):
+        self.assertEqual(classify_failure(1, ['HTTP error 429: Too Many Requests']), (TRANSIENT, '限流'))
+        self.assertEqual(classify_failure(1, ['read tcp: connection reset by peer']), (TRANSIENT, '网络错误'))
+        self.assertEqual(classify_failure(1, ['Error 503: Service Unavailable']), (TRANSIENT, '服务端错误'))
+
+    def test_permanent_messages_win(self):
+        # 存储空间不足即使伴随限流信息也不重试
+        kind, reason = classify_failure(5, ['googleapi: Error 403: storageQuotaExceeded', 'rate limit'])
+        self.assertEqual((kind, reason), (PERMANENT, '存储空间不足'))
+        self.assertEqual(classify_failure(1, ['open /data/a.txt: no such file or directory'])[0], PERMANENT)
+
+    def test_exit_codes(self):
+        self.assertEqual(classify_failure(2), (PERMANENT, '参数错误'))
+        self.assertEqual(classify_failure(5), (TRANSIENT, '临时错误'))
+        self.assertEqual(classify_failure(6), (TRANSIENT, '未知错误'))
+
+
+class FailureFieldsTestCase(unittest.TestCase):
+    def test_backoff_grows_and_is_capped(self):
+        for attempt, delay in [(1, 30), (2, 60), (3, 120)]:
+            self.assertTrue(delay / 2 <= backoff_seconds(attempt, base=30, cap=3600) <= delay)
+        self.assertLessEqual(backoff_seconds(20, base=30, cap=3600), 3600)
+
+    def test_transient_failure_is_requeued(self):
+        now = datetime(2024, 1, 1)
+        fields, will_retry = failure_fields(None, 5, ['timeout'], now=now)
+        self.assertTrue(will_retry)
+        self.assertEqual((fields['status'], fields['attempts'], fields['failureKind']), (0, 1, TRANSIENT))
+        self.assertTrue(now < fields['nextRetryAt'] <= now + timedelta(seconds=retry._retry_base_seconds))
+
+    def test_permanent_or_exhausted_failure_fails(self):
+        fields, will_retry = failure_fields(0, 3, ['directory not found'])
+        self.assertFalse(will_retry)
+        self.assertEqual((fields['status'], fields['nextRetryAt']), (4, None))
+        fields, will_retry = failure_fields(retry._retry_max_attempts, 5, ['timeout'])
+        self.assertFalse(will_retry)
+        self.assertEqual((fields['status'], fields['attempts']), (4, retry._retry_max_attempts + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
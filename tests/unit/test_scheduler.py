@@ -0,0 +1,83 @@
+import time
+import unittest
+
+from app.tasks.task_manager.limits import OriginLimiter
+from app.tasks.task_manager.scheduler import TaskScheduler
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, *args, **kwargs):
+        return list(self.docs)
+
+
+def drain(scheduler):
+    items = []
+    while scheduler.qsize():
+        entry = scheduler.get_nowait()
+        items.append(entry.item)
+    return items
+
+
+class TaskSchedulerTestCase(unittest.TestCase):
+    def fill(self, scheduler):
+        scheduler.put_task('big', size=1000, group='a')
+        scheduler.put_task('a1', size=1, group='a')
+        scheduler.put_task('a2', size=2, group='a')
+        scheduler.put_task('b1', size=5, group='b', priority=1)
+        scheduler.put_task('c1', size=3, group='c')
+
+    def test_fifo(self):
+        scheduler = TaskScheduler('fifo')
+        self.fill(scheduler)
+        self.assertEqual(drain(scheduler), ['big', 'a1', 'a2', 'b1', 'c1'])
+
+    def test_sjf(self):
+        scheduler = TaskScheduler('sjf')
+        self.fill(scheduler)
+        self.assertEqual(drain(scheduler), ['a1', 'a2', 'c1', 'b1', 'big'])
+
+    def test_fair_rotates_groups(self):
+        scheduler = TaskScheduler('fair')
+        self.fill(scheduler)
+        self.assertEqual(drain(scheduler), ['a1', 'b1', 'c1', 'a2', 'big'])
+
+    def test_priority_first(self):
+        scheduler = TaskScheduler('priority')
+        self.fill(scheduler)
+        self.assertEqual(drain(scheduler), ['b1', 'a1', 'c1', 'a2', 'big'])
+
+    def test_aging_and_control_items(self):
+        scheduler = TaskScheduler('sjf', aging_seconds=0.05)
+        self.fill(scheduler)
+        scheduler.put(None)
+        self.assertIsNone(scheduler.get_nowait())
+        time.sleep(0.06)
+        # 排队超时的任务按入队顺序取出, 已取出的任务不会重复
+        self.assertEqual(drain(scheduler), ['big', 'a1', 'a2', 'b1', 'c1'])
+
+    def test_skips_saturated_origin(self):
+        limiter = OriginLimiter(collection=FakeCollection([{'name': 'o1', 'maxTransfers': 1}]))
+        # 调度时使用已读取的网盘设置, 读取由上传进程在线程中完成
+        limiter.refresh()
+        scheduler = TaskScheduler('sjf', aging_seconds=0, limiter=limiter)
+        scheduler.put_task('o1-a', size=1, origin='o1')
+        scheduler.put_task('o1-b', size=2, origin='o1')
+        scheduler.put_task('o2-a', size=3, origin='o2')
+        self.assertEqual(scheduler.get_nowait().item, 'o1-a')
+        # o1 并发已满, 只能取出 o2 的任务
+        self.assertEqual(scheduler.qsize(), 1)
+        self.assertEqual(scheduler.get_nowait().item, 'o2-a')
+        self.assertEqual(scheduler.qsize(), 0)
+        scheduler.release('o1')
+        self.assertEqual(scheduler.get_nowait().item, 'o1-b')
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            TaskScheduler('lifo')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.tasks.task_manager import manager
+from app.tasks.task_manager.manager import TaskManager
+
+
+def candidate(name, remote_path='bk'):
+    return {'localPath': f'/data/{name}', 'remotePath': remote_path, 'fileName': name, 'fileBytes': 10}
+
+
+class BulkAddTasksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tasks = mock.Mock()
+        self.tasks.find.return_value = []
+        self.tasks.bulk_write.return_value = mock.Mock(upserted_count=0, modified_count=0)
+        self.task_manager = TaskManager.__new__(TaskManager)
+        self.task_manager.mongo_db = mock.Mock()
+        self.task_manager.mongo_db.get_collection.return_value = self.tasks
+        self.task_manager.batch_size = 2
+
+    def test_upsert_only_sets_on_insert(self):
+        """按唯一键 upsert, 已存在的任务不会被覆盖; 超过批大小时分批写入"""
+        self.tasks.bulk_write.return_value = mock.Mock(upserted_count=2)
+        docs = [{'localPath': f'/data/{i}', 'origin': 'o', 'remotePath': 'bk', 'status': 0} for i in range(3)]
+        self.assertEqual(self.task_manager.bulk_add_tasks(docs), 4)
+        self.assertEqual(self.tasks.bulk_write.call_count, 2)
+        operations = self.tasks.bulk_write.call_args_list[0][0][0]
+        self.assertEqual(self.tasks.bulk_write.call_args_list[0][1], {'ordered': False})
+        self.assertEqual(operations[0]._filter, {'localPath': '/data/0', 'origin': 'o', 'remotePath': 'bk'})
+        self.assertEqual(operations[0]._doc, {'$setOnInsert': docs[0]})
+        self.assertTrue(operations[0]._upsert)
+
+    def test_duplicate_key_errors_are_ignored(self):
+        """并发 upsert 的唯一索引冲突(11000)不算失败, 其余写入计入新增数量"""
+        self.tasks.bulk_write.side_effect = BulkWriteError({
+            'nUpserted': 1, 'writeErrors': [{'code': 11000, 'errmsg': 'duplicate key'}],
+        })
+        docs = [{'localPath': f'/data/{i}', 'origin': 'o', 'remotePath': 'bk'} for i in range(2)]
+        with mock.patch.object(TaskManager, 'log_error') as log_error:
+            self.assertEqual(self.task_manager.bulk_add_tasks(docs), 1)
+        log_error.assert_not_called()
+        self.tasks.bulk_write.side_effect = BulkWriteError({
+            'nUpserted': 0, 'writeErrors': [{'code': 11000, 'errmsg': 'duplicate key'}, {'code': 121, 'errmsg': 'validation failed'}],
+        })
+        with mock.patch.object(TaskManager, 'log_error') as log_error:
+            self.assertEqual(self.task_manager.bulk_add_tasks(docs), 0)
+        self.assertIn('validation failed', log_error.call_args[0][0])
+
+    def test_create_tasks_bulk_skips_existing(self):
+        """已存在和本批重复的候选文件跳过, 返回实际新增的数量"""
+        self.tasks.find.return_value = [{'localPath': '/data/c', 'remotePath': 'bk'}]
+        # 另一个节点同时写入了 b, 只新增 a
+        self.tasks.bulk_write.return_value = mock.Mock(upserted_count=1)
+        candidates = [candidate('a'), candidate('b'), candidate('a'), candidate('c')]
+        with mock.patch.object(manager, 'notify_new_tasks') as notify:
+            created = self.task_manager.create_tasks_bulk(candidates, 'o', str(ObjectId()), 'folder', check_destination=False)
+        self.assertEqual(created, 1)
+        notify.assert_called_once_with()
+        operations = self.tasks.bulk_write.call_args[0][0]
+        self.assertEqual([operation._filter['localPath'] for operation in operations], ['/data/a', '/data/b'])
+        self.assertEqual(operations[0]._doc['$setOnInsert']['status'], 0)
+
+    def test_create_tasks_bulk_without_new_tasks(self):
+        self.tasks.find.return_value = [{'localPath': '/data/a', 'remotePath': 'bk'}]
+        with mock.patch.object(manager, 'notify_new_tasks') as notify:
+            self.assertEqual(self.task_manager.create_tasks_bulk([candidate('a')], 'o', str(ObjectId()), 'folder', check_destination=False), 0)
+        self.tasks.bulk_write.assert_not_called()
+        notify.assert_not_called()
+
+
+class ScanConcurrencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.task_manager = TaskManager.__new__(TaskManager)
+        self.task_manager.folder_locks_lock = threading.Lock()
+        self.task_manager.origin_semaphores = {}
+        self.lock = threading.Lock()
+        self.running = {}
+        self.peak = {}
+
+    def fake_scan(self, folder, inventory=None):
+        origins = TaskManager.get_folder_origins(folder)
+        with self.lock:
+            for origin in origins:
+                self.running[origin] = self.running.get(origin, 0) + 1
+                self.peak[origin] = max(self.peak.get(origin, 0), self.running[origin])
+        time.sleep(0.02)
+        with self.lock:
+            for origin in origins:
+                self.running[origin] -= 1
+        return folder['_id']
+
+    def test_scan_folder_limited_per_origin(self):
+        """每个网盘同时检测的文件夹不超过上限, 远程文件夹同时占用来源和目标网盘"""
+        folders = [{'_id': i, 'origin': 'a', 'syncType': 'local'} for i in range(4)]
+        folders += [{'_id': 4 + i, 'origin': 'b', 'syncType': 'remote', 'originPath': 'a:src'} for i in range(2)]
+        folders += [{'_id': 6 + i, 'origin': 'c', 'syncType': 'local'} for i in range(3)]
+        with mock.patch.object(manager, '_scan_origin_concurrency', 2), \
+                mock.patch.object(TaskManager, 'scan_folder', side_effect=self.fake_scan), \
+                ThreadPoolExecutor(max_workers=len(folders)) as pool:
+            results = list(pool.map(self.task_manager.scan_folder_limited, folders))
+        self.assertEqual(results, list(range(len(folders))))
+        self.assertEqual(self.peak, {'a': 2, 'b': 2, 'c': 2})
+        # 信号量全部归还
+        for semaphore in self.task_manager.origin_semaphores.values():
+            self.assertTrue(all(semaphore.acquire(blocking=False) for _ in range(2)))
+
+    def test_scan_folder_limited_uses_shared_inventory(self):
+        inventory_cache = mock.Mock()
+        folder = {'_id': 1, 'origin': 'a', 'syncType': 'local', 'remotePath': 'bk'}
+        with mock.patch.object(TaskManager, 'scan_folder') as scan_folder:
+            self.task_manager.scan_folder_limited(folder, inventory_cache)
+        inventory_cache.lazy.assert_called_once_with('a', 'bk')
+        scan_folder.assert_called_once_with(folder, inventory_cache.lazy.return_value)
+
+    def test_interleave_by_origin(self):
+        folders = [{'_id': i, 'origin': origin} for i, origin in enumerate('aaabbc')]
+        ordered = TaskManager.interleave_by_origin(folders)
+        self.assertEqual([folder['_id'] for folder in ordered], [0, 3, 5, 1, 4, 2])
+        self.assertEqual(TaskManager.interleave_by_origin([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
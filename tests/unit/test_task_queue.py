@@ -0,0 +1,227 @@
+import asyncio
+import sys
+import unittest
+from collections import deque
+from unittest import mock
+
+from app.tasks.task_manager import queue
+from app.tasks.task_manager.limits import OriginLimiter
+from app.tasks.task_manager.rclone_operator import RcloneCommand
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+class FakeCollection:
+    def find(self, *args, **kwargs):
+        return []
+
+
+class FakeCursor(list):
+    def sort(self, *args):
+        return self
+
+    def limit(self, count):
+        return FakeCursor(self[:count])
+
+
+class FakeTasks:
+    def __init__(self, count):
+        self.docs = [{'_id': f'{i:03d}', 'origin': 'o1' if i % 2 else 'o2'} for i in range(count)]
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        origins = query.get('origin', {}).get('$nin', [])
+        return FakeCursor(doc for doc in self.docs if doc['origin'] not in origins and not doc.get('claimed'))
+
+    def claim(self, collection, task_ids):
+        for doc in self.docs:
+            if doc['_id'] in task_ids:
+                doc['claimed'] = True
+        return set(task_ids)
+
+
+class FakeCommand:
+    running = 0
+    peak = 0
+
+    def __init__(self, item):
+        self.item = item
+        self.speed_bps = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    async def run(self):
+        FakeCommand.running += 1
+        FakeCommand.peak = max(FakeCommand.peak, FakeCommand.running)
+        await asyncio.sleep(0.01)
+        FakeCommand.running -= 1
+        if self.item == 'bad':
+            raise RuntimeError('boom')
+        self.succeeded = 1
+
+
+class TaskQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        limiter = OriginLimiter(collection=FakeCollection())
+        with mock.patch.object(queue, 'get_origin_limiter', return_value=limiter), \
+                mock.patch.object(queue, 'get_node_id', return_value='node'), \
+                mock.patch.object(queue, 'Logger'):
+            self.task_queue = queue.TaskQueue(concurrency=3)
+        self.task_queue.trigger = mock.Mock()
+        FakeCommand.running = FakeCommand.peak = 0
+
+    def tearDown(self):
+        self.task_queue.loop.close()
+
+    def run_until_idle(self):
+        async def wait():
+            self.task_queue.start_transfers()
+            while self.task_queue.running:
+                await asyncio.sleep(0.005)
+        self.task_queue.loop.run_until_complete(wait())
+
+    def test_runs_all_tasks_within_concurrency(self):
+        for i in range(10):
+            self.task_queue.add_task(f't{i}', size=i, origin='o')
+        self.task_queue.add_task('bad', origin='o')
+        release = mock.Mock()
+        with mock.patch.object(queue.TaskQueue, 'create_command', FakeCommand), \
+                mock.patch.object(queue, 'release_tasks', release), mock.patch.object(queue, 'mongo_db'):
+            self.run_until_idle()
+        # 执行出错的任务立即交还租约, 结束的任务不再续约
+        self.assertEqual(release.call_args[0][1], ['bad'])
+        self.assertEqual(self.task_queue.leased, set())
+        self.assertEqual(FakeCommand.peak, 3)
+        self.assertEqual(self.task_queue.queue.qsize(), 0)
+        # 执行出错的任务不影响其他任务, 网盘并发计数全部释放
+        self.assertEqual(self.task_queue.sample()['finished'], 10)
+        self.assertEqual(self.task_queue.queue.limiter.active, {})
+
+    def test_set_concurrency_starts_waiting_tasks(self):
+        self.task_queue.concurrency = 0
+        for i in range(4):
+            self.task_queue.add_task(f't{i}')
+        with mock.patch.object(queue.TaskQueue, 'create_command', FakeCommand):
+            self.task_queue.start_transfers()
+            self.assertEqual(self.task_queue.running, {})
+            self.task_queue.set_concurrency(4)
+            self.assertEqual(len(self.task_queue.running), 4)
+            self.run_until_idle()
+        self.assertEqual(FakeCommand.peak, 4)
+
+    def enqueue(self):
+        self.task_queue.loop.run_until_complete(self.task_queue.enqueue_pending_tasks())
+
+    def test_prefetch_window(self):
+        tasks = FakeTasks(20)
+        fake_db = mock.Mock()
+        fake_db.get_collection.side_effect = lambda name: tasks if name == 'tasks' else FakeCollection()
+        self.task_queue.prefetch = 6
+        self.task_queue.concurrency = 0
+        self.task_queue.queue.policy = 'fifo'
+        with mock.patch.object(queue, 'mongo_db', fake_db), \
+                mock.patch.object(queue, 'claim_tasks', tasks.claim), \
+                mock.patch.object(queue, 'group_tasks', lambda items: [item['_id'] for item in items]):
+            self.enqueue()
+            self.assertEqual(self.task_queue.prefetched, {'o1': 3, 'o2': 3})
+            self.assertFalse(self.task_queue.exhausted)
+            # 窗口已满时不再查询数据库
+            self.enqueue()
+            self.assertEqual(len(tasks.queries), 1)
+            # o1 并发已满, 其排队任务不占窗口, 也不再领取 o1 的任务
+            self.task_queue.queue.limiter.settings = {'o1': {'maxTransfers': 1}}
+            self.task_queue.queue.limiter.loaded_at = float('inf')
+            self.task_queue.queue.limiter.acquire('o1')
+            self.enqueue()
+            self.assertEqual(tasks.queries[-1]['origin'], {'$nin': ['o1']})
+            self.assertEqual(self.task_queue.prefetched, {'o1': 3, 'o2': 6})
+        self.assertEqual(self.task_queue.queue.qsize(), 6)
+
+    @unittest.skipUnless(mongomock, '需要安装 mongomock')
+    def test_claim_follows_policy(self):
+        db = mongomock.MongoClient().db
+        db.folders.insert_many([{'_id': 'a', 'priority': 0}, {'_id': 'b', 'priority': 0}, {'_id': 'c', 'priority': 5}])
+        # 文件夹 a 先积压了大量任务
+        db.tasks.insert_many(
+            [{'_id': f'a{i}', 'folderId': 'a', 'fileBytes': 10 - i} for i in range(6)]
+            + [{'_id': 'b0', 'folderId': 'b', 'fileBytes': 1}, {'_id': 'c0', 'folderId': 'c', 'fileBytes': 100}, {'_id': 'n0'}]
+        )
+
+        def claim(policy, room):
+            self.task_queue.queue.policy = policy
+            with mock.patch.object(queue, 'mongo_db', db):
+                return [task['_id'] for task in self.task_queue.find_claimable(db.tasks, {}, room)]
+        self.assertEqual(claim('fifo', 3), ['a0', 'a1', 'a2'])
+        self.assertEqual(claim('sjf', 3), ['n0', 'b0', 'a5'])
+        # 各文件夹轮流领取, 文件夹内小文件优先
+        self.assertEqual(sorted(claim('fair', 4)), ['a5', 'b0', 'c0', 'n0'])
+        # 高优先级文件夹先领取, 同一优先级内轮转
+        priority = claim('priority', 5)
+        self.assertEqual(priority[0], 'c0')
+        self.assertEqual(sorted(priority[1:]), ['a4', 'a5', 'b0', 'n0'])
+
+    def test_dispatch_requests_are_merged(self):
+        calls = []
+
+        async def enqueue():
+            calls.append(1)
+            if len(calls) == 1:
+                # 分发期间的多次请求合并为结束后再分发一次
+                self.task_queue.dispatch()
+                self.task_queue.dispatch()
+            await asyncio.sleep(0)
+
+        async def wait():
+            self.task_queue.dispatch()
+            while self.task_queue.dispatching:
+                await asyncio.sleep(0.005)
+        with mock.patch.object(self.task_queue, 'enqueue_pending_tasks', enqueue):
+            self.task_queue.loop.run_until_complete(wait())
+        self.assertEqual(len(calls), 2)
+
+
+class ProgressWriterTestCase(unittest.TestCase):
+    def test_progress_is_coalesced(self):
+        """多次进度只在线程中写入最新的一次"""
+        command = RcloneCommand.__new__(RcloneCommand)
+        command.log_sink = mock.Mock()
+        command.log_sink.due.return_value = False
+        command.pending_progress = None
+        command.update_fields = mock.Mock()
+
+        async def run():
+            async with command.progress_writer():
+                for percent in range(1, 6):
+                    command.callback(RcloneCommand.parse_stats({'bytes': percent, 'totalBytes': 10, 'speed': 1}), 'line')
+        asyncio.run(run())
+        command.update_fields.assert_called_once()
+        self.assertEqual(command.update_fields.call_args[0][0]['progress'], '50')
+        self.assertEqual(command.log_sink.append.call_count, 5)
+
+
+class ExecuteTestCase(unittest.TestCase):
+    def test_reads_stdout_and_stderr_without_threads(self):
+        command = RcloneCommand.__new__(RcloneCommand)
+        command.error_lines = deque(maxlen=20)
+        command.log_sink = mock.Mock()
+        command.slot = None
+        script = (
+            'import sys\n'
+            'print(\'{"level": "info", "msg": "stats", "stats": {"bytes": 5, "totalBytes": 10, "speed": 2}}\', flush=True)\n'
+            'print("permission denied", file=sys.stderr, flush=True)\n'
+            'sys.exit(3)\n'
+        )
+        callback = mock.Mock()
+        with mock.patch.object(RcloneCommand, 'callback', callback), mock.patch.object(sys, 'stdout'), mock.patch.object(sys, 'stderr'):
+            returncode = asyncio.run(command.execute([sys.executable, '-c', script]))
+        self.assertEqual(returncode, 3)
+        self.assertEqual(callback.call_args[0][0]['percent'], '50')
+        self.assertEqual(list(command.error_lines), ['permission denied\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from app.tasks.task_manager import rclone_operator
+from app.tasks.task_manager.rclone_operator import RcloneCommand, supports_server_side_copy
+
+
+class SupportsServerSideCopyTestCase(unittest.TestCase):
+    def setUp(self):
+        features = {
+            'a': {'Features': {'Copy': True}},
+            'b': {'Features': {'Copy': True}},
+            'c': {'Features': {'Copy': False}},
+        }
+        types = {'a': 'drive', 'b': 'drive', 'c': 'drive', 's': 's3'}
+        self.patchers = [
+            mock.patch.dict(rclone_operator._origin_features, features),
+            mock.patch.dict(rclone_operator._origin_types, types),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_detection(self):
+        # 同一网盘只要求支持 Copy
+        self.assertTrue(supports_server_side_copy('a', 'a'))
+        # 不同网盘需为同一后端类型
+        self.assertTrue(supports_server_side_copy('b', 'a'))
+        self.assertFalse(supports_server_side_copy('s', 'a'))
+        # 目标后端不支持 Copy
+        self.assertFalse(supports_server_side_copy('a', 'c'))
+        self.assertFalse(supports_server_side_copy('c', 'c'))
+
+
+class TransferModeTestCase(unittest.TestCase):
+    def command(self, transfer_mode):
+        command = RcloneCommand.__new__(RcloneCommand)
+        command.task = {
+            'localPath': 'src:photos/a.jpg', 'origin': 'dst', 'remotePath': 'backup', 'fileName': 'a.jpg',
+            'transferMode': transfer_mode,
+        }
+        command.profile = {}
+        command.backend_type = None
+        return command
+
+    def test_flags_for_each_mode(self):
+        self.assertEqual(RcloneCommand.transfer_mode_flags('server-side'), ['--server-side-across-configs'])
+        self.assertEqual(RcloneCommand.transfer_mode_flags('stream'), ['--disable', 'Copy'])
+        self.assertEqual(RcloneCommand.transfer_mode_flags('upload'), [])
+        self.assertEqual(RcloneCommand.transfer_mode_flags(None), [])
+
+    def test_rc_config_for_each_mode(self):
+        self.assertEqual(self.command('server-side').get_rc_params()['_config'], {'ServerSideAcrossConfigs': True})
+        self.assertEqual(self.command('stream').get_rc_params()['_config'], {'DisableFeatures': ['Copy']})
+        self.assertNotIn('_config', self.command('upload').get_rc_params())
+        # 显式传入的方式优先于任务记录
+        self.assertEqual(self.command('server-side').get_rc_params('stream')['_config'], {'DisableFeatures': ['Copy']})
+
+    def run_transfer(self, command, returncodes):
+        calls = []
+
+        async def transfer(transfer_mode=None):
+            calls.append(transfer_mode)
+            return returncodes[len(calls) - 1], ['rclone', transfer_mode]
+        command.start = mock.Mock(return_value=True)
+        command.transfer = transfer
+        command.update_fields = mock.Mock()
+        command.finish = mock.Mock()
+        asyncio.run(command.run_transfer())
+        return calls
+
+    def test_server_side_falls_back_to_stream(self):
+        command = self.command('server-side')
+        self.assertEqual(self.run_transfer(command, [1, 0]), [None, 'stream'])
+        fields = command.update_fields.call_args[0][0]
+        self.assertEqual(fields['transferMode'], 'stream')
+        command.finish.assert_called_once_with(0, ['rclone', 'stream'])
+
+    def test_no_fallback_for_success_or_other_modes(self):
+        command = self.command('server-side')
+        self.assertEqual(self.run_transfer(command, [0]), [None])
+        command.update_fields.assert_not_called()
+        command = self.command('upload')
+        self.assertEqual(self.run_transfer(command, [1]), [None])
+        command.finish.assert_called_once_with(1, ['rclone', None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from app.tasks.task_manager.walker import ScandirWalker
+
+
+def list_dir(rel_dir, abs_dir):
+    """测试用的 visit: 结果为目录下的文件名, 子目录按名称排序"""
+    files, subdirs = [], []
+    with os.scandir(abs_dir) as entries:
+        for entry in entries:
+            (subdirs if entry.is_dir() else files).append(entry.name)
+    return sorted(files), sorted(subdirs)
+
+
+class ScandirWalkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        # a/b/c/d 四层目录, 每层一个文件, 另有若干同级目录
+        for rel_dir in ['a/b/c/d', 'a/x', 'e/f', 'g']:
+            os.makedirs(os.path.join(self.root, rel_dir))
+        for rel_dir in ['', 'a', 'a/b', 'a/b/c', 'a/b/c/d', 'a/x', 'e', 'e/f', 'g']:
+            with open(os.path.join(self.root, rel_dir, 'file.txt'), 'w') as f:
+                f.write(rel_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def walk_old(self, max_depth):
+        """改写前按 os.walk + should_skip_path 遍历的目录: 相对根目录的层数不超过 max_depth"""
+        visited = set()
+        for root, _, _ in os.walk(self.root):
+            if root[len(self.root):].count(os.sep) > max_depth:
+                continue
+            rel_dir = os.path.relpath(root, self.root)
+            visited.add('' if rel_dir == '.' else rel_dir)
+        return visited
+
+    def test_depth_pruning_matches_old_walk(self):
+        for max_depth in range(5):
+            visited = []
+
+            def visit(rel_dir, abs_dir):
+                visited.append(rel_dir)
+                return list_dir(rel_dir, abs_dir)
+            walked = {rel_dir for rel_dir, _ in ScandirWalker(self.root, max_depth, visit, workers=1).walk()}
+            self.assertEqual(walked, self.walk_old(max_depth), max_depth)
+            # 超过深度的目录在进入前剪枝, 不会被列举
+            self.assertEqual(sorted(visited), sorted(walked))
+        self.assertEqual(self.walk_old(1), {'', 'a', 'e', 'g'})
+
+    def test_parallel_matches_single_thread(self):
+        threads = set()
+
+        def visit(rel_dir, abs_dir):
+            threads.add(threading.current_thread().name)
+            return list_dir(rel_dir, abs_dir)
+        single = sorted(ScandirWalker(self.root, 3, list_dir, workers=1).walk())
+        parallel = sorted(ScandirWalker(self.root, 3, visit, workers=4).walk())
+        self.assertEqual(parallel, single)
+        self.assertEqual(len(single), 8)
+        self.assertTrue(all(name.startswith('scandir') for name in threads))
+
+    def test_stop_early_shuts_down_pool(self):
+        walk = ScandirWalker(self.root, 3, list_dir, workers=4).walk()
+        self.assertEqual(next(walk)[0], '')
+        walk.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
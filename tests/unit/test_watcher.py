@@ -0,0 +1,74 @@
+import unittest
+from unittest import mock
+
+from app.tasks.task_manager import watcher
+from app.tasks.task_manager.watcher import FolderWatcher
+
+
+class FolderWatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.task_manager = mock.Mock()
+        with mock.patch.object(watcher, '_watch_enabled', False):
+            self.watcher = FolderWatcher(self.task_manager)
+        self.folders = {
+            'f': {'_id': 'f', 'name': 'photos', 'localPath': '/data/photos', 'excludes': ['node_modules']},
+            'g': {'_id': 'g', 'name': 'docs', 'localPath': '/data/docs'},
+        }
+        self.watcher.watches = {folder_id: (None, folder) for folder_id, folder in self.folders.items()}
+        self.now = 100.0
+        self.patcher = mock.patch.object(watcher.time, 'monotonic', lambda: self.now)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_quiet_period_debounce(self):
+        """未收到写入完成事件的文件在静默期内的每次事件都会推迟处理"""
+        self.watcher.touch('f', '/data/photos/a.jpg', closed=False)
+        self.now += watcher._quiet_ms / 1000 - 0.5
+        self.watcher.touch('f', '/data/photos/a.jpg', closed=False)
+        self.now += 1
+        self.assertEqual(self.watcher.take_ready()[0], {})
+        self.now += watcher._quiet_ms / 1000
+        self.assertEqual(self.watcher.take_ready()[0], {'f': ['/data/photos/a.jpg']})
+        self.assertEqual(self.watcher.pending, {})
+
+    def test_closed_is_ready_immediately(self):
+        self.watcher.touch('f', '/data/photos/a.jpg', closed=False)
+        self.watcher.touch('f', '/data/photos/a.jpg', closed=True)
+        # 之后的修改事件不会撤销写入完成的标记
+        self.watcher.touch('f', '/data/photos/a.jpg', closed=False)
+        self.watcher.touch('g', '/data/docs/b.txt', closed=True)
+        ready, overflowed, folders = self.watcher.take_ready()
+        self.assertEqual(ready, {'f': ['/data/photos/a.jpg'], 'g': ['/data/docs/b.txt']})
+        self.assertEqual(overflowed, set())
+        self.assertEqual(folders, self.folders)
+
+    def test_filter_and_unknown_folder_are_ignored(self):
+        self.watcher.touch('f', '/data/photos/node_modules/x.js', closed=True)
+        self.watcher.touch('missing', '/data/other/a.jpg', closed=True)
+        self.assertEqual(self.watcher.pending, {})
+        self.watcher.discard('/data/photos/none.jpg')
+        self.watcher.touch('f', '/data/photos/a.jpg', closed=True)
+        self.watcher.discard('/data/photos/a.jpg')
+        self.assertEqual(self.watcher.pending, {})
+
+    def test_overflow_falls_back_to_rescan(self):
+        """事件积压时丢弃触发文件夹的事件, 由扫描线程池完整扫描一次"""
+        with mock.patch.object(watcher, '_max_pending', 2):
+            self.watcher.touch('g', '/data/docs/b.txt', closed=True)
+            self.watcher.touch('f', '/data/photos/1.jpg', closed=True)
+            self.watcher.touch('f', '/data/photos/2.jpg', closed=True)
+            # 积压期间该文件夹的新事件直接忽略
+            self.watcher.touch('f', '/data/photos/3.jpg', closed=True)
+        self.assertEqual(list(self.watcher.pending), ['/data/docs/b.txt'])
+        self.watcher.flush()
+        self.task_manager.create_tasks_from_paths.assert_called_once_with(self.folders['g'], ['/data/docs/b.txt'])
+        self.task_manager.scan_pool.submit.assert_called_once_with(self.task_manager.scan_folder_limited, self.folders['f'])
+        # 提交扫描后恢复接收事件
+        self.watcher.touch('f', '/data/photos/4.jpg', closed=True)
+        self.assertIn('/data/photos/4.jpg', self.watcher.pending)
+
+
+if __name__ == '__main__':
+    unittest.main()